@@ -49,6 +49,9 @@
                     if(status == 6){
                         return '回收中'
                     }
+                    if(status == 9){
+                        return '停止中'
+                    }
                     return '已回收';
                 },
                 getRole:function(role_type){
@@ -117,12 +117,14 @@ class Component(object):
 
 def init_components():
     """Init hackathon factory"""
-    from hackathon.user import UserManager, UserProfileManager, OAuthLoginManager
+    from hackathon.user import UserManager, UserProfileManager, OAuthLoginManager, PresenceTracker
     from hackathon.hack import HackathonManager, AdminManager, TeamManager, DockerHostManager, \
-        RegisterManager, HackathonTemplateManager, Cryptor
+        RegisterManager, HackathonTemplateManager, Cryptor, RegistrationExporter
     from hackathon.template import TemplateLibrary
     from hackathon.remote.guacamole import GuacamoleInfo
     from hackathon.cache.cache_mgr import CacheManagerExt
+    from hackathon.cache.token_cache import TokenCache
+    from hackathon.notify import NotificationOutbox
 
     # dependencies MUST be provided in advance
     factory.provide("util", Utility)
@@ -133,9 +135,11 @@ def init_components():
     init_voice_verify()
     init_sms()
     factory.provide("email", Email)
+    factory.provide("notification_outbox", NotificationOutbox)
 
     # cache
     factory.provide("cache", CacheManagerExt)
+    factory.provide("token_cache", TokenCache())
 
     # scheduler
     factory.provide("scheduler", scheduler)
@@ -144,8 +148,10 @@ def init_components():
     factory.provide("user_manager", UserManager)
     factory.provide("user_profile_manager", UserProfileManager)
     factory.provide("oauth_login_manager", OAuthLoginManager)
+    factory.provide("presence", PresenceTracker)
     factory.provide("hackathon_manager", HackathonManager)
     factory.provide("register_manager", RegisterManager)
+    factory.provide("registration_exporter", RegistrationExporter)
     factory.provide("cryptor", Cryptor)
     factory.provide("docker_host_manager", DockerHostManager)
     factory.provide("hackathon_template_manager", HackathonTemplateManager)
@@ -161,23 +167,36 @@ def init_components():
     factory.provide("health_check_hosted_docker", get_class("hackathon.health.health_check.HostedDockerHealthCheck"))
     factory.provide("health_check_guacamole", get_class("hackathon.health.health_check.GuacamoleHealthCheck"))
     factory.provide("health_check_mongodb", get_class("hackathon.health.health_check.MongoDBHealthCheck"))
+    factory.provide("health_reporter", get_class("hackathon.health.HealthReporter"))
 
     # docker
     factory.provide("hosted_docker_proxy", get_class("hackathon.docker.hosted_docker.HostedDockerFormation"))
+    factory.provide("image_pull_planner", get_class("hackathon.docker.image_puller.ImagePullPlanner"))
 
     # storage
     init_hackathon_storage()
 
 
 def init_db():
-    from .hmongo import db
+    from .hmongo import db, query_profiler
+    from .hmongo.identity_map import init_identity_map
+    from .hmongo.profiler import init_query_profiler
     factory.provide("db", db, suspend_callable=True)
+    factory.provide("query_profiler", query_profiler, suspend_callable=True)
+    init_identity_map(app)
+    init_query_profiler(app, query_profiler)
 
 
 def init_expr_components():
     from .expr import ExprManager, K8SExprStarter
+    from .hk8s.readiness_watcher import K8SReadinessWatcher
+    from .hk8s.adapter_pool import K8SServiceAdapterPool
+    from .expr.warm_pool import WarmPoolController
     factory.provide("expr_manager", ExprManager)
+    factory.provide("warm_pool", WarmPoolController)
     factory.provide("k8s_service", K8SExprStarter)
+    factory.provide("k8s_adapter_pool", K8SServiceAdapterPool)
+    factory.provide("k8s_readiness_watcher", K8SReadinessWatcher)
 
 
 def init_voice_verify():
@@ -260,11 +279,42 @@ def __init_schedule_jobs():
 
         # schedule job to pre-create a docker host server VM
         # host_server_manager.schedule_pre_allocate_host_server_job()
-    # init the overtime-sessions detection to update users' online status
-    sche.add_interval(feature="user_manager",
-                      method="check_user_online_status",
-                      id="check_user_online_status",
-                      minutes=10)
+    # flush users' online status
+    sche.add_interval(feature="presence",
+                      method="advance",
+                      id="presence_advance",
+                      seconds=safe_get_config("presence.slot_seconds", 60))
+
+    # send emails, SMS and voice verifications enqueued
+    sche.add_interval(feature="notification_outbox",
+                      method="dispatch",
+                      id="notification_dispatch",
+                      seconds=safe_get_config("notification.interval_seconds", 10))
+
+    # tear down k8s resources of stopped experiments in batch
+    sche.add_interval(feature="k8s_service",
+                      method="schedule_teardown_k8s_services",
+                      id="schedule_teardown_k8s_services",
+                      seconds=safe_get_config("k8s.teardown.interval_seconds", 10))
+
+    # close k8s adapters of clusters that went quiet
+    sche.add_interval(feature="k8s_adapter_pool",
+                      method="evict_idle",
+                      id="k8s_adapter_pool_evict_idle",
+                      seconds=safe_get_config("k8s.adapter_pool.evict_interval_seconds", 60))
+
+    # schedule pulling docker images for online hackathons
+    sche.add_interval(feature="hosted_docker_proxy",
+                      method="ensure_images",
+                      id="ensure_images",
+                      next_run_time=util.get_now() + timedelta(seconds=10),
+                      seconds=safe_get_config("docker.pull.ensure_interval_seconds", 600))
+
+    # correct the drift of hackathon like/register counters
+    sche.add_interval(feature="hackathon_manager",
+                      method="reconcile_hackathon_stat",
+                      id="reconcile_hackathon_stat",
+                      minutes=30)
 
 
 def init_app():
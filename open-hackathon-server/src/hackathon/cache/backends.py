@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+This file is covered by the LICENSING file in the root of this project.
+"""
+
+import os
+import time
+import fcntl
+import pickle
+from threading import Lock, Thread
+from collections import OrderedDict
+from multiprocessing.managers import BaseManager
+
+__all__ = ["CacheBackend", "MemoryCacheBackend", "LocalSocketCacheBackend", "RedisCacheBackend"]
+
+
+class CacheBackend(object):
+    """Interface of a cache tier used by CacheManagerExt
+
+    A backend stores arbitrary picklable values with a ttl. Errors of remote backends are raised to the caller,
+    CacheManagerExt treats a failed tier as a miss so that cache outage never breaks a request.
+    """
+    name = "base"
+
+    def get(self, key):
+        """Get the value cached
+
+        :type key: str|unicode
+        :param key: the cache key
+
+        :rtype: tuple
+        :return (True, value) if cached and not expired, otherwise (False, None)
+        """
+        raise NotImplementedError()
+
+    def set(self, key, value, ttl):
+        """Cache a value
+
+        :type ttl: int|float
+        :param ttl: seconds the value lives
+        """
+        raise NotImplementedError()
+
+    def delete(self, key):
+        raise NotImplementedError()
+
+    def clear(self):
+        raise NotImplementedError()
+
+
+class LRUStore(object):
+    """Thread-safe LRU dict whose entries expire, shared by the memory tier and the local socket server"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.__entries = OrderedDict()  # key -> (expire_at, value), least recently used first
+        self.__lock = Lock()
+
+    def get(self, key):
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if entry is None or entry[0] < time.time():
+                return False, None
+            self.__entries[key] = entry
+            return True, entry[1]
+
+    def set(self, key, value, ttl):
+        with self.__lock:
+            self.__entries.pop(key, None)
+            self.__entries[key] = (time.time() + ttl, value)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def size(self):
+        with self.__lock:
+            return len(self.__entries)
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process LRU cache with ttl, shared by all threads of the process
+
+    Values are pickled like the other tiers do, so that every get returns a new copy which the caller can modify
+    without affecting other readers.
+    """
+    name = "memory"
+
+    def __init__(self, max_size=10000, max_ttl_seconds=None):
+        self.max_ttl_seconds = max_ttl_seconds
+        self.__store = LRUStore(max_size)
+
+    def get(self, key):
+        found, data = self.__store.get(key)
+        return (True, pickle.loads(data)) if found else (False, None)
+
+    def set(self, key, value, ttl):
+        # in front of shared tiers, the memory tier isn't invalidated by other processes, keep it short if configured so
+        if self.max_ttl_seconds:
+            ttl = min(ttl, self.max_ttl_seconds)
+        self.__store.set(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ttl)
+
+    def delete(self, key):
+        self.__store.delete(key)
+
+    def clear(self):
+        self.__store.clear()
+
+    def size(self):
+        return self.__store.size()
+
+
+class LocalSocketCacheBackend(CacheBackend):
+    """Cache shared by all processes of a node through a unix socket
+
+    The first process that finds no server listening on `address` serves an LRUStore from a daemon thread, the others
+    connect to it. Values are pickled by the client so that the server only keeps bytes. If the serving process exits,
+    the next call of other processes fails and one of them takes over the socket.
+    """
+    name = "local_socket"
+
+    def __init__(self, address="/tmp/open-hackathon-cache.sock", max_size=100000, authkey=b"open-hackathon"):
+        self.address = address
+        self.max_size = max_size
+        self.authkey = authkey
+        self.__store = None
+        self.__lock = Lock()
+
+    def get(self, key):
+        found, data = self.__call("get", key)
+        return (True, pickle.loads(data)) if found else (False, None)
+
+    def set(self, key, value, ttl):
+        self.__call("set", key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ttl)
+
+    def delete(self, key):
+        self.__call("delete", key)
+
+    def clear(self):
+        self.__call("clear")
+
+    def __call(self, method, *args):
+        store = self.__get_store()
+        try:
+            return getattr(store, method)(*args)
+        except (EOFError, IOError, OSError):
+            # server went away, reconnect (or take over) next time
+            with self.__lock:
+                if self.__store is store:
+                    self.__store = None
+            raise
+
+    def __get_store(self):
+        with self.__lock:
+            if self.__store is None:
+                self.__store = self.__connect_or_serve()
+            return self.__store
+
+    def __connect_or_serve(self):
+        # serialize connect-or-serve across processes so that only one of them binds the socket
+        with open(self.address + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                try:
+                    return self.__connect()
+                except (IOError, OSError):
+                    self.__serve()
+                    return self.__connect()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __connect(self):
+        client_class = type("CacheClientManager", (BaseManager,), {})
+        client_class.register("get_store")
+        manager = client_class(address=self.address, authkey=self.authkey)
+        manager.connect()
+        return manager.get_store()
+
+    def __serve(self):
+        if os.path.exists(self.address):
+            # left by a dead server
+            os.unlink(self.address)
+
+        store = LRUStore(self.max_size)
+        server_class = type("CacheServerManager", (BaseManager,), {})
+        server_class.register("get_store", callable=lambda: store)
+        server = server_class(address=self.address, authkey=self.authkey).get_server()
+        thread = Thread(target=server.serve_forever, name="local-cache-server")
+        thread.daemon = True
+        thread.start()
+
+
+class RedisCacheBackend(CacheBackend):
+    """Cache shared across nodes by a redis-compatible server
+
+    Requires the optional package `redis`. All keys are prefixed with `namespace` so that clear() only removes keys
+    of open hackathon.
+    """
+    name = "redis"
+
+    def __init__(self, url="redis://localhost:6379/0", namespace="open-hackathon:", socket_timeout=1):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("package 'redis' is required by the redis cache backend")
+
+        self.namespace = namespace
+        self.__client = redis.StrictRedis.from_url(url, socket_timeout=socket_timeout,
+                                                   socket_connect_timeout=socket_timeout)
+
+    def get(self, key):
+        data = self.__client.get(self.namespace + key)
+        return (True, pickle.loads(data)) if data is not None else (False, None)
+
+    def set(self, key, value, ttl):
+        self.__client.set(self.namespace + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                          px=max(int(ttl * 1000), 1))
+
+    def delete(self, key):
+        self.__client.delete(self.namespace + key)
+
+    def clear(self):
+        keys = list(self.__client.scan_iter(match=self.namespace + "*", count=1000))
+        for i in range(0, len(keys), 1000):
+            self.__client.delete(*keys[i:i + 1000])
@@ -3,17 +3,66 @@
 This file is covered by the LICENSING file in the root of this project.
 """
 
-from beaker.cache import CacheManager
-from beaker.util import parse_cache_config_options
+import math
+import time
+import random
+from threading import Lock, Event
+from concurrent.futures import ThreadPoolExecutor
 
 from hackathon import Component
+from hackathon.util import safe_get_config
+from .backends import MemoryCacheBackend, LocalSocketCacheBackend, RedisCacheBackend
 
 
 __all__ = ["CacheManagerExt"]
 
+BACKEND_CLASSES = dict((c.name, c) for c in [MemoryCacheBackend, LocalSocketCacheBackend, RedisCacheBackend])
+
+
+class CacheEntry(object):
+    """A cached value with the time it goes stale and the seconds taken to compute it"""
+    __slots__ = ["value", "expire_at", "delta"]
+
+    def __init__(self, value, expire_at, delta):
+        self.value = value
+        self.expire_at = expire_at
+        self.delta = delta
+
+    def __getstate__(self):
+        return self.value, self.expire_at, self.delta
+
+    def __setstate__(self, state):
+        self.value, self.expire_at, self.delta = state
+
+    def should_refresh(self, now, beta):
+        """Probabilistic early expiration: the closer to expire_at and the more expensive to compute, the more
+        likely a reader refreshes the entry ahead of time, so that a hot key is recomputed by one reader early
+        instead of by all readers at expire_at."""
+        return now - self.delta * beta * math.log(1.0 - random.random()) >= self.expire_at
+
+
+class Flight(object):
+    """A computation of createfunc in progress that readers of the same key wait for"""
+
+    def __init__(self):
+        self.event = Event()
+        self.value = None
+        self.error = None
+        self.invalidated = False
+
 
 class CacheManagerExt(Component):
-    """To cache resource"""
+    """To cache resource
+
+    Values are looked up in the tiers listed in "cache.backends" in order, e.g. ["memory", "local_socket", "redis"].
+    A hit in a lower tier is copied into the tiers above it, and a computed value is written to all tiers. The ttl of
+    a key is that of the longest prefix in "cache.ttl_seconds" that matches the key, "cache.default_ttl_seconds"
+    otherwise. A tier that fails is logged and treated as a miss.
+
+    To avoid cache stampede, only one thread of a process computes a missing key while others wait for its result.
+    An expired value is kept for "cache.stale_seconds" more and served while a background thread refreshes it, and
+    readers may refresh a key a bit before it expires, with a probability growing with the time it takes to compute.
+    """
     def get_cache(self, key, createfunc):
         """Get cached data of the returns of createfunc depending on the key.
         If key and createfunc exist in cache, returns the cached data,
@@ -33,8 +82,17 @@ class CacheManagerExt(Component):
             CacheManager.get_cache(key="abc", createfunc=func)
 
         """
-        results = self.tmpl_cache.get(key=key, createfunc=createfunc)
-        return results
+        found, entry = self.__get(key)
+        if found:
+            if entry.should_refresh(time.time(), self.early_expiry_beta):
+                self.__refresh_async(key, createfunc)
+                self.__count("stale_hits")
+            else:
+                self.__count("hits")
+            return entry.value
+
+        self.__count("misses")
+        return self.__load(key, createfunc)
 
     def invalidate(self, key):
         """remove the key-value pair in the cache
@@ -46,12 +104,12 @@ class CacheManagerExt(Component):
         :return: True if remove the key-value pair correctly, otherwise False
 
         """
-        try:
-            self.tmpl_cache.remove_value(key=key)
-            return True
-        except Exception as e:
-            self.log.error(e)
-            return False
+        with self.__lock:
+            flight = self.__flights.get(key)
+            if flight:
+                # don't let a computation started before invalidated write its result
+                flight.invalidated = True
+        return self.__apply_all("delete", key)
 
     def clear(self):
         """clear all the cache
@@ -59,27 +117,138 @@ class CacheManagerExt(Component):
         :rtype: bool
         :return: True if clear the cache correctly, otherwise False
         """
+        return self.__apply_all("clear")
+
+    def get_ttl(self, key):
+        """Return seconds that the value of key lives, per the longest matched prefix in "cache.ttl_seconds"
+
+        :type key: str|unicode
+        :param key: the cache key
+
+        :rtype: int
+        """
+        prefixes = [p for p in self.ttl_seconds if key.startswith(p)]
+        if prefixes:
+            return self.ttl_seconds[max(prefixes, key=len)]
+        return self.default_ttl_seconds
+
+    def stats(self):
+        """Return counters of get_cache
+
+        :rtype: dict
+        :return hits, stale hits(served while refreshing), misses, waits(for the computation of another thread) and
+            refreshes(computations in background)
+        """
+        with self.__lock:
+            return dict(self.__stats, in_flight=len(self.__flights))
+
+    def __load(self, key, createfunc):
+        with self.__lock:
+            flight = self.__flights.get(key)
+            if flight is None:
+                flight = self.__flights[key] = Flight()
+                leader = True
+            else:
+                self.__stats["waits"] += 1
+                leader = False
+
+        if leader:
+            self.__compute(key, createfunc, flight)
+        else:
+            flight.event.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def __refresh_async(self, key, createfunc):
+        with self.__lock:
+            if key in self.__flights:
+                return
+            flight = self.__flights[key] = Flight()
+            self.__stats["refreshes"] += 1
+
+        self.__executor.submit(self.__compute, key, createfunc, flight)
+
+    def __compute(self, key, createfunc, flight):
         try:
-            self.tmpl_cache.clear()
-            return True
+            start = time.time()
+            flight.value = createfunc()
+            now = time.time()
+            if not flight.invalidated:
+                ttl = self.get_ttl(key)
+                self.__set(key, CacheEntry(flight.value, now + ttl, now - start), ttl + self.stale_seconds)
         except Exception as e:
-            self.log.error(e)
-            return False
-
-    def __init__(self):
+            self.log.error("compute cache %s error: %s" % (key, e))
+            flight.error = e
+        finally:
+            with self.__lock:
+                self.__flights.pop(key, None)
+            flight.event.set()
+
+    def __count(self, name):
+        with self.__lock:
+            self.__stats[name] += 1
+
+    def __get(self, key):
+        for i, backend in enumerate(self.backends):
+            try:
+                found, entry = backend.get(key)
+            except Exception as e:
+                self.log.error("get %s from cache tier %s error: %s" % (key, backend.name, e))
+                continue
+
+            if found and isinstance(entry, CacheEntry):
+                # fill the faster tiers above for the rest of its life
+                remaining = entry.expire_at + self.stale_seconds - time.time()
+                if i > 0 and remaining > 0:
+                    self.__set(key, entry, remaining, self.backends[:i])
+                return True, entry
+
+        return False, None
+
+    def __set(self, key, value, ttl, backends=None):
+        for backend in (self.backends if backends is None else backends):
+            try:
+                backend.set(key, value, ttl)
+            except Exception as e:
+                self.log.error("set %s to cache tier %s error: %s" % (key, backend.name, e))
+
+    def __apply_all(self, method, *args):
+        succeeded = True
+        for backend in self.backends:
+            try:
+                getattr(backend, method)(*args)
+            except Exception as e:
+                self.log.error("%s of cache tier %s error: %s" % (method, backend.name, e))
+                succeeded = False
+        return succeeded
+
+    def __init__(self, backends=None):
         """initialize the class CacheManager
-        More configuration refer to http://beaker.readthedocs.org/en/latest/caching.html#about
+
+        :type backends: list
+        :param backends: instances of CacheBackend, built from "cache.backends" if not specified
         """
-        # store the basic configuration
-        self.cache_opts = {
-            'cache.type': 'memory',
-            # can be "memory" or "file"
-            'cache.data_dir': '/tmp/cache/data',
-            'cache.lock_dir': '/tmp/cache/lock'
-        }
-        # create CacheManager instance with cache_opts
-        self.cache = CacheManager(**parse_cache_config_options(self.cache_opts))
-        # In addition to the defaults supplied to the CacheManager instance,
-        # any of the Cache options can be changed on a per-namespace basis,
-        # by setting a type, and expire option.
-        self.tmpl_cache = self.cache.get_cache('mytemplate', type='file', expire=3600)
+        self.default_ttl_seconds = safe_get_config("cache.default_ttl_seconds", 3600)
+        self.ttl_seconds = safe_get_config("cache.ttl_seconds", {})
+        self.stale_seconds = safe_get_config("cache.stale_seconds", 60)
+        self.early_expiry_beta = safe_get_config("cache.early_expiry_beta", 1.0)
+        self.backends = backends if backends is not None else self.__create_backends()
+        self.__flights = {}  # key -> Flight
+        self.__stats = {"hits": 0, "stale_hits": 0, "misses": 0, "waits": 0, "refreshes": 0}
+        self.__lock = Lock()
+        self.__executor = ThreadPoolExecutor(max_workers=safe_get_config("cache.refresh_workers", 4))
+
+    @staticmethod
+    def __create_backends():
+        backends = []
+        names = safe_get_config("cache.backends", ["memory"])
+        for i, name in enumerate(names):
+            options = dict(safe_get_config("cache.%s" % name, {}))
+            if name == MemoryCacheBackend.name and i == len(names) - 1:
+                # max_ttl_seconds only keeps the memory tier in step with invalidations through the shared tiers
+                # behind it. As the last tier, it would expire values before their ttl
+                options.pop("max_ttl_seconds", None)
+            backends.append(BACKEND_CLASSES[name](**options))
+        return backends
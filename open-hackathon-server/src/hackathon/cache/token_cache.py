@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+This file is covered by the LICENSING file in the root of this project.
+"""
+
+from threading import Lock
+
+from cachetools import TTLCache
+
+from hackathon.util import safe_get_config, get_now
+from hackathon.constants import HEALTH, HEALTH_STATUS
+
+__all__ = ["TokenCache"]
+
+
+class TokenCache(object):
+    """In-process cache of validated API tokens
+
+    Maps a token to the raw document of its user so that an authenticated request doesn't have to query both
+    UserToken and User from DB. Entries live no longer than "cache.token.ttl_seconds" and never beyond the expiry of
+    the token itself. The cache is per process: logout and the writes of UserManager and UserProfileManager invalidate
+    the entries of current process immediately while other processes drop them after the ttl at the latest. Other
+    writes, e.g. online status by PresenceTracker, are seen after the ttl as well.
+
+    :Example:
+        token_cache = RequiredFeature("token_cache")
+
+        token_cache.set(user_token.token, user_token.user, user_token.expire_date)
+        user = token_cache.get(token)  # instance of User or None
+    """
+
+    def __init__(self, max_size=None, ttl_seconds=None):
+        self.max_size = max_size or safe_get_config("cache.token.max_size", 10000)
+        self.ttl_seconds = ttl_seconds or safe_get_config("cache.token.ttl_seconds", 60)
+        self.hits = 0
+        self.misses = 0
+        self.__cache = TTLCache(maxsize=self.max_size, ttl=self.ttl_seconds)
+        # user id -> tokens, so that invalidating a user doesn't scan the cache. Tokens dropped by the TTLCache itself
+        # stay in it till the user is invalidated or the index is rebuilt
+        self.__user_tokens = {}
+        self.__lock = Lock()
+
+    def get(self, token):
+        """Get the user related to token
+
+        :type token: str|unicode
+        :param token: the API token
+
+        :rtype: User
+        :return a new instance of User built from the cached document, or None if not cached or token expired
+        """
+        from hackathon.hmongo.models import User
+
+        with self.__lock:
+            entry = self.__cache.get(token)
+            if entry is not None and entry[1] < get_now():
+                self.__cache.pop(token, None)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        # build a new instance for every request so that modifications won't leak across threads
+        return User._from_son(entry[0])
+
+    def set(self, token, user, expire_date):
+        """Cache the user of a validated token
+
+        :type token: str|unicode
+        :param token: the API token
+
+        :type user: User
+        :param user: the user that owns the token
+
+        :type expire_date: datetime
+        :param expire_date: expiry of the token
+        """
+        user_id = str(user.id)
+        with self.__lock:
+            self.__cache[token] = (user.to_mongo(), expire_date)
+            if user_id not in self.__user_tokens and len(self.__user_tokens) >= 2 * self.max_size:
+                self.__rebuild_index()
+            self.__user_tokens.setdefault(user_id, set()).add(token)
+
+    def invalidate(self, token):
+        """Remove a token from cache, e.g. when user logout"""
+        with self.__lock:
+            entry = self.__cache.pop(token, None)
+            if entry is not None:
+                self.__user_tokens.get(str(entry[0].get("_id")), set()).discard(token)
+
+    def invalidate_user(self, user_id):
+        """Remove all tokens of a user from cache, e.g. when user's info updated"""
+        with self.__lock:
+            for t in self.__user_tokens.pop(str(user_id), ()):
+                self.__cache.pop(t, None)
+
+    def clear(self):
+        with self.__lock:
+            self.__cache.clear()
+            self.__user_tokens.clear()
+
+    def stats(self):
+        """Return counters of the cache
+
+        :rtype: dict
+        :return hits, misses, hit rate and current size of the cache
+        """
+        with self.__lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": float(self.hits) / total if total else 0.0,
+                "size": len(self.__cache),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds
+            }
+
+    def __rebuild_index(self):
+        # no more users than tokens are cached, so at least half of the index are left by tokens the TTLCache dropped.
+        # Rebuilt once per max_size new users at most
+        self.__user_tokens = {}
+        for token, entry in list(self.__cache.items()):
+            self.__user_tokens.setdefault(str(entry[0].get("_id")), set()).add(token)
+
+    def report_health(self):
+        """Report the counters as a health item so that they can be checked via /health?q=token_cache"""
+        report = self.stats()
+        report[HEALTH.STATUS] = HEALTH_STATUS.OK
+        return report
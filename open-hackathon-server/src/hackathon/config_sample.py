@@ -84,6 +84,128 @@ Config = {
         },
         "token_valid_time_minutes": 60
     },
+    "cache": {
+        # tiers of CacheManagerExt looked up in order: "memory", "local_socket" (shared by processes of a node) and
+        # "redis" (shared across nodes, requires package redis). Options of a tier are in the section of its name
+        "backends": ["memory"],
+        "memory": {
+            "max_size": 10000,
+            # other processes can't invalidate the memory tier, keep it short when shared tiers follow it. Ignored
+            # when memory is the last tier
+            "max_ttl_seconds": 60
+        },
+        "local_socket": {
+            "address": "/tmp/open-hackathon-cache.sock",
+            "max_size": 100000
+        },
+        "redis": {
+            "url": "redis://localhost:6379/0"
+        },
+        # ttl of a key is that of the longest matched prefix, default_ttl_seconds otherwise
+        "default_ttl_seconds": 3600,
+        "ttl_seconds": {
+            "hackathon_stat_": 300,
+            "hackathon_config_": 3600
+        },
+        # expired values are served for stale_seconds more while refreshed by one of refresh_workers. The larger
+        # early_expiry_beta is, the earlier hot keys are refreshed before they expire, 0 to disable
+        "stale_seconds": 60,
+        "early_expiry_beta": 1.0,
+        "refresh_workers": 4,
+        # per-process cache of validated tokens, entries expire in ttl_seconds or when the token expires
+        "token": {
+            "max_size": 10000,
+            "ttl_seconds": 60
+        }
+    },
+    "export": {
+        # registrations exported are fetched and written chunk_size at a time
+        "chunk_size": 1000
+    },
+    "template": {
+        # count of compiled k8s yaml templates cached
+        "compiled_cache_size": 256,
+        # bytes of parsed template contents cached, estimated by the length of yaml content
+        "content_cache_bytes": 16 * 1024 * 1024
+    },
+    "health": {
+        # reports are cached for ttl_seconds and refreshed in background
+        "ttl_seconds": 30,
+        # how long /health waits for items without any report yet
+        "deadline_seconds": 2,
+        # timeout of a single probe, e.g. pinging a docker host or requesting guacamole
+        "probe_timeout_seconds": 5,
+        "workers": 8
+    },
+    "notification": {
+        # the outbox is drained every interval_seconds, batch_size at a time by a pool of workers
+        "interval_seconds": 10,
+        "batch_size": 100,
+        "workers": 4,
+        # a notification not sent by a dispatcher in lease_seconds is sent again
+        "lease_seconds": 300,
+        # failed notifications are retried after backoff_seconds, doubled every attempt
+        "max_attempts": 5,
+        "backoff_seconds": 30,
+        "max_backoff_seconds": 3600,
+        # a notification is dropped if the same one was enqueued in the last dedup_seconds
+        "dedup_seconds": 3600
+    },
+    "docker": {
+        "pull": {
+            # images missing on docker hosts are pulled by at most max_concurrency threads, per_host_concurrency per host
+            "max_concurrency": 10,
+            "per_host_concurrency": 2,
+            # a pull fails if docker sends nothing for timeout_seconds
+            "timeout_seconds": 300,
+            # progress of a pull is saved every progress_interval_seconds, a pull not saved for stale_seconds is abandoned
+            "progress_interval_seconds": 5,
+            "stale_seconds": 900,
+            # pulls of online hackathons are scheduled, or unscheduled once ended, every ensure_interval_seconds
+            "ensure_interval_seconds": 600
+        }
+    },
+    "pagination": {
+        # estimated total of a filtered keyset pagination counts no more than count_limit
+        "count_limit": 10000
+    },
+    "profiler": {
+        # mongo commands are counted per request, requests slower or issuing more commands than below are logged
+        "enabled": True,
+        "slow_request_ms": 1000,
+        "slow_request_queries": 100,
+        "recent_slow_requests": 20
+    },
+    "presence": {
+        # users not active for timeout_seconds are set offline, activities are flushed to DB every slot_seconds
+        "timeout_seconds": 3600,
+        "slot_seconds": 60,
+        "batch_size": 1000
+    },
+    "warm_pool": {
+        # pre-allocated experiments kept per (hackathon, template) grow with the claims in the last window_seconds,
+        # enough for the claims expected in replenish_seconds, but no more than max_target
+        "window_seconds": 600,
+        "replenish_seconds": 300,
+        "max_target": 50
+    },
+    "k8s": {
+        # K8SServiceAdapter and its keep-alive connections are shared by all jobs of the same cluster namespace
+        "adapter_pool": {
+            "max_size": 32,
+            "idle_seconds": 600,
+            "connection_pool_maxsize": 16,
+            # idle adapters are closed every evict_interval_seconds even if no cluster is used
+            "evict_interval_seconds": 60
+        },
+        # max count of k8s resources being created at the same time, shared by all starting experiments
+        "create_concurrency": 8,
+        # stopped experiments are torn down in batch every interval_seconds, at most max_size of them each time
+        "teardown": {
+            "interval_seconds": 10,
+            "max_size": 1000
+        }
+    },
     "guacamole": {
         "host": "http://localhost:8080"
     },
@@ -122,6 +122,8 @@ class EStatus:
     ROLL_BACKING = 6
     ROLL_BACKED = 7
     UNEXPECTED_ERROR = 8
+    # waiting for resources torn down in batch. Not 4, which is shown as deleted by the client and used by old data
+    STOPPING = 9
 
 
 class VEStatus:
@@ -412,3 +414,53 @@ class K8S_DEPLOYMENT_STATUS:
     AVAILABLE = 1
     PAUSE = 2
     ERROR = 3
+
+
+class K8S_LABEL:
+    """labels attached to all k8s resources of an experiment"""
+    HACKATHON = "hacking.kaiyuanshe.cn/hackathon"
+    EXPERIMENT = "hacking.kaiyuanshe.cn/experiment"
+    VIRTUAL_ENVIRONMENT = "hacking.kaiyuanshe.cn/virtual_environment"
+
+
+class K8S_RESOURCE_KIND:
+    DEPLOYMENT = "deployment"
+    STATEFUL_SET = "statefulset"
+    SERVICE = "service"
+    PVC = "persistentvolumeclaim"
+
+
+class NOTIFICATION_CHANNEL:
+    """channels a notification of the outbox is sent through"""
+    EMAIL = "email"
+    SMS = "sms"
+    VOICE_VERIFY = "voice_verify"
+    ADMINS_EMAIL = "admins_email"  # an email to admins of a hackathon, expanded to EMAIL ones when dispatched
+
+
+class NOTIFICATION_STATUS:
+    """Status of a notification in the outbox
+
+    Attributes:
+        PENDING: waiting to be sent, at or after next_attempt_time
+        SENDING: claimed by a dispatcher till next_attempt_time, sent again if not done by then
+        SENT: sent successfully
+        FAILED: failed in all attempts
+    """
+    PENDING = 0
+    SENDING = 1
+    SENT = 2
+    FAILED = 3
+
+
+class IMAGE_PULL_STATUS:
+    """Status of pulling a docker image on a docker host
+
+    Attributes:
+        PULLING: being pulled, a record not updated for a while is taken as abandoned and pulled again
+        DONE: pulled successfully
+        FAILED: failed, pulled again in the next round
+    """
+    PULLING = 0
+    DONE = 1
+    FAILED = 2
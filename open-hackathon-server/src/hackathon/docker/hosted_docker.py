@@ -11,20 +11,13 @@ from threading import Lock
 import json
 import requests
 from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
 
 from hackathon import RequiredFeature, Component, Context
+from hackathon.util import safe_get_config
 from hackathon.hmongo.models import DockerContainer, DockerHostServer
 from hackathon.constants import HEALTH, HEALTH_STATUS, HACKATHON_CONFIG, CLOUD_PROVIDER
 
-import collections
-def flatten(x):
-    result = []
-    for el in x:
-        if isinstance(x, collections.Iterable) and not isinstance(el, str):
-            result.extend(flatten(el))
-        else:
-            result.append(el)
-    return result
 
 class HostedDockerFormation(Component):
     hackathon_template_manager = RequiredFeature("hackathon_template_manager")
@@ -49,11 +42,13 @@ class HostedDockerFormation(Component):
         """
         try:
             # TODO skip hackathons that are offline or ended
-            hosts = self.db.find_all_objects(DockerHostServer)
+            hosts = list(DockerHostServer.objects())
+            # ping all hosts at the same time so that dead hosts cost one timeout in total
+            timeout = safe_get_config("health.probe_timeout_seconds", 5)
             alive = 0
-            for host in hosts:
-                if self.ping(host):
-                    alive += 1
+            if hosts:
+                with ThreadPoolExecutor(max_workers=min(len(hosts), 16)) as executor:
+                    alive = sum(executor.map(lambda h: self.ping(h, timeout=timeout), hosts))
             if alive == len(hosts):
                 return {
                     HEALTH.STATUS: HEALTH_STATUS.OK
@@ -71,7 +66,7 @@ class HostedDockerFormation(Component):
         except Exception as e:
             return {
                 HEALTH.STATUS: HEALTH_STATUS.ERROR,
-                HEALTH.DESCRIPTION: e.message
+                HEALTH.DESCRIPTION: str(e)
             }
 
     def create_container(self, docker_host, container_config, container_name):
@@ -113,25 +108,55 @@ class HostedDockerFormation(Component):
         req = requests.delete(containers_url)
         return req
 
-    def pull_image(self, context):
-        # todo fix pull_image?
-        docker_host_id, image_name, tag = context.docker_host, context.image_name, context.tag
-        docker_host = self.db.find_first_object_by(DockerHostServer, id=docker_host_id)
-        if not docker_host:
-            return
-        pull_image_url = self.__get_vm_url(docker_host) + "/images/create?fromImage=" + image_name + '&tag=' + tag
-        self.log.debug(" send request to pull image:" + pull_image_url)
-        return requests.post(pull_image_url)
+    def pull_image(self, docker_host, image_name, tag, on_progress=None, timeout=60):
+        """Pull an image on docker host and wait till done
+
+        The progress docker streams back is passed to on_progress line by line.
+
+        :type docker_host: DockerHostServer
+        :param docker_host: the host to pull image on
 
-    def get_pulled_images(self, docker_host):
+        :type on_progress: function
+        :param on_progress: function that takes a dict of progress, e.g.
+            {"status": "Downloading", "id": "layer id", "progressDetail": {"current": 1, "total": 2}}
+
+        :type timeout: int
+        :param timeout: seconds to wait for connecting or for the next line of progress
+
+        :raise Exception if the pull fails
+        """
+        pull_image_url = "%s/images/create?fromImage=%s&tag=%s" % (self.__get_vm_url(docker_host), image_name, tag)
+        self.log.debug("send request to pull image: " + pull_image_url)
+        with requests.post(pull_image_url, stream=True, timeout=timeout) as resp:
+            resp.raise_for_status()
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                progress = json.loads(line)
+                if "error" in progress:
+                    raise Exception(progress["error"])
+                if on_progress:
+                    on_progress(progress)
+
+    def get_pulled_images(self, docker_host, timeout=20):
+        """Return tags of images on docker host, e.g. ["ubuntu:18.04"]
+
+        :rtype: list
+        """
         get_images_url = self.__get_vm_url(docker_host) + "/images/json?all=0"
-        current_images_info = json.loads(requests.get(get_images_url).content)  # [{},{},{}]
-        current_images_tags = [x['RepoTags'] for x in current_images_info]  # [[],[],[]]
-        return flatten(current_images_tags)  # [ imange:tag, image:tag ]
+        current_images_info = requests.get(get_images_url, timeout=timeout).json()  # [{},{},{}]
+        # RepoTags of dangling images is None
+        return [tag for x in current_images_info for tag in (x.get('RepoTags') or [])]
 
     def ensure_images(self):
+        """Schedule pulling images for online hackathons, and unschedule those ended, called by scheduler"""
         hackathons = self.hackathon_manager.get_online_hackathons()
-        list(map(lambda h: self.__ensure_images_for_hackathon(h), hackathons))
+        for hackathon in hackathons:
+            # one hackathon failing doesn't stop the others
+            try:
+                self.__ensure_images_for_hackathon(hackathon)
+            except Exception as e:
+                self.log.error("ensure images for hackathon %s fails: %s" % (hackathon.name, e))
 
     def is_container_running(self, docker_container):
         """check container's running status on docker host
@@ -167,7 +192,7 @@ class HostedDockerFormation(Component):
         try:
             ping_url = '%s/_ping' % self.__get_vm_url(docker_host)
             req = requests.get(ping_url, timeout=timeout)
-            return req.status_code == 200 and req.content == 'OK'
+            return req.status_code == 200 and req.text == 'OK'
         except Exception as e:
             self.log.error(e)
             return False
@@ -208,7 +233,8 @@ class HostedDockerFormation(Component):
     def __ensure_images_for_hackathon(self, hackathon):
         job_id = self.__get_schedule_job_id(hackathon)
         job_exist = self.scheduler.has_job(job_id)
-        if hackathon.event_end_time < self.util.get_now():
+        # a hackathon without end time never ends
+        if hackathon.event_end_time and hackathon.event_end_time < self.util.get_now():
             if job_exist:
                 self.scheduler.remove_job(job_id)
             return
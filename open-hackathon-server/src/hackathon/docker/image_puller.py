@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+This file is covered by the LICENSING file in the root of this project.
+"""
+
+import time
+from datetime import timedelta
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from mongoengine import Q, NotUniqueError
+
+from hackathon import Component, RequiredFeature
+from hackathon.util import get_now, safe_get_config
+from hackathon.constants import IMAGE_PULL_STATUS
+from hackathon.hmongo.models import DockerImagePull
+
+__all__ = ["ImagePullPlanner"]
+
+
+def _split_image(image):
+    """Split an image name into repository and tag, e.g. "registry:5000/ns/app" -> ("registry:5000/ns/app", "latest")
+
+    :rtype: tuple
+    """
+    if "@" in image:
+        return tuple(image.split("@", 1))
+    name, sep, tag = image.rpartition(":")
+    # the colon of "registry:5000/app" is of a port, not a tag
+    if sep and "/" not in tag:
+        return name, tag
+    return image, "latest"
+
+
+def _normalize_image(image):
+    """Return the name of image as listed in RepoTags of docker, e.g. "docker.io/library/ubuntu" -> "ubuntu:latest"
+    """
+    repository, tag = _split_image(image)
+    for prefix in ("docker.io/", "index.docker.io/", "library/"):
+        if repository.startswith(prefix):
+            repository = repository[len(prefix):]
+    return "%s:%s" % (repository, tag)
+
+
+class PullProgress(object):
+    """Percent of bytes downloaded of an image, computed from the progress docker streams per layer"""
+
+    def __init__(self):
+        self.layers = {}
+
+    def update(self, progress):
+        layer = progress.get("id")
+        detail = progress.get("progressDetail") or {}
+        if not layer:
+            return
+        if detail.get("total"):
+            self.layers[layer] = (detail.get("current", 0), detail["total"])
+        elif progress.get("status") in ("Download complete", "Pull complete", "Already exists") \
+                and layer in self.layers:
+            total = self.layers[layer][1]
+            self.layers[layer] = (total, total)
+
+    @property
+    def percent(self):
+        total = sum(t for c, t in list(self.layers.values()))
+        if total == 0:
+            return 0
+        return min(100, int(100 * sum(c for c, t in list(self.layers.values())) / total))
+
+
+class ImagePullPlanner(Component):
+    """Pull docker images missing on docker hosts in parallel
+
+    The images already pulled on all hosts are listed in one concurrent pass, then the (host, image) pairs missing are
+    pulled by a pool of "docker.pull.max_concurrency" threads, no more than "docker.pull.per_host_concurrency" of them
+    on a host at the same time. Progress and result of every pull are recorded in DockerImagePull, which also keeps two
+    rounds from pulling the same image on a host at the same time.
+
+    :Example:
+        planner = RequiredFeature("image_pull_planner")
+
+        planner.pull_images(hackathon, hosts, ["ubuntu:18.04", "openhackathon/ssh:latest"])
+    """
+
+    def __init__(self, docker=None, clock=get_now):
+        self.docker = docker or RequiredFeature("hosted_docker_proxy")
+        self.clock = clock
+        self.max_concurrency = safe_get_config("docker.pull.max_concurrency", 10)
+        self.per_host_concurrency = safe_get_config("docker.pull.per_host_concurrency", 2)
+        self.timeout_seconds = safe_get_config("docker.pull.timeout_seconds", 300)
+        self.progress_interval_seconds = safe_get_config("docker.pull.progress_interval_seconds", 5)
+        self.stale_seconds = safe_get_config("docker.pull.stale_seconds", 900)
+        # shared by all rounds so that the global limit holds when rounds of several hackathons overlap
+        self.__executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+
+    def pull_images(self, hackathon, hosts, images):
+        """Pull images missing on hosts and wait till all done
+
+        :type hackathon: Hackathon
+        :type hosts: list
+        :param hosts: list of DockerHostServer
+
+        :type images: list
+        :param images: names of image, tag defaults to "latest"
+
+        :rtype: dict
+        :return: count of pulls planned, done, failed and skipped because being pulled by another round
+        """
+        return self.execute(self.plan(hosts, images), hackathon)
+
+    def plan(self, hosts, images):
+        """Return (host, image) pairs to pull, with images of all hosts listed concurrently
+
+        A host whose images cannot be listed is left out of the plan, it's probably unreachable.
+
+        :rtype: list
+        """
+        images = list(dict((_normalize_image(i), i) for i in images).items())
+        if not hosts or not images:
+            return []
+
+        futures = [(host, self.__executor.submit(self.docker.get_pulled_images, host)) for host in hosts]
+        plan = []
+        for host, future in futures:
+            try:
+                pulled = set(_normalize_image(i) for i in future.result())
+            except Exception as e:
+                self.log.warn("cannot list images on docker host %s: %s" % (host.vm_name, e))
+                continue
+            missing = [image for normalized, image in images if normalized not in pulled]
+            self.log.debug("need to pull images: %s on host: %s" % (missing, host.vm_name))
+            plan.extend((host, image) for image in missing)
+        return plan
+
+    def execute(self, plan, hackathon=None):
+        """Run the pulls of a plan and wait till all done
+
+        Pulls of a host are queued and consumed by per_host_concurrency lanes. Lanes of different hosts are submitted
+        in turn, so that when the pool is full hosts still get pulled evenly instead of one after another.
+
+        :type plan: list
+        :param plan: (host, image) pairs returned by plan()
+
+        :rtype: dict
+        """
+        result = {"planned": len(plan), "done": 0, "failed": 0, "skipped": 0}
+        queues = {}
+        for host, image in plan:
+            queues.setdefault(host.id, (host, deque()))[1].append(image)
+
+        lanes = []
+        for host, images in list(queues.values()):
+            lanes.extend((i, host, images) for i in range(min(self.per_host_concurrency, len(images))))
+        # stable sort interleaves lanes of hosts: h1, h2, h3, h1, h2, ...
+        lanes.sort(key=lambda lane: lane[0])
+
+        futures = [self.__executor.submit(self.__run_lane, hackathon, host, images) for i, host, images in lanes]
+        for future in futures:
+            try:
+                for key, value in list(future.result().items()):
+                    result[key] += value
+            except Exception as e:
+                self.log.error(e)
+        return result
+
+    def __run_lane(self, hackathon, host, images):
+        counts = {"done": 0, "failed": 0, "skipped": 0}
+        while True:
+            try:
+                # deque.popleft is thread safe, lanes of a host share the queue
+                image = images.popleft()
+            except IndexError:
+                return counts
+            counts[self.__pull(hackathon, host, image)] += 1
+
+    def __pull(self, hackathon, host, image):
+        record = self.__claim(hackathon, host, image)
+        if record is None:
+            self.log.debug("image %s is being pulled on host %s already" % (image, host.vm_name))
+            return "skipped"
+
+        progress = PullProgress()
+        saved = [time.time()]
+
+        def on_progress(line):
+            progress.update(line)
+            if time.time() - saved[0] >= self.progress_interval_seconds:
+                saved[0] = time.time()
+                DockerImagePull.objects(id=record.id).update_one(set__progress=progress.percent,
+                                                                 set__update_time=self.clock())
+
+        repository, tag = _split_image(image)
+        self.log.debug("pulling image %s on host %s" % (image, host.vm_name))
+        try:
+            self.docker.pull_image(host, repository, tag, on_progress=on_progress, timeout=self.timeout_seconds)
+        except Exception as e:
+            self.log.warn("pull image %s on host %s fails: %s" % (image, host.vm_name, e))
+            self.__finish(record, IMAGE_PULL_STATUS.FAILED, progress.percent, str(e))
+            return "failed"
+
+        self.__finish(record, IMAGE_PULL_STATUS.DONE, 100)
+        return "done"
+
+    def __claim(self, hackathon, host, image):
+        """Mark the pull of image on host PULLING unless another round is pulling it
+
+        :rtype: DockerImagePull
+        :return: the record claimed, None if being pulled by another round
+        """
+        now = self.clock()
+        stale = now - timedelta(seconds=self.stale_seconds)
+        claimable = Q(host=host.id, image=image) & (Q(status__ne=IMAGE_PULL_STATUS.PULLING) | Q(update_time__lt=stale))
+        try:
+            # upsert inserts a record if none, and violates the unique index if a fresh PULLING one exists
+            return DockerImagePull.objects(claimable).modify(upsert=True,
+                                                              new=True,
+                                                              set__hackathon=hackathon,
+                                                              set__status=IMAGE_PULL_STATUS.PULLING,
+                                                              set__progress=0,
+                                                              set__start_time=now,
+                                                              set__update_time=now,
+                                                              unset__error=True,
+                                                              unset__end_time=True,
+                                                              set_on_insert__create_time=now)
+        except NotUniqueError:
+            return None
+
+    def __finish(self, record, status, progress, error=None):
+        now = self.clock()
+        updates = dict(set__status=status, set__progress=progress, set__end_time=now, set__update_time=now)
+        if error:
+            updates["set__error"] = error
+        DockerImagePull.objects(id=record.id).update_one(**updates)
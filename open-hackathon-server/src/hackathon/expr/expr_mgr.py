@@ -6,6 +6,7 @@ This file is covered by the LICENSING file in the root of this project.
 import sys
 
 sys.path.append("..")
+import time
 from datetime import timedelta
 
 from werkzeug.exceptions import PreconditionFailed, NotFound
@@ -14,7 +15,8 @@ from mongoengine import Q
 from hackathon import Component, RequiredFeature, Context
 from hackathon.constants import EStatus, VERemoteProvider, VE_PROVIDER, VEStatus, ReservedUser, \
     HACK_NOTICE_EVENT, HACK_NOTICE_CATEGORY, CLOUD_PROVIDER, HACKATHON_CONFIG
-from hackathon.hmongo.models import Experiment, User, Hackathon, UserHackathon, Template
+from hackathon.hmongo.models import Experiment, User, UserHackathon, Template
+from hackathon.hmongo.identity_map import prefetch
 from hackathon.hackathon_response import not_found, ok
 
 __all__ = ["ExprManager"]
@@ -26,6 +28,7 @@ class ExprManager(Component):
     admin_manager = RequiredFeature("admin_manager")
     template_library = RequiredFeature("template_library")
     hosted_docker_proxy = RequiredFeature("hosted_docker_proxy")
+    warm_pool = RequiredFeature("warm_pool")
 
     def start_expr(self, user, template_name, hackathon_name=None):
         """
@@ -45,6 +48,9 @@ class ExprManager(Component):
             if expr:
                 return self.__report_expr_status(expr)
 
+            if hackathon.config.get(HACKATHON_CONFIG.PRE_ALLOCATE_ENABLED, False):
+                self.warm_pool.record_miss(hackathon, template)
+
         # new expr
         return self.__start_new_expr(hackathon, template, user)
 
@@ -111,18 +117,23 @@ class ExprManager(Component):
         status = context.status if "status" in context else None
         page = int(context.page) if "page" in context else 1
         per_page = int(context.per_page) if "per_page" in context else 10
+        after = context.after if "after" in context else None
         users = User.objects(name=user_name).all() if user_name else []
 
         if user_name and status:
-            experiments_pagi = Experiment.objects(hackathon=hackathon, status=status, user__in=users).paginate(page,
-                                                                                                               per_page)
+            experiments_pagi = Experiment.objects(hackathon=hackathon, status=status, user__in=users).paginate(
+                page, per_page, after=after)
         elif user_name and not status:
-            experiments_pagi = Experiment.objects(hackathon=hackathon, user__in=users).paginate(page, per_page)
+            experiments_pagi = Experiment.objects(hackathon=hackathon, user__in=users).paginate(page, per_page,
+                                                                                               after=after)
         elif not user_name and status:
-            experiments_pagi = Experiment.objects(hackathon=hackathon, status=status).paginate(page, per_page)
+            experiments_pagi = Experiment.objects(hackathon=hackathon, status=status).paginate(page, per_page,
+                                                                                               after=after)
         else:
-            experiments_pagi = Experiment.objects(hackathon=hackathon).paginate(page, per_page)
+            experiments_pagi = Experiment.objects(hackathon=hackathon).paginate(page, per_page, after=after)
 
+        # users of the page are loaded in one query instead of one per experiment
+        prefetch(experiments_pagi.items, "user")
         return self.util.paginate(experiments_pagi, self.__get_expr_with_detail)
 
     def scheduler_recycle_expr(self):
@@ -148,38 +159,9 @@ class ExprManager(Component):
                 self.log.error(e)
 
     def pre_allocate_expr(self, context):
-        # TODO: too complex, not check
-        hackathon_id = context.hackathon_id
-        self.log.debug("executing pre_allocate_expr for hackathon %s " % hackathon_id)
-        hackathon = Hackathon.objects(id=hackathon_id).first()
-        hackathon_templates = hackathon.templates
-        for template in hackathon_templates:
-            try:
-                template = template
-                pre_num = int(hackathon.config.get(HACKATHON_CONFIG.PRE_ALLOCATE_NUMBER, 1))
-                query = Q(status=EStatus.STARTING) | Q(status=EStatus.RUNNING)
-                curr_num = Experiment.objects(user=None, hackathon=hackathon, template=template).filter(query).count()
-                self.log.debug("pre_alloc_exprs: pre_num is %d, curr_num is %d, remain_num is %d " %
-                               (pre_num, curr_num, pre_num - curr_num))
-
-                # TODO Should support VE_PROVIDER.K8S only in future after k8s Template is supported
-                # if template.provider == VE_PROVIDER.K8S:
-                if curr_num < pre_num:
-                    start_num = Experiment.objects(user=None, template=template, status=EStatus.STARTING).count()
-                    allowed_currency = int(hackathon.config.get(HACKATHON_CONFIG.PRE_ALLOCATE_CONCURRENT, 1))
-                    if start_num >= allowed_currency:
-                        self.log.debug(
-                            "there are already %d Experiments starting, will check later ... " % allowed_currency)
-                        return
-                    else:
-                        remain_num = min(allowed_currency, pre_num) - start_num
-                        self.log.debug(
-                            "no starting template: %s , remain num is %d ... " % (template.name, remain_num))
-                        self.start_pre_alloc_exprs(None, template.name, hackathon.name, remain_num)
-                        break
-            except Exception as e:
-                self.log.error(e)
-                self.log.error("check default experiment failed")
+        """Refill the warm pools of a hackathon, scheduled per hackathon by HackathonManager"""
+        self.log.debug("executing pre_allocate_expr for hackathon %s " % context.hackathon_id)
+        self.warm_pool.refill(context.hackathon_id)
 
     def assign_expr_to_admin(self, expr):
         """assign expr to admin to trun expr into pre_allocate_expr
@@ -382,11 +364,22 @@ class ExprManager(Component):
             return expr
 
         # try to assign pre-configured expr to user
-        expr = Experiment.objects(status=EStatus.RUNNING, hackathon=hackathon, template=template, user=None).first()
+        return self.claim_pre_alloc_expr(user, hackathon, template)
+
+    def claim_pre_alloc_expr(self, user, hackathon, template):
+        """Assign a pre-allocated experiment to user
+
+        Find and update in one round trip so that concurrent starters never get the same experiment
+
+        :rtype: Experiment
+        :return the experiment claimed, None if no pre-allocated one is ready
+        """
+        start = time.time()
+        expr = Experiment.objects(hackathon=hackathon, template=template, status=EStatus.RUNNING, user=None) \
+            .modify(new=True, set__user=user, set__claim_time=self.util.get_now())
         if expr:
-            expr.user = user
-            expr.save()
-            return expr
+            self.warm_pool.record_claim(hackathon, template, time.time() - start)
+        return expr
 
     def roll_back(self, expr_id):
         """
@@ -3,21 +3,37 @@
 This file is covered by the LICENSING file in the root of this project.
 """
 import yaml
-import time
 import string
 import random
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
+from hackathon import RequiredFeature
 from hackathon.expr.expr_starter import ExprStarter
 from hackathon.hmongo.models import K8sEnvironment
-from hackathon.hmongo.models import Hackathon, VirtualEnvironment, Experiment
+from hackathon.hmongo.models import Hackathon, VirtualEnvironment, Experiment, Template
 from hackathon.constants import (VE_PROVIDER, VERemoteProvider, VEStatus, EStatus)
 from hackathon.hackathon_response import internal_server_error
-from hackathon.constants import K8S_DEPLOYMENT_STATUS
+from hackathon.constants import K8S_LABEL, K8S_RESOURCE_KIND
+from hackathon.util import safe_get_config
 from hackathon.template.template_constants import K8S_UNIT
-from hackathon.hk8s.k8s_service_adapter import K8SServiceAdapter
+
+
+# seconds to wait for deployments and statefulsets of an experiment being available
+K8S_READY_TIMEOUT = 60 * 30
+
+# count of experiments torn down by one label selector, which is limited in length by k8s
+K8S_TEARDOWN_CHUNK_SIZE = 100
 
 
 class K8SExprStarter(ExprStarter):
+    readiness_watcher = RequiredFeature("k8s_readiness_watcher")
+    adapter_pool = RequiredFeature("k8s_adapter_pool")
+
+    def __init__(self):
+        # bounded pool shared by all experiments so that mass pre-allocation won't flood the api server
+        self.__executor = ThreadPoolExecutor(max_workers=safe_get_config("k8s.create_concurrency", 8))
+
     def _internal_start_expr(self, context):
         hackathon = Hackathon.objects.get(id=context.hackathon_id)
         experiment = Experiment.objects.get(id=context.experiment_id)
@@ -38,9 +54,9 @@ class K8SExprStarter(ExprStarter):
             if not _virtual_envs:
                 # Get None VirtualEnvironment, create new one:
                 labels = {
-                    "hacking.kaiyuanshe.cn/hackathon": str(hackathon.id),
-                    "hacking.kaiyuanshe.cn/experiment": str(experiment.id),
-                    "hacking.kaiyuanshe.cn/virtual_environment": _env_name,
+                    K8S_LABEL.HACKATHON: str(hackathon.id),
+                    K8S_LABEL.EXPERIMENT: str(experiment.id),
+                    K8S_LABEL.VIRTUAL_ENVIRONMENT: _env_name,
                 }
                 k8s_env = self.__create_useful_k8s_resource(_env_name, template_content, labels)
 
@@ -83,57 +99,147 @@ class K8SExprStarter(ExprStarter):
                                 id="schedule_setup_" + str(ctx.experiment_id), seconds=0)
 
     def __schedule_stop(self, ctx):
-        self.scheduler.add_once("k8s_service", "schedule_stop_k8s_service", context=ctx,
-                                id="schedule_stop_" + str(ctx.experiment_id), seconds=0)
+        # resources are torn down by the next run of schedule_teardown_k8s_services
+        self.readiness_watcher.cancel(str(ctx.experiment_id))
+        Experiment.objects(id=ctx.experiment_id).update_one(set__status=EStatus.STOPPING)
 
     def schedule_start_k8s_service(self, context):
         experiment = Experiment.objects.get(id=context.experiment_id)
         virtual_env = experiment.virtual_environments[0]
         k8s_resource = virtual_env.k8s_resource
-        adapter = self.__get_adapter_from_ctx(K8SServiceAdapter, context)
+        adapter = self.__get_adapter_from_ctx(context)
+        created = []
 
         try:
-            for pvc in k8s_resource.persistent_volume_claims:
-                adapter.create_k8s_pvc(pvc)
+            # parse every yaml once, the adapter takes the parsed dicts as they are
+            deployments = [yaml.load(d) for d in k8s_resource.deployments]
+            stateful_sets = [yaml.load(s) for s in k8s_resource.stateful_sets]
+
+            # PVCs first since they are mounted by pods of deployments and statefulsets
+            self.__create_k8s_resources(created, [
+                (K8S_RESOURCE_KIND.PVC, adapter.create_k8s_pvc, yaml.load(pvc))
+                for pvc in k8s_resource.persistent_volume_claims])
+
+            services = k8s_resource.services
+            results = self.__create_k8s_resources(
+                created,
+                [(K8S_RESOURCE_KIND.SERVICE, lambda y: adapter.create_k8s_service(y, detail=True), yaml.load(s))
+                 for s in services] +
+                [(K8S_RESOURCE_KIND.DEPLOYMENT, adapter.create_k8s_deployment, d) for d in deployments] +
+                [(K8S_RESOURCE_KIND.STATEFUL_SET, adapter.create_k8s_statefulset, s) for s in stateful_sets])
+
+            # overwrite service config with the public port allocated by K8s
+            for i in range(len(services)):
+                services[i] = yaml.dump(results[i])
+
+            # keep the services with public ports for configuring endpoint once ready
+            experiment.save()
+            self.readiness_watcher.watch(adapter, str(experiment.id),
+                                         [d['metadata']['name'] for d in deployments],
+                                         [s['metadata']['name'] for s in stateful_sets],
+                                         callback=self.__on_k8s_ready,
+                                         on_timeout=self.__on_k8s_timeout,
+                                         timeout=K8S_READY_TIMEOUT)
+        except Exception as e:
+            self.log.error("k8s_service_start_failed: {}".format(e))
+            self.__rollback_k8s_resources(adapter, created)
+            experiment.status = EStatus.FAILED
+            experiment.save()
 
-            for i, s in enumerate(k8s_resource.services):
-                svc_name = adapter.create_k8s_service(s)
-                # overwrite service config and get the public port from K8s
-                k8s_resource.services[i] = yaml.dump(adapter.get_service_by_name(svc_name))
+    def __create_k8s_resources(self, created, tasks):
+        """Create k8s resources concurrently
 
-            for d in k8s_resource.deployments:
-                adapter.create_k8s_deployment(d)
+        :type created: list
+        :param created: (kind, name) of resources created successfully are appended, for rollback
 
-            for s in k8s_resource.stateful_sets:
-                adapter.create_k8s_statefulset(s)
+        :type tasks: list
+        :param tasks: list of (kind, create function, parsed yaml)
 
-            self.__wait_for_k8s_ready(adapter, k8s_resource.deployments, k8s_resource.stateful_sets)
-            self.__config_endpoint(experiment, k8s_resource.services)
-        except Exception as e:
-            self.log.error("k8s_service_start_failed: {}".format(e))
+        :rtype: list
+        :return results of the create functions, in the order of tasks. The first error is raised after all tasks done
+        """
+        futures = [self.__executor.submit(func, y) for kind, func, y in tasks]
+
+        results = []
+        errors = []
+        for (kind, func, y), future in zip(tasks, futures):
+            try:
+                results.append(future.result())
+                created.append((kind, y['metadata']['name']))
+            except Exception as e:
+                errors.append(e)
+                results.append(None)
+
+        if errors:
+            raise errors[0]
+        return results
+
+    def __rollback_k8s_resources(self, adapter, created):
+        delete_funcs = {
+            K8S_RESOURCE_KIND.PVC: adapter.delete_k8s_pvc,
+            K8S_RESOURCE_KIND.SERVICE: adapter.delete_k8s_service,
+            K8S_RESOURCE_KIND.DEPLOYMENT: adapter.delete_k8s_deployment,
+            K8S_RESOURCE_KIND.STATEFUL_SET: adapter.delete_k8s_statefulset,
+        }
+        for kind, name in created:
+            try:
+                delete_funcs[kind](name)
+            except Exception as e:
+                self.log.error("rollback k8s {} {} failed: {}".format(kind, name, e))
+
+    def __on_k8s_ready(self, experiment_id):
+        experiment = Experiment.objects(id=experiment_id).first()
+        if not experiment:
+            self.log.debug("experiment %s is gone before k8s resources ready" % experiment_id)
+            return
+        self.__config_endpoint(experiment, experiment.virtual_environments[0].k8s_resource.services)
 
-    def schedule_stop_k8s_service(self, context):
-        experiment = Experiment.objects.get(id=context.experiment_id)
-        virtual_envs = experiment.virtual_environments
-        adapter = self.__get_adapter_from_ctx(K8SServiceAdapter, context)
-        try:
-            for virtual_env in virtual_envs:
-                for d in virtual_env.deployments:
-                    adapter.delete_k8s_deployment(d['metadata']['name'])
+    def __on_k8s_timeout(self, experiment_id):
+        self.log.error("k8s_service_start_failed: experiment %s not ready in %d seconds" % (experiment_id,
+                                                                                          K8S_READY_TIMEOUT))
+        Experiment.objects(id=experiment_id).update_one(set__status=EStatus.FAILED)
 
-                for pvc in virtual_env.persistent_volume_claims:
-                    adapter.delete_k8s_pvc(pvc['metadata']['name'])
+    def schedule_stop_k8s_service(self, context):
+        """Kept for stop jobs that were scheduled before teardown is done in batch"""
+        self.__schedule_stop(context)
 
-                for s in virtual_env.stateful_sets:
-                    adapter.delete_k8s_statefulset(s['metadata']['name'])
+    def schedule_teardown_k8s_services(self):
+        """Tear down k8s resources of all stopping experiments in batch
 
-                for s in virtual_env.services:
-                    adapter.delete_k8s_service(s['metadata']['name'])
+        Resources are deleted by the experiment label with one call per resource kind for each cluster, instead of one
+        call per resource. Experiments are deleted once their resources deleted, the failed ones are retried next time.
+        """
+        max_size = safe_get_config("k8s.teardown.max_size", 1000)
+        experiments = list(Experiment.objects(status=EStatus.STOPPING, virtual_environments__provider=VE_PROVIDER.K8S)
+                           .only("id", "template").no_dereference().limit(max_size))
+        if not experiments:
+            return
 
-            self.log.debug("k8s_service_stop: {}".format(context))
-        except Exception as e:
-            self.log.error("k8s_service_stop_failed: {}".format(e))
-        experiment.delete()
+        template_ids = set([e.template.id for e in experiments if e.template])
+        clusters = dict([(t.id, t.k8s_cluster) for t in Template.objects(id__in=template_ids).only("k8s_cluster")])
+
+        teardown = defaultdict(list)
+        done = []
+        for e in experiments:
+            cluster = clusters.get(e.template.id) if e.template else None
+            if cluster:
+                teardown[(cluster.api_url, cluster.token, cluster.namespace)].append(str(e.id))
+            else:
+                self.log.warn("k8s cluster of experiment %s not found, nothing to tear down" % e.id)
+                done.append(e.id)
+
+        for key, experiment_ids in list(teardown.items()):
+            adapter = self.adapter_pool.get(*key)
+            for i in range(0, len(experiment_ids), K8S_TEARDOWN_CHUNK_SIZE):
+                chunk = experiment_ids[i:i + K8S_TEARDOWN_CHUNK_SIZE]
+                try:
+                    adapter.delete_k8s_resources_by_label(K8S_LABEL.EXPERIMENT, chunk)
+                    done.extend(chunk)
+                except Exception as e:
+                    self.log.error("k8s_service_stop_failed: {}".format(e))
+
+        Experiment.objects(id__in=done).delete()
+        self.log.debug("k8s_service_stop: %d experiments torn down" % len(done))
 
     @staticmethod
     def __create_useful_k8s_resource(env_name, template_content, labels):
@@ -151,45 +257,30 @@ class K8SExprStarter(ExprStarter):
         :return:
         """
 
+        # rendered from the compiled template and its pre-parsed skeleton, the yaml isn't parsed again
+        resources = template_content.get_resources(env_name)
         k8s_env = K8sEnvironment(
             name=env_name,
             deployments=[
                 yaml.dump(TemplateRender(env_name, "deployment", d, labels).render())
-                for d in template_content.get_resource("deployment")
+                for d in resources.get("deployment", [])
             ],
             services=[
                 yaml.dump(TemplateRender(env_name, "service", s, labels).render())
-                for s in template_content.get_resource("service")
+                for s in resources.get("service", [])
             ],
-            statefulsets=[
+            stateful_sets=[
                 yaml.dump(TemplateRender(env_name, "statefulset", s, labels).render())
-                for s in template_content.get_resource("statefulset")
+                for s in resources.get("statefulset", [])
             ],
             persistent_volume_claims=[
                 yaml.dump(TemplateRender(env_name, "statefulset", p, labels).render())
-                for p in template_content.get_resource("persistentvolumeclaim")
+                for p in resources.get("persistentvolumeclaim", [])
             ],
         )
 
         return k8s_env
 
-    @staticmethod
-    def __wait_for_k8s_ready(adapter, deployments, stateful_sets):
-        # TODO Sleep for ready is NOT GOOD IDEA, Why not use watch api?
-        # Wait up to 30 minutes
-        end_time = int(time.time()) + 60 * 60 * 30
-
-        for d_yaml in deployments:
-            d = yaml.load(d_yaml)
-            while adapter.get_deployment_status(d['metadata']['name']) != K8S_DEPLOYMENT_STATUS.AVAILABLE:
-                time.sleep(1)
-                if int(time.time()) > end_time:
-                    raise RuntimeError("Start deployment error: Timeout")
-
-        for s in stateful_sets:
-            # TODO check statfulSet status
-            pass
-
     def __config_endpoint(self, expr, services):
         self.log.debug("experiment started %s successfully. Setting remote parameters." % expr.id)
         # set experiment status
@@ -235,11 +326,10 @@ class K8SExprStarter(ExprStarter):
         expr.status = EStatus.RUNNING
         expr.save()
 
-    @staticmethod
-    def __get_adapter_from_ctx(adapter_class, context):
+    def __get_adapter_from_ctx(self, context):
         template_content = context.template_content
         cluster = template_content.cluster_info
-        return adapter_class(cluster.api_url, cluster.token, cluster.namespace)
+        return self.adapter_pool.get(cluster.api_url, cluster.token, cluster.namespace)
 
 
 class TemplateRender:
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+This file is covered by the LICENSING file in the root of this project.
+"""
+
+import math
+from threading import Lock
+from datetime import timedelta
+
+from hackathon import Component, RequiredFeature
+from hackathon.util import safe_get_config
+from hackathon.constants import EStatus, HACKATHON_CONFIG, HEALTH, HEALTH_STATUS
+from hackathon.hmongo.models import Experiment, Hackathon
+
+__all__ = ["WarmPoolController"]
+
+
+class PoolMetrics(object):
+    def __init__(self):
+        self.target = 0
+        self.ready = 0
+        self.starting = 0
+        self.hits = 0
+        self.misses = 0
+        self.claim_latency_total = 0.0
+
+    def dic(self):
+        claims = self.hits + self.misses
+        return {
+            "target": self.target,
+            "ready": self.ready,
+            "starting": self.starting,
+            "hits": self.hits,
+            "misses": self.misses,
+            "miss_rate": float(self.misses) / claims if claims else 0.0,
+            "avg_claim_latency_ms": self.claim_latency_total * 1000 / self.hits if self.hits else 0.0
+        }
+
+
+class WarmPoolController(Component):
+    """Keep pre-allocated experiments ready for every (hackathon, template)
+
+    The target of a pool is HACKATHON_CONFIG.PRE_ALLOCATE_NUMBER at least, and grows with the count of experiments
+    claimed in the last "warm_pool.window_seconds" so that the pool can serve the claims expected before new ones
+    become ready, which takes about "warm_pool.replenish_seconds". Claims are read from Experiment.claim_time so that
+    all processes contribute to the rate.
+
+    Refill of all templates of a hackathon shares HACKATHON_CONFIG.PRE_ALLOCATE_CONCURRENT starting experiments at
+    most, handed out round-robin so that no template starves.
+
+    Pool depth, claim latency and miss rate are reported via /health?q=warm_pool
+    """
+    expr_manager = RequiredFeature("expr_manager")
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__metrics = {}  # "hackathon_name/template_name" -> PoolMetrics
+
+    def refill(self, hackathon_id):
+        """Start experiments for pools of hackathon that are below their targets
+
+        :type hackathon_id: str|unicode|ObjectId
+        :param hackathon_id: id of hackathon
+        """
+        hackathon = Hackathon.objects(id=hackathon_id).first()
+        if not hackathon or not hackathon.templates:
+            return
+
+        pool = self.__count_pool(hackathon)
+        claims = self.__count_recent_claims(hackathon)
+        budget = int(hackathon.config.get(HACKATHON_CONFIG.PRE_ALLOCATE_CONCURRENT, 1))
+        budget -= sum(n for (template_id, status), n in list(pool.items()) if status == EStatus.STARTING)
+
+        deficits = []
+        for template in hackathon.templates:
+            ready = pool.get((template.id, EStatus.RUNNING), 0)
+            starting = pool.get((template.id, EStatus.STARTING), 0)
+            target = self.get_target(hackathon, claims.get(template.id, 0))
+            with self.__lock:
+                metrics = self.__get_metrics(hackathon.name, template.name)
+                metrics.target, metrics.ready, metrics.starting = target, ready, starting
+            deficits.append([template, target - ready - starting, 0])
+
+        while budget > 0 and any(d[1] > d[2] for d in deficits):
+            for d in deficits:
+                if budget > 0 and d[1] > d[2]:
+                    d[2] += 1
+                    budget -= 1
+
+        for template, deficit, start_num in deficits:
+            if not start_num:
+                continue
+            self.log.debug("warm pool %s/%s: starting %d of %d missing" % (hackathon.name, template.name, start_num,
+                                                                          deficit))
+            try:
+                self.expr_manager.start_pre_alloc_exprs(None, template.name, hackathon.name, start_num)
+            except Exception as e:
+                self.log.error("warm pool %s/%s refill failed: %s" % (hackathon.name, template.name, e))
+
+    def get_target(self, hackathon, recent_claims):
+        """Return how many experiments should be kept ready
+
+        :type hackathon: Hackathon
+        :param hackathon: the hackathon
+
+        :type recent_claims: int
+        :param recent_claims: count of experiments claimed from the pool in the last window
+
+        :rtype: int
+        """
+        base = int(hackathon.config.get(HACKATHON_CONFIG.PRE_ALLOCATE_NUMBER, 1))
+        window = safe_get_config("warm_pool.window_seconds", 600)
+        replenish = safe_get_config("warm_pool.replenish_seconds", 300)
+        max_target = safe_get_config("warm_pool.max_target", 50)
+
+        expected = int(math.ceil(float(recent_claims) * replenish / window))
+        return max(base, min(expected, max_target))
+
+    def record_claim(self, hackathon, template, latency):
+        """Record that a user got a ready experiment from the pool
+
+        :type latency: float
+        :param latency: seconds taken by claiming
+        """
+        with self.__lock:
+            metrics = self.__get_metrics(hackathon.name, template.name)
+            metrics.hits += 1
+            metrics.claim_latency_total += latency
+
+    def record_miss(self, hackathon, template):
+        """Record that a user has to start a new experiment since the pool is empty"""
+        with self.__lock:
+            self.__get_metrics(hackathon.name, template.name).misses += 1
+
+    def stats(self):
+        with self.__lock:
+            return dict((k, m.dic()) for k, m in list(self.__metrics.items()))
+
+    def report_health(self):
+        report = self.stats()
+        report[HEALTH.STATUS] = HEALTH_STATUS.OK
+        return report
+
+    def __get_metrics(self, hackathon_name, template_name):
+        key = "%s/%s" % (hackathon_name, template_name)
+        if key not in self.__metrics:
+            self.__metrics[key] = PoolMetrics()
+        return self.__metrics[key]
+
+    @staticmethod
+    def __count_pool(hackathon):
+        """Count unclaimed experiments of all templates with one aggregation
+
+        :rtype: dict
+        :return {(template_id, status): count}
+        """
+        pipeline = [{"$group": {"_id": {"template": "$template", "status": "$status"}, "count": {"$sum": 1}}}]
+        experiments = Experiment.objects(hackathon=hackathon, user=None,
+                                         status__in=[EStatus.STARTING, EStatus.RUNNING])
+        return dict(((row["_id"]["template"], row["_id"]["status"]), row["count"])
+                    for row in experiments.aggregate(pipeline))
+
+    def __count_recent_claims(self, hackathon):
+        """Count experiments claimed from pools of hackathon in the last window
+
+        :rtype: dict
+        :return {template_id: count}
+        """
+        since = self.util.get_now() - timedelta(seconds=safe_get_config("warm_pool.window_seconds", 600))
+        pipeline = [{"$group": {"_id": "$template", "count": {"$sum": 1}}}]
+        experiments = Experiment.objects(hackathon=hackathon, claim_time__gte=since)
+        return dict((row["_id"], row["count"]) for row in experiments.aggregate(pipeline))
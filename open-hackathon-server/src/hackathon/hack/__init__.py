@@ -10,3 +10,4 @@ from hackathon.hack.host_server_manager import DockerHostManager
 from hackathon.hack.register_manager import RegisterManager
 from hackathon.hack.hackathon_template_manager import HackathonTemplateManager
 from hackathon.hack.cryptor import Cryptor
+from hackathon.hack.registration_export import RegistrationExporter
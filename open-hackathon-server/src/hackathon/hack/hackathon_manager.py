@@ -14,7 +14,8 @@ from werkzeug.exceptions import PreconditionFailed, InternalServerError, BadRequ
 from flask import g, request
 import lxml
 from lxml.html.clean import Cleaner
-from mongoengine import Q
+from mongoengine import Q, NotUniqueError
+from pymongo import UpdateOne
 
 from hackathon.hmongo.models import Hackathon, UserHackathon, DockerHostServer, User, HackathonNotice, HackathonStat, \
     Organization, Award, Team
@@ -98,7 +99,6 @@ class HackathonManager(Component):
         cache_key = "hackathon_stat_%s" % hackathon.id
         return self.cache.get_cache(key=cache_key, createfunc=internal_get_stat)
 
-    # TODO: implement HackathonStat related features: order_by == 'registered_users_num':
     def get_hackathon_list(self, args):
         # get values from request's QueryString
         page = int(args.get("page", 1))
@@ -111,7 +111,7 @@ class HackathonManager(Component):
         status_filter = Q()
         name_filter = Q()
         condition_filter = Q()
-        order_by_condition = '-id'
+        order_by_condition = ['-id']
 
         if status:
             status_filter = Q(status=status)
@@ -119,35 +119,24 @@ class HackathonManager(Component):
             name_filter = Q(name__contains=name)
 
         if order_by == 'create_time':  # 最新发布
-            order_by_condition = '-create_time'
+            order_by_condition = ['-create_time']
         elif order_by == 'event_start_time':  # 即将开始
-            order_by_condition = '-event_start_time'
+            order_by_condition = ['-event_start_time']
         elif order_by == 'registered_users_num':  # 人气热点
             # hackathons with zero registered users would not be shown.
-            hot_hackathon_stat = HackathonStat.objects(type=HACKATHON_STAT.REGISTER, count__gt=0).order_by('-count')
-            hot_hackathon_list = [stat.hackathon.id for stat in hot_hackathon_stat]
-            condition_filter = Q(id__in=hot_hackathon_list)
-        else:
-            order_by_condition = '-id'
+            condition_filter = Q(register_count__gt=0)
+            order_by_condition = ['-register_count', '-id']
 
         # perform db query with pagination
         pagination = Hackathon.objects(status_filter & name_filter & condition_filter).order_by(
-            order_by_condition).paginate(page,
-                                         per_page)
-
-        hackathon_list = pagination.items
-        hackathon_stat = HackathonStat.objects(hackathon__in=hackathon_list)
+            *order_by_condition).paginate(page,
+                                          per_page)
 
         user = None
-        user_hackathon = []
-        team = []
         if self.user_manager.validate_token():
             user = g.user
-            user_hackathon = UserHackathon.objects(user=user, hackathon__in=hackathon_list)
-            team = Team.objects(members__user=user, hackathon__in=hackathon_list)
 
-        def func(hackathon):
-            return self.__fill_hackathon_detail(hackathon, user, hackathon_stat, user_hackathon, team)
+        func = self.__get_hackathon_detail_filler(pagination.items, user)
 
         # return serializable items as well as total count
         return self.util.paginate(pagination, func)
@@ -337,24 +326,21 @@ class HackathonManager(Component):
                                            like=True,
                                            remark="")
             user_hackathon.save()
-        if not user_hackathon.like:
-            user_hackathon.like = True
-            user_hackathon.save()
+            liked = 1
+        else:
+            # only the request that really flips the flag counts, in case of concurrent clicks
+            liked = UserHackathon.objects(id=user_hackathon.id, like=False).update_one(set__like=True)
 
         # increase the count of users that like this hackathon
-        self.increase_hackathon_stat(hackathon, HACKATHON_STAT.LIKE, 1)
+        if liked:
+            self.increase_hackathon_stat(hackathon, HACKATHON_STAT.LIKE, 1)
 
         return ok()
 
     def unlike_hackathon(self, user, hackathon):
-        user_hackathon = UserHackathon.objects(user=user, hackathon=hackathon).first()
-        if user_hackathon:
-            user_hackathon.like = False
-            user_hackathon.save()
-
-        # sync the like count
-        like_count = UserHackathon.objects(hackathon=hackathon, like=True).count()
-        self.update_hackathon_stat(hackathon, HACKATHON_STAT.LIKE, like_count)
+        unliked = UserHackathon.objects(user=user, hackathon=hackathon, like=True).update(set__like=False)
+        if unliked:
+            self.increase_hackathon_stat(hackathon, HACKATHON_STAT.LIKE, -unliked)
         return ok()
 
     def update_hackathon_stat(self, hackathon, stat_type, count):
@@ -369,16 +355,8 @@ class HackathonManager(Component):
         :type count: int
         :param count: the new count for this stat item
         """
-        stat = HackathonStat.objects(hackathon=hackathon, type=stat_type).first()
-        if stat:
-            stat.count = count
-            stat.update_time = self.util.get_now()
-        else:
-            stat = HackathonStat(hackathon=hackathon, type=stat_type, count=count)
-
-        if stat.count < 0:
-            stat.count = 0
-        stat.save()
+        stat = self.__upsert_hackathon_stat(hackathon, stat_type, set__count=max(count, 0))
+        self.__sync_register_count(hackathon, stat, set__register_count=stat.count)
 
     def increase_hackathon_stat(self, hackathon, stat_type, increase):
         """Increase or descrease the count for certain hackathon stat
@@ -392,16 +370,86 @@ class HackathonManager(Component):
         :type increase: int
         :param increase: increase of the count. Can be positive or negative
         """
-        stat = HackathonStat.objects(hackathon=hackathon, type=stat_type).first()
-        if stat:
-            stat.count += increase
-        else:
-            stat = HackathonStat(hackathon=hackathon, type=stat_type, count=increase)
-
+        stat = self.__upsert_hackathon_stat(hackathon, stat_type, inc__count=increase)
         if stat.count < 0:
+            # never go below zero. Only reset a negative count so that concurrent increments are not overwritten
+            HackathonStat.objects(id=stat.id, count__lt=0).update_one(set__count=0)
             stat.count = 0
-        stat.update_time = self.util.get_now()
-        stat.save()
+        # apply the same delta rather than copying stat.count, which concurrent requests might write out of order
+        self.__sync_register_count(hackathon, stat, inc__register_count=increase)
+
+    def reconcile_hackathon_stat(self):
+        """Correct the drift of like and register stats against UserHackathon in bulk
+
+        Counters are maintained incrementally by increase_hackathon_stat, so they might drift when a request fails
+        halfway. This job recounts all hackathons by aggregation and rewrites the stats that differ with one bulk write.
+
+        :rtype: int
+        :return the count of stats corrected
+        """
+        expected = {}
+
+        def count_by_hackathon(stat_type, **condition):
+            pipeline = [{"$group": {"_id": "$hackathon", "count": {"$sum": 1}}}]
+            for row in UserHackathon.objects(**condition).aggregate(pipeline):
+                expected[(row["_id"], stat_type)] = row["count"]
+
+        count_by_hackathon(HACKATHON_STAT.LIKE, like=True)
+        count_by_hackathon(HACKATHON_STAT.REGISTER,
+                           role=HACK_USER_TYPE.COMPETITOR,
+                           status__in=[HACK_USER_STATUS.AUDIT_PASSED, HACK_USER_STATUS.AUTO_PASSED],
+                           deleted=False)
+
+        actual = {}
+        stats = HackathonStat.objects(type__in=[HACKATHON_STAT.LIKE, HACKATHON_STAT.REGISTER]) \
+            .only("hackathon", "type", "count").no_dereference()
+        for stat in stats:
+            actual[(stat.hackathon.id, stat.type)] = stat.count
+
+        now = self.util.get_now()
+        requests = []
+        register_changed = False
+        for key in set(expected) | set(actual):
+            count = expected.get(key, 0)
+            if actual.get(key) != count:
+                hackathon_id, stat_type = key
+                register_changed = register_changed or stat_type == HACKATHON_STAT.REGISTER
+                requests.append(UpdateOne(
+                    {"hackathon": hackathon_id, "type": stat_type},
+                    {"$set": {"count": count, "update_time": now},
+                     "$setOnInsert": {"_cls": HackathonStat._class_name, "create_time": now}},
+                    upsert=True))
+
+        if requests:
+            HackathonStat._get_collection().bulk_write(requests, ordered=False)
+            self.log.debug("%d hackathon stats reconciled" % len(requests))
+            if register_changed:
+                self.sync_hackathon_register_count()
+
+        return len(requests)
+
+    def sync_hackathon_register_count(self):
+        """Rebuild the denormalized Hackathon.register_count from HackathonStat
+
+        Needed once for hackathons created before register_count was introduced, and can be used to repair the
+        ranking of hot hackathons anytime.
+
+        :rtype: int
+        :return the count of hackathons updated
+        """
+        register_count = {}
+        for stat in HackathonStat.objects(type=HACKATHON_STAT.REGISTER).only("hackathon", "count").no_dereference():
+            register_count[stat.hackathon.id] = stat.count
+
+        updated = 0
+        for hackathon in Hackathon.objects().only("id", "register_count"):
+            count = register_count.get(hackathon.id, 0)
+            if hackathon.register_count != count:
+                Hackathon.objects(id=hackathon.id).update_one(set__register_count=count)
+                updated += 1
+
+        self.log.debug("register_count of %d hackathons synchronized" % updated)
+        return updated
 
     def get_distinct_tags(self):
         """Return all distinct hackathon tags for auto-complete usage"""
@@ -626,7 +674,9 @@ class HackathonManager(Component):
                 event: 'int[,int...]',                   // filter by event, default unfiltered
                 order_by: 'time' | 'event' | 'category', // order by update_time, event, category, default by time
                 page: int,                               // page number after pagination, start from 1, default 1
-                per_page: int                            // items per page, default 1000
+                per_page: int,                           // items per page, default 1000
+                after: string                            // next_cursor of the previous page for keyset pagination,
+                                                         // '' for the first page. page is ignored if specified
             }
 
         :return: json style text, see util.Utility
@@ -645,6 +695,7 @@ class HackathonManager(Component):
         order_by = body.get("order_by", "time")
         page = int(body.get("page", 1))
         per_page = int(body.get("per_page", 1000))
+        after = body.get("after")
 
         hackathon_filter = Q()
         category_filter = Q()
@@ -691,7 +742,7 @@ class HackathonManager(Component):
             hackathon_filter & category_filter & event_filter & user_filter & is_read_filter
         ).order_by(
             order_by_condition
-        ).paginate(page, per_page)
+        ).paginate(page, per_page, after=after)
 
         def func(hackathon_notice):
             return hackathon_notice.dic()
@@ -840,40 +891,93 @@ class HackathonManager(Component):
 
         return detail
 
-    def __fill_hackathon_detail(self, hackathon, user, hackathon_stat, user_hackathon, team):
-        """Return hackathon info as well as its details including configs, stat, organizers, like if user logon"""
-        detail = hackathon.dic()
+    def __upsert_hackathon_stat(self, hackathon, stat_type, **update):
+        """Update the stat of hackathon atomically, create it if not exist
 
-        detail["stat"] = {
-            "register": 0,
-            "like": 0}
+        :rtype: HackathonStat
+        :return the stat after updated
+        """
+        now = self.util.get_now()
+        query = HackathonStat.objects(hackathon=hackathon, type=stat_type)
+        try:
+            return query.modify(upsert=True, new=True, set__update_time=now, set_on_insert__create_time=now,
+                                **update)
+        except NotUniqueError:
+            # another request inserted the stat at the same time, now it exists and won't be upserted again
+            return query.modify(new=True, set__update_time=now, **update)
 
-        for stat in hackathon_stat:
-            if stat.type == HACKATHON_STAT.REGISTER and stat.hackathon.id == hackathon.id:
-                detail["stat"]["register"] = stat.count
-            elif stat.type == HACKATHON_STAT.LIKE and stat.hackathon.id == hackathon.id:
-                detail["stat"]["like"] = stat.count
+    def __sync_register_count(self, hackathon, stat, **update):
+        """Apply the update of register stat to hackathon so that hot hackathons can be ranked by an index
+
+        Drift left by failed requests is corrected by reconcile_hackathon_stat
+        """
+        if stat.type != HACKATHON_STAT.REGISTER:
+            return
 
+        Hackathon.objects(id=hackathon.id).update_one(**update)
+        if update.get("inc__register_count", 0) < 0:
+            # never go below zero, same as the stat
+            Hackathon.objects(id=hackathon.id, register_count__lt=0).update_one(set__register_count=0)
+        hackathon.register_count = stat.count
+
+    def __get_hackathon_detail_filler(self, hackathon_list, user):
+        """Load stat, registration and team of all hackathons in a page at once
+
+        Each kind of records is queried once without dereference and indexed by hackathon id, so that filling the
+        detail of each hackathon is a dict lookup instead of a scan over all records of the page.
+
+        :type hackathon_list: list
+        :param hackathon_list: hackathons in current page
+
+        :type user: User
+        :param user: the login user or None
+
+        :rtype: function
+        :return function that takes a hackathon and returns its detail in dict
+        """
+        stats = {}
+        for stat in HackathonStat.objects(hackathon__in=hackathon_list).only("hackathon", "type", "count") \
+                .no_dereference():
+            stats.setdefault(stat.hackathon.id, {})[stat.type] = stat.count
+
+        user_hackathons = {}
+        teams = {}
+        user_info = None
         if user:
-            detail['user'] = self.user_manager.user_display_info(user)
-            detail['user']['admin'] = user.is_super
-            if user_hackathon:
-                for uh in user_hackathon:
-                    if uh.hackathon.id == hackathon.id:
-                        detail['user']['admin'] = detail['user']['admin'] or (uh.role == HACK_USER_TYPE.ADMIN)
-
-                        if uh.like:
-                            detail['like'] = uh.like
-
-                        if uh.role == HACK_USER_TYPE.COMPETITOR:
-                            detail['registration'] = uh.dic()
-                            for t in team:
-                                if t.hackathon.id == hackathon.id:
-                                    detail['team'] = t.dic()
-                                    break
-                        break
+            user_info = self.user_manager.user_display_info(user)
+            for uh in UserHackathon.objects(user=user, hackathon__in=hackathon_list).no_dereference():
+                user_hackathons.setdefault(uh.hackathon.id, uh)
+            for t in Team.objects(members__user=user, hackathon__in=hackathon_list).no_dereference():
+                teams.setdefault(t.hackathon.id, t)
 
-        return detail
+        def fill_hackathon_detail(hackathon):
+            """Return hackathon info as well as its details including configs, stat, organizers, like if user logon"""
+            detail = hackathon.dic()
+
+            stat = stats.get(hackathon.id, {})
+            detail["stat"] = {
+                "register": stat.get(HACKATHON_STAT.REGISTER, 0),
+                "like": stat.get(HACKATHON_STAT.LIKE, 0)}
+
+            if user:
+                detail['user'] = dict(user_info)
+                detail['user']['admin'] = user.is_super
+                uh = user_hackathons.get(hackathon.id)
+                if uh:
+                    detail['user']['admin'] = detail['user']['admin'] or (uh.role == HACK_USER_TYPE.ADMIN)
+
+                    if uh.like:
+                        detail['like'] = uh.like
+
+                    if uh.role == HACK_USER_TYPE.COMPETITOR:
+                        detail['registration'] = uh.dic()
+                        t = teams.get(hackathon.id)
+                        if t:
+                            detail['team'] = t.dic()
+
+            return detail
+
+        return fill_hackathon_detail
 
     def __create_hackathon(self, creator, context):
         """Insert hackathon and creator(admin of course) to database
@@ -989,20 +1093,41 @@ class HackathonManager(Component):
         for item in stats:
             result[item.type] = item.count
 
-        reg_list = UserHackathon.objects(hackathon=hackathon,
-                                         role=HACK_USER_TYPE.COMPETITOR,
-                                         deleted=False,
-                                         status__in=[HACK_USER_STATUS.AUTO_PASSED, HACK_USER_STATUS.AUDIT_PASSED]
-                                         ).only("user").no_dereference().all()
-        reg_list = [uh.user.id for uh in reg_list]
-        reg_count = len(reg_list)
+        reg_count, online_count = self.__count_online_competitors(hackathon)
         if reg_count > 0:
-            online_count = User.objects(id__in=reg_list, online=True).count()
             result["online"] = online_count
             result["offline"] = reg_count - online_count
 
         return result
 
+    @staticmethod
+    def __count_online_competitors(hackathon):
+        """Count approved competitors and the online ones in DB with one aggregation
+
+        The online flag of each competitor is joined by `$lookup` on the _id index of user, so that neither the
+        registrations nor the user ids are transferred. Registrations whose user no longer exists count as offline.
+
+        :rtype: tuple
+        :return (count of approved competitors, count of them online)
+        """
+        pipeline = [
+            {"$project": {"user": 1}},
+            {"$lookup": {"from": User._get_collection_name(), "localField": "user", "foreignField": "_id",
+                         "as": "u"}},
+            {"$unwind": {"path": "$u", "preserveNullAndEmptyArrays": True}},
+            {"$group": {
+                "_id": None,
+                "register": {"$sum": 1},
+                "online": {"$sum": {"$cond": [{"$eq": ["$u.online", True]}, 1, 0]}}}}]
+
+        registrations = UserHackathon.objects(hackathon=hackathon,
+                                              role=HACK_USER_TYPE.COMPETITOR,
+                                              deleted=False,
+                                              status__in=[HACK_USER_STATUS.AUTO_PASSED, HACK_USER_STATUS.AUDIT_PASSED])
+        for row in registrations.aggregate(pipeline):
+            return row["register"], row["online"]
+        return 0, 0
+
     def __get_config_cache_key(self, hackathon):
         return "hackathon_config_%s" % hackathon.id
 
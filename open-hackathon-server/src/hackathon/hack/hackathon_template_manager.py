@@ -6,29 +6,15 @@ This file is covered by the LICENSING file in the root of this project.
 import sys
 
 sys.path.append("..")
-# from compiler.ast import flatten
-
 
 from flask import g
 
-from hackathon.hmongo.models import Template
+from hackathon.hmongo.models import Template, Hackathon, DockerHostServer
 
-from hackathon import Component, RequiredFeature, Context
-from hackathon.constants import VE_PROVIDER, TEMPLATE_STATUS, CLOUD_PROVIDER
+from hackathon import Component, RequiredFeature
+from hackathon.constants import VE_PROVIDER, TEMPLATE_STATUS
 from hackathon.hackathon_response import not_found, internal_server_error
 
-import collections
-def flatten(x):
-    result = []
-    for el in x:
-        if isinstance(x, collections.Iterable) and not isinstance(el, str):
-            result.extend(flatten(el))
-        else:
-            result.append(el)
-    return result
- 
-
-
 __all__ = ["HackathonTemplateManager"]
 
 
@@ -38,7 +24,7 @@ class HackathonTemplateManager(Component):
     team_manager = RequiredFeature("team_manager")
     hackathon_manager = RequiredFeature("hackathon_manager")
     template_library = RequiredFeature("template_library")
-    hosted_docker = RequiredFeature("hosted_docker")
+    image_pull_planner = RequiredFeature("image_pull_planner")
 
     def add_template_to_hackathon(self, template_id):
         try:
@@ -93,28 +79,23 @@ class HackathonTemplateManager(Component):
         return settings
 
     def pull_images_for_hackathon(self, context):
-        hackathon_id = context.hackathon_id
-        templates = self.__get_templates_for_pull(hackathon_id)
-        images = [self.__get_images_from_template(x) for x in templates]
-        images_to_pull = flatten(images)
-
-        self.log.debug('expected images: %s on hackathon: %s' % (images_to_pull, hackathon_id))
-        # get all docker host server on hackathon
-        hosts = self.db.find_all_objects_by(DockerHostServer, hackathon_id=hackathon_id)
-        # loop to get every docker host
-        for docker_host in hosts:
-            download_images = self.__get_undownloaded_images_on_docker_host(docker_host, images_to_pull)
-            self.log.debug('need to pull images: %s on host: %s' % (download_images, docker_host.vm_name))
-            for dl_image in download_images:
-                image = dl_image.split(':')[0]
-                tag = dl_image.split(':')[1]
-                context = Context(image=image,
-                                  tag=tag,
-                                  docker_host=docker_host.id)
-                self.scheduler.add_once(feature="hosted_docker",
-                                        method="pull_image",
-                                        context=context,
-                                        seconds=3)
+        """Pull docker images of the templates of a hackathon on its docker hosts, called by scheduler
+
+        :type context: Context
+        :param context: contains hackathon_id
+        """
+        hackathon = Hackathon.objects(id=context.hackathon_id).first()
+        if hackathon is None:
+            return
+
+        images = sorted(set(t.docker_image for t in hackathon.templates
+                            if t.provider == VE_PROVIDER.DOCKER and t.status == TEMPLATE_STATUS.CHECK_PASS
+                            and t.docker_image))
+        hosts = list(DockerHostServer.objects(hackathon=hackathon.id, disabled=False))
+        self.log.debug('expected images: %s on hackathon: %s' % (images, hackathon.name))
+
+        result = self.image_pull_planner.pull_images(hackathon, hosts, images)
+        self.log.debug('images pulled on hackathon %s: %s' % (hackathon.name, result))
 
     def __init__(self):
         pass
@@ -141,25 +122,3 @@ class HackathonTemplateManager(Component):
             content = self.template_library.load_template(template)
             data.append((template, content))
         return data
-
-    # template may have multiple images
-    def __get_images_from_template(self, template):
-        template_content = self.template_library.load_template(template)
-        docker_units = [u for u in template_content.units if u.provider == VE_PROVIDER.DOCKER]
-        docker_images = [du.get_image_with_tag() for du in docker_units]
-        return docker_images
-
-    def __get_templates_for_pull(self, hackathon_id):
-        htrs = self.db.find_all_objects_by(HackathonTemplateRel, hackathon_id=hackathon_id)
-        templates = [h.template for h in htrs]
-        templates = [t for t in templates if t.provider == VE_PROVIDER.DOCKER and t.status == TEMPLATE_STATUS.CHECK_PASS]
-        return templates
-
-    def __get_undownloaded_images_on_docker_host(self, docker_host, expected_images):
-        images = []
-        current_images = self.hosted_docker.get_pulled_images(docker_host)
-        self.log.debug('already exist images: %s on host: %s' % (current_images, docker_host.vm_name))
-        for ex_image in expected_images:
-            if ex_image not in current_images:
-                images.append(ex_image)
-        return flatten(images)
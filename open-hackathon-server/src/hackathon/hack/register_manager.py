@@ -11,6 +11,7 @@ from flask import g
 
 from hackathon import Component, RequiredFeature
 from hackathon.hmongo.models import UserHackathon, Experiment
+from hackathon.hmongo.identity_map import prefetch
 from hackathon.hackathon_response import bad_request, precondition_failed, internal_server_error, not_found, ok, \
     login_provider_error
 from hackathon.constants import EStatus, HACK_USER_STATUS, HACKATHON_CONFIG, HACKATHON_STAT, LOGIN_PROVIDER, \
@@ -35,7 +36,7 @@ class RegisterManager(Component):
         registers = UserHackathon.objects(hackathon=hackathon_id,
                                           role=HACK_USER_TYPE.COMPETITOR).order_by('-create_time')[:num]
 
-        return [self.__get_registration_with_profile(x) for x in registers]
+        return [self.__get_registration_with_profile(x) for x in prefetch(registers, "user")]
 
     def get_registration_by_id(self, registration_id):
         return UserHackathon.objects(id=registration_id).first()
@@ -98,7 +99,8 @@ class RegisterManager(Component):
                 self.team_manager.create_default_team(hackathon, user)
                 self.__ask_for_dev_plan(hackathon, user)
 
-            self.__update_register_stat(hackathon)
+            # the user is not counted before: either a new one or a visitor
+            self.__increase_register_stat(hackathon, 1 if self.__is_counted(user_hackathon) else 0)
             return user_hackathon.dic()
         except Exception as e:
             self.log.error(e)
@@ -118,6 +120,7 @@ class RegisterManager(Component):
                 # we can also create a new object here.
                 return not_found("registration not found")
 
+            was_counted = self.__is_counted(register)
             register.update_time = self.util.get_now()
             register.status = context.status
             register.save()
@@ -127,7 +130,7 @@ class RegisterManager(Component):
                 self.__ask_for_dev_plan(register.hackathon, register.user)
 
             hackathon = self.hackathon_manager.get_hackathon_by_id(register.hackathon.id)
-            self.__update_register_stat(hackathon)
+            self.__increase_register_stat(hackathon, int(self.__is_counted(register)) - int(was_counted))
 
             return register.dic()
         except Exception as e:
@@ -145,7 +148,7 @@ class RegisterManager(Component):
             if register is not None:
                 register.delete()
                 hackathon = register.hackathon
-                self.__update_register_stat(hackathon)
+                self.__increase_register_stat(hackathon, -1 if self.__is_counted(register) else 0)
 
                 team = self.team_manager.get_team_by_user_and_hackathon(register.user, hackathon)
                 if not team:
@@ -185,15 +188,18 @@ class RegisterManager(Component):
 
         return detail
 
-    def __update_register_stat(self, hackathon):
-        count = UserHackathon.objects(
-            hackathon=hackathon.id,
-            status__in=[HACK_USER_STATUS.AUDIT_PASSED, HACK_USER_STATUS.AUTO_PASSED],
-            role=HACK_USER_TYPE.COMPETITOR,
-            # TODO
-            deleted=False).count()
+    def __is_counted(self, registration):
+        """Whether the registration is counted in HACKATHON_STAT.REGISTER
 
-        self.hackathon_manager.update_hackathon_stat(hackathon, HACKATHON_STAT.REGISTER, count)
+        Keep it in line with HackathonManager.reconcile_hackathon_stat
+        """
+        return registration.role == HACK_USER_TYPE.COMPETITOR \
+            and registration.status in [HACK_USER_STATUS.AUDIT_PASSED, HACK_USER_STATUS.AUTO_PASSED] \
+            and not registration.deleted
+
+    def __increase_register_stat(self, hackathon, increase):
+        if increase:
+            self.hackathon_manager.increase_hackathon_stat(hackathon, HACKATHON_STAT.REGISTER, increase)
 
     def is_user_registered(self, user_id, hackathon):
         """Check whether use registered certain hackathon"""
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+This file is covered by the LICENSING file in the root of this project.
+"""
+
+import io
+import csv
+
+from hackathon import Component
+from hackathon.util import safe_get_config
+from hackathon.constants import HACK_USER_TYPE
+from hackathon.hmongo.models import UserHackathon, User
+
+__all__ = ["RegistrationExporter", "EXPORT_FORMAT"]
+
+
+class EXPORT_FORMAT:
+    CSV = "csv"
+    XLSX = "xlsx"
+
+
+GENDER = {
+    -1: "保密",
+    0: "女",
+    1: "男"
+}
+
+HEADER = ("用户名",
+          "昵称",
+          "姓名",
+          "Email",
+          "手机",
+          "登录方式",
+          "年龄",
+          "地址",
+          "QQ",
+          "skype",
+          "微信",
+          "微博")
+
+USER_FIELDS = ("name", "nickname", "emails", "provider", "profile")
+
+
+class RegistrationExporter(Component):
+    """Export competitors registered to a hackathon at constant memory
+
+    Registrations are read by a cursor that projects the user reference only, and their users are fetched
+    "export.chunk_size" at a time, so that neither the registrations nor the users are held in memory as a whole.
+    Rows are written to CSV or XLSX as soon as a chunk is fetched.
+
+    :Example:
+        exporter = RequiredFeature("registration_exporter")
+
+        with open("users.csv", "w") as f:
+            exporter.write_csv(hackathon, f)
+    """
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or safe_get_config("export.chunk_size", 1000)
+
+    def iter_rows(self, hackathon):
+        """Yield the header and then a row per competitor, in the order of registration
+
+        :type hackathon: Hackathon
+        :param hackathon: the hackathon to export
+
+        :rtype: generator
+        """
+        yield HEADER
+
+        registrations = UserHackathon.objects(hackathon=hackathon, role=HACK_USER_TYPE.COMPETITOR) \
+            .only("user").no_dereference().order_by("id").batch_size(self.chunk_size)
+
+        user_ids = []
+        for registration in registrations:
+            if registration.user is None:
+                continue
+            user_ids.append(registration.user.id)
+            if len(user_ids) >= self.chunk_size:
+                for row in self.__get_rows(user_ids):
+                    yield row
+                user_ids = []
+
+        for row in self.__get_rows(user_ids):
+            yield row
+
+    def write_csv(self, hackathon, out):
+        """Write registrations of hackathon to a text file-like object as CSV
+
+        :type out: file
+        :param out: text stream opened with newline=""
+        """
+        writer = csv.writer(out)
+        for row in self.iter_rows(hackathon):
+            writer.writerow(["" if v is None else v for v in row])
+
+    def stream_csv(self, hackathon):
+        """Yield CSV of registrations of hackathon in UTF-8 chunks, for a streamed HTTP response
+
+        A BOM comes first so that Excel recognizes the encoding.
+        """
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        yield u"\ufeff".encode("utf-8")
+        for i, row in enumerate(self.iter_rows(hackathon)):
+            writer.writerow(["" if v is None else v for v in row])
+            if i % self.chunk_size == 0:
+                yield buf.getvalue().encode("utf-8")
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue().encode("utf-8")
+
+    def write_xlsx(self, hackathon, filename):
+        """Write registrations of hackathon to an XLSX file
+
+        Requires the package `xlsxwriter`, whose constant_memory mode flushes every row to disk once the next row is
+        written. XLSX is a zip, so it can't be streamed before complete, write it to a temporary file first to serve it.
+
+        :type filename: str|unicode
+        :param filename: path of the file to write
+        """
+        try:
+            import xlsxwriter
+        except ImportError:
+            raise ImportError("package 'xlsxwriter' is required to export XLSX")
+
+        book = xlsxwriter.Workbook(filename, {"constant_memory": True})
+        try:
+            sheet = book.add_worksheet("注册用户")
+            for row_index, row in enumerate(self.iter_rows(hackathon)):
+                sheet.write_row(row_index, 0, row)
+        finally:
+            book.close()
+
+    def write_file(self, hackathon, filename):
+        """Write registrations of hackathon to filename, as XLSX if it ends with ".xlsx" otherwise as CSV"""
+        if filename.lower().endswith("." + EXPORT_FORMAT.XLSX):
+            self.write_xlsx(hackathon, filename)
+        else:
+            with io.open(filename, "w", encoding="utf-8-sig", newline="") as f:
+                self.write_csv(hackathon, f)
+
+    def __get_rows(self, user_ids):
+        if not user_ids:
+            return []
+
+        users = dict((u.id, u) for u in User.objects(id__in=user_ids).only(*USER_FIELDS))
+        return [self.__to_row(users[user_id]) for user_id in user_ids if user_id in users]
+
+    @staticmethod
+    def __to_row(user):
+        profile = user.profile
+        return (user.name,
+                user.nickname,
+                profile.real_name if profile else None,
+                ",".join([x.email for x in (user.emails or []) if x.email]),
+                profile.phone if profile else None,
+                user.provider,
+                GENDER.get(profile.gender if profile else None, "保密"),
+                profile.address if profile else None,
+                profile.qq if profile else None,
+                profile.skype if profile else None,
+                profile.wechat if profile else None,
+                profile.weibo if profile else None)
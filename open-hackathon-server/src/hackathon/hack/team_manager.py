@@ -11,25 +11,35 @@ sys.path.append("..")
 import uuid
 import time
 from flask import g
-import threading
+from functools import lru_cache
 from mongoengine import Q, ValidationError
 from os.path import realpath, abspath, dirname
 
 from hackathon import Component, RequiredFeature
-from hackathon.hmongo.models import Team, TeamMember, TeamScore, TeamWork, Hackathon, UserHackathon, to_dic
+from hackathon.hmongo.models import Team, TeamMember, TeamScore, TeamWork, Hackathon, to_dic
+from hackathon.hmongo.identity_map import prefetch
 from hackathon.hackathon_response import not_found, bad_request, precondition_failed, ok, forbidden
-from hackathon.constants import TEAM_MEMBER_STATUS, TEAM_SHOW_TYPE, HACK_USER_TYPE, HACKATHON_CONFIG
+from hackathon.constants import TEAM_MEMBER_STATUS, TEAM_SHOW_TYPE, HACKATHON_CONFIG
 
 __all__ = ["TeamManager"]
 hack_manager = RequiredFeature("hackathon_manager")
 
 
+@lru_cache(maxsize=16)
+def _load_email_template(file_name):
+    """Read an email template under resources/email once"""
+    path = abspath("%s/.." % dirname(realpath(__file__)))
+    with open(path + "/resources/email/" + file_name, "r") as f:
+        return f.read()
+
+
 class TeamManager(Component):
     """Component to manage hackathon teams"""
     user_manager = RequiredFeature("user_manager")
     admin_manager = RequiredFeature("admin_manager")
     register_manager = RequiredFeature("register_manager")
     hackathon_template_manager = RequiredFeature("hackathon_template_manager")
+    outbox = RequiredFeature("notification_outbox")
 
     def get_team_by_id(self, team_id):
         team = self.__get_team_by_id(team_id)
@@ -115,7 +125,7 @@ class TeamManager(Component):
             query &= Q(name__icontains=name)
 
         try:
-            teams = Team.objects(query).order_by('name')[:number]
+            teams = prefetch(Team.objects(query).order_by('name')[:number], "leader", "members.user")
         except ValidationError:
             return []
 
@@ -205,9 +215,7 @@ class TeamManager(Component):
 
         if "dev_plan" in kwargs and kwargs["dev_plan"] and not kwargs["dev_plan"] == "" \
                 and team.hackathon.config.get(HACKATHON_CONFIG.DEV_PLAN_REQUIRED, False):
-            t = threading.Thread(target=self.__email_notify_dev_plan_submitted, args=(team,))
-            t.setDaemon(True)
-            t.start()
+            self.__email_notify_dev_plan_submitted(team)
 
         return self.__team_detail(team)
 
@@ -697,7 +705,9 @@ class TeamManager(Component):
         email_title = ''
         email_content = ''
 
-        return self.util.send_emails(sender, primary_emails, email_title, email_content)
+        # not enqueued only if the same email is in the outbox already, which is no failure
+        self.outbox.enqueue_email(sender, primary_emails, email_title, email_content)
+        return True
 
 
     def __init__(self):
@@ -715,6 +725,7 @@ class TeamManager(Component):
         return to_dic(award)
 
     def __team_detail(self, team, user=None):
+        prefetch([team], "leader", "members.user")
         resp = team.dic()
         resp["leader"] = self.user_manager.user_display_info(team.leader)
         resp["member_count"] = team.members.filter(status=TEAM_MEMBER_STATUS.APPROVED).count()
@@ -835,8 +846,7 @@ class TeamManager(Component):
         return team_dic
 
     def __email_notify_dev_plan_submitted(self, team):
-        # send emails to all admins of this hackathon when one team dev plan is submitted.
-        admins = UserHackathon.objects(hackathon=team.hackathon, role=HACK_USER_TYPE.ADMIN).distinct("user")
+        # enqueue emails to all admins of this hackathon when one team dev plan is submitted, sent by the outbox.
         email_title = self.util.safe_get_config("email.email_templates.dev_plan_submitted_notify.title", None)
         file_name = self.util.safe_get_config("email.email_templates.dev_plan_submitted_notify.default_file_name", None)
         sender = self.util.safe_get_config("email.default_sender", "")
@@ -846,14 +856,11 @@ class TeamManager(Component):
 
         try:
             if email_title and file_name:
-                path = abspath("%s/.." % dirname(realpath(__file__)))
-                f = open(path + "/resources/email/" + file_name, "r")
-                email_content = f.read()
-                email_title = email_title % (team.name.encode("utf-8"))
-                email_content = email_content.replace("{{team_name}}", team.name.encode("utf-8"))
+                email_content = _load_email_template(file_name)
+                email_title = email_title % team.name
+                email_content = email_content.replace("{{team_name}}", team.name)
                 email_content = email_content.replace("{{team_id}}", str(team.id))
-                email_content = email_content.replace("{{hackathon_name}}", team.hackathon.name.encode("utf-8"))
-                f.close()
+                email_content = email_content.replace("{{hackathon_name}}", team.hackathon.name)
             else:
                 self.log.error("send email_notification (dev_plan_submitted_event) fails: please check the config")
                 return False
@@ -861,27 +868,8 @@ class TeamManager(Component):
             self.log.error(e)
             return False
 
-        # isNotified: whether at least one admin has been notified by emails.
-        isNotified = False
-        for admin in admins:
-            isSent = False
-            primary_emails = [email.email for email in admin.emails if email.primary_email]
-            nonprimary_emails = [email.email for email in admin.emails if not email.primary_email]
-
-            # send notification to all primary-mailboxes.
-            if not len(primary_emails) == 0:
-                isSent = self.util.send_emails(sender, primary_emails, email_title, email_content)
-
-            # if fail to send emails to primary-mailboxes, sent email to one non-primary mailboxes.
-            if not isSent and not len(nonprimary_emails) == 0:
-                for nonpri_email in nonprimary_emails:
-                    if self.util.send_emails(sender, [nonpri_email], email_title, email_content):
-                        isSent = True
-                        break
-            isNotified = isNotified or isSent
-
-        # todo remove this code
-        self.util.send_emails(sender, receivers_forced, email_title, email_content)
-
-        self.log.debug(team.name + ": dev_plan email notification result: " + str(isNotified))
-        return isNotified
+        # admins are looked up by the outbox when it's sent
+        enqueued = self.outbox.enqueue_admins_email(team.hackathon.id, sender, email_title, email_content,
+                                                    receivers_forced=receivers_forced)
+        self.log.debug(team.name + ": dev_plan email notification enqueued: " + str(enqueued))
+        return enqueued
@@ -3,7 +3,25 @@
 This file is covered by the LICENSING file in the root of this project.
 """
 
-__all__ = ["factory", "RequiredFeature"]
+from collections import defaultdict
+from threading import RLock
+
+from flask import g, has_app_context
+
+__all__ = ["factory", "RequiredFeature", "SCOPE"]
+
+
+class SCOPE:
+    """Lifecycle of the objects built by callable providers
+
+    Attributes:
+        SINGLETON: only one instance is built and shared by the whole process. The default scope
+        REQUEST: one instance is built per flask request(app context), transient if there is no app context
+        TRANSIENT: a new instance is built on every lookup
+    """
+    SINGLETON = "singleton"
+    REQUEST = "request"
+    TRANSIENT = "transient"
 
 
 #
@@ -20,12 +38,16 @@ class HackathonFactory:
         """
         self.providers = {}
         self.allow_replace = allow_replace
+        self.singletons = {}
+        self.instance_counts = defaultdict(int)
+        # re-entrant since building a component may look up other features
+        self.lock = RLock()
 
     def set_allow_replace(self, allow_replace):
         """Set the value of allow_replace"""
         self.allow_replace = allow_replace
 
-    def provide(self, feature, provider, suspend_callable=False, *args, **kwargs):
+    def provide(self, feature, provider, *args, suspend_callable=False, scope=SCOPE.SINGLETON, **kwargs):
         """Add a provider to factory
 
         :type feature: str|unicode
@@ -34,14 +56,23 @@ class HackathonFactory:
         :type provider: object | callable
         :param provider: the object to be added.
 
+        :param args: positional arguments to build the object if provider is callable
+
         :type suspend_callable: boolean
-        :param suspend_callable: suspend the callable where we want to keep the original function
+        :param suspend_callable: keyword only, suspend the callable where we want to keep the original function
+
+        :type scope: str|unicode
+        :param scope: keyword only, lifecycle of the object built by a callable provider. See SCOPE. Ignored if
+        provider isn't callable or suspend_callable is True
 
         :Example:
             from *** import UserManager
             factory.provide("user_manager", UesrManager)
             factory.provide("user_manager", UesrManager, *init_args, **init_kwargs)
 
+            # build a new one every time
+            factory.provide("user_manager", UesrManager, scope=SCOPE.TRANSIENT)
+
             # or:
             um = UserManager
             factory.provide("user_manager", um)
@@ -49,13 +80,38 @@ class HackathonFactory:
         """
         if not self.allow_replace:
             assert feature not in self.providers, "Duplicate feature: %r" % feature
+        assert scope in (SCOPE.SINGLETON, SCOPE.REQUEST, SCOPE.TRANSIENT), "Unknown scope: %r" % scope
+
         if callable(provider) and not suspend_callable:
-            def call():
+            def create():
+                with self.lock:
+                    self.instance_counts[feature] += 1
                 return provider(*args, **kwargs)
+
+            if scope == SCOPE.SINGLETON:
+                def call():
+                    return self.__get_singleton(feature, create)
+            elif scope == SCOPE.REQUEST:
+                def call():
+                    return self.__get_request_instance(feature, create)
+            else:
+                call = create
         else:
             def call():
                 return provider
-        self.providers[feature] = call
+
+        with self.lock:
+            self.singletons.pop(feature, None)
+            self.providers[feature] = call
+
+    def get_instance_counts(self):
+        """Return how many instances the factory created for each feature
+
+        :rtype: dict
+        :return feature -> count of instances created by its provider
+        """
+        with self.lock:
+            return dict(self.instance_counts)
 
     def __getitem__(self, feature):
         try:
@@ -64,6 +120,25 @@ class HackathonFactory:
             raise KeyError("Unknown feature named %r" % feature)
         return provider()
 
+    def __get_singleton(self, feature, create):
+        if feature in self.singletons:
+            return self.singletons[feature]
+
+        with self.lock:
+            if feature not in self.singletons:
+                self.singletons[feature] = create()
+            return self.singletons[feature]
+
+    def __get_request_instance(self, feature, create):
+        if not has_app_context():
+            return create()
+
+        if "factory_instances" not in g:
+            g.factory_instances = {}
+        if feature not in g.factory_instances:
+            g.factory_instances[feature] = create()
+        return g.factory_instances[feature]
+
 
 factory = HackathonFactory()
 
@@ -4,27 +4,37 @@ This file is covered by the LICENSING file in the root of this project.
 """
 
 import sys
+import time
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, wait
 
 sys.path.append("..")
 
-from hackathon.util import get_now
-from hackathon import RequiredFeature
+from hackathon.util import get_now, safe_get_config
+from hackathon import RequiredFeature, Component
 from hackathon.constants import HEALTH_STATUS
 
-__all__ = ["report_health"]
+__all__ = ["report_health", "HealthReporter"]
 
 
 # the time when application starts
 app_start_time = get_now()
 
 STATUS = "status"
+DESCRIPTION = "description"
 
 # all available health check items
 all_health_items = {
     "docker": RequiredFeature("health_check_hosted_docker"),
     "guacamole": RequiredFeature("health_check_guacamole"),
     "storage": RequiredFeature("storage"),
-    "mongodb": RequiredFeature("health_check_mongodb")
+    "mongodb": RequiredFeature("health_check_mongodb"),
+    "token_cache": RequiredFeature("token_cache"),
+    "warm_pool": RequiredFeature("warm_pool"),
+    "presence": RequiredFeature("presence"),
+    "query_profiler": RequiredFeature("query_profiler"),
+    "template_library": RequiredFeature("template_library"),
+    "notification": RequiredFeature("notification_outbox")
 }
 
 # basic health check items which are fundamental for OHP
@@ -35,6 +45,81 @@ basic_health_items = {
 }
 
 
+class HealthReporter(Component):
+    """Run health check items concurrently and cache their reports
+
+    Reports are cached for "health.ttl_seconds". A stale report is returned at once while its item is checked again
+    in background, and an item is never checked by more than one thread at the same time. Items without any report
+    yet are waited for at most "health.deadline_seconds" in total, those not done by then are reported as warning and
+    keep running in background for the next call. So that a dead dependency never blocks /health.
+    """
+
+    def __init__(self):
+        self.ttl_seconds = safe_get_config("health.ttl_seconds", 30)
+        self.deadline_seconds = safe_get_config("health.deadline_seconds", 2)
+        self.__executor = ThreadPoolExecutor(max_workers=safe_get_config("health.workers", 8))
+        self.__reports = {}  # key -> (report, time checked)
+        self.__running = {}  # key -> future of the running check
+        self.__lock = Lock()
+
+    def get_reports(self, items):
+        """Return the report of every item
+
+        :type items: dict
+        :param items: {key: item that has report_health()}
+
+        :rtype: dict
+        :return {key: report}
+        """
+        now = time.time()
+        reports = {}
+        waiting = {}
+        with self.__lock:
+            for key, item in list(items.items()):
+                cached = self.__reports.get(key)
+                if cached is None:
+                    waiting[key] = self.__check(key, item)
+                    continue
+                reports[key] = cached[0]
+                if now - cached[1] > self.ttl_seconds:
+                    self.__check(key, item)
+
+        if waiting:
+            wait(list(waiting.values()), timeout=self.deadline_seconds)
+        for key, future in list(waiting.items()):
+            if future.done():
+                reports[key] = future.result()
+            else:
+                reports[key] = {
+                    STATUS: HEALTH_STATUS.WARNING,
+                    DESCRIPTION: "no report in %s seconds, still checking" % self.deadline_seconds
+                }
+        return reports
+
+    def __check(self, key, item):
+        # called with lock held
+        future = self.__running.get(key)
+        if future is None:
+            future = self.__executor.submit(self.__report_item, key, item)
+            self.__running[key] = future
+        return future
+
+    def __report_item(self, key, item):
+        try:
+            report = item.report_health() or {STATUS: HEALTH_STATUS.ERROR, DESCRIPTION: "no report"}
+        except Exception as e:
+            self.log.error(e)
+            report = {STATUS: HEALTH_STATUS.ERROR, DESCRIPTION: str(e)}
+
+        with self.__lock:
+            self.__reports[key] = (report, time.time())
+            self.__running.pop(key, None)
+        return report
+
+
+health_reporter = RequiredFeature("health_reporter")
+
+
 def __report_detail(health, items):
     """Report the details of health check item
 
@@ -47,8 +132,7 @@ def __report_detail(health, items):
     :rtype dict
     :return health status including overall status and details of sub items
     """
-    for key, value in items.items():
-        sub_report = value.report_health()
+    for key, sub_report in list(health_reporter.get_reports(items).items()):
         health[key] = sub_report
         if sub_report[STATUS] != HEALTH_STATUS.OK and health[STATUS] != HEALTH_STATUS.ERROR:
             health[STATUS] = sub_report[STATUS]
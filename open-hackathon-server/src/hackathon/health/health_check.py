@@ -5,13 +5,12 @@ This file is covered by the LICENSING file in the root of this project.
 
 import sys
 
-from hackathon.hmongo.models import User
-
 sys.path.append("..")
 import requests
 import abc
 
 from hackathon.constants import HEALTH_STATUS
+from hackathon.util import safe_get_config
 from hackathon import RequiredFeature, Component
 
 __all__ = [
@@ -48,7 +47,7 @@ class MongoDBHealthCheck(HealthCheck):
         except Exception as e:
             return {
                 STATUS: HEALTH_STATUS.ERROR,
-                DESCRIPTION: e.message
+                DESCRIPTION: str(e)
             }
 
 
@@ -72,7 +71,7 @@ class GuacamoleHealthCheck(HealthCheck):
 
     def report_health(self):
         try:
-            req = requests.get(self.guacamole_url)
+            req = requests.get(self.guacamole_url, timeout=safe_get_config("health.probe_timeout_seconds", 5))
             self.log.debug(req.status_code)
             if req.status_code == 200:
                 return {
@@ -90,7 +89,7 @@ class StorageHealthCheck(HealthCheck):
     """Check the status of storage"""
 
     def report_health(self):
-        self.storage.report_health()
+        return self.storage.report_health()
 
     def __init__(self):
         self.storage = RequiredFeature("storage")
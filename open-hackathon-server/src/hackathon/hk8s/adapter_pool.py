@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+This file is covered by the LICENSING file in the root of this project.
+"""
+
+import time
+from threading import Lock
+from collections import OrderedDict
+
+from hackathon import Component
+from hackathon.util import safe_get_config
+from .k8s_service_adapter import K8SServiceAdapter
+
+__all__ = ["K8SServiceAdapterPool"]
+
+
+class K8SServiceAdapterPool(Component):
+    """Process-wide registry of K8SServiceAdapter keyed by (api_url, token, namespace)
+
+    Every adapter owns a pool of keep-alive connections, so sharing adapters across scheduler jobs avoids a TCP and TLS
+    handshake per call. Adapters not used for "k8s.adapter_pool.idle_seconds" are closed by evict_idle, which the
+    scheduler calls every "k8s.adapter_pool.evict_interval_seconds", and the least recently used one is closed once
+    there are more than "k8s.adapter_pool.max_size" adapters.
+
+    :Example:
+        adapter_pool = RequiredFeature("k8s_adapter_pool")
+
+        adapter = adapter_pool.get(cluster.api_url, cluster.token, cluster.namespace)
+    """
+
+    def __init__(self, max_size=None, idle_seconds=None, connection_pool_maxsize=None,
+                 adapter_class=K8SServiceAdapter):
+        self.max_size = max_size or safe_get_config("k8s.adapter_pool.max_size", 32)
+        self.idle_seconds = idle_seconds or safe_get_config("k8s.adapter_pool.idle_seconds", 600)
+        self.connection_pool_maxsize = connection_pool_maxsize or safe_get_config(
+            "k8s.adapter_pool.connection_pool_maxsize", 16)
+        self.created = 0
+        self.hits = 0
+        self.evicted = 0
+        self.__adapter_class = adapter_class
+        self.__adapters = OrderedDict()  # key -> (adapter, last used time), least recently used first
+        self.__lock = Lock()
+
+    def get(self, api_url, token, namespace):
+        """Get the shared adapter of a cluster namespace, create it if not exist
+
+        :rtype: K8SServiceAdapter
+        """
+        key = (api_url, token, namespace)
+        now = time.time()
+        with self.__lock:
+            evicted = self.__pop_idle(now)
+            entry = self.__adapters.pop(key, None)
+            if entry:
+                self.hits += 1
+                adapter = entry[0]
+            else:
+                self.created += 1
+                adapter = self.__adapter_class(api_url, token, namespace,
+                                               connection_pool_maxsize=self.connection_pool_maxsize)
+            self.__adapters[key] = (adapter, now)
+
+            while len(self.__adapters) > self.max_size:
+                evicted.append(self.__adapters.popitem(last=False)[1][0])
+            self.evicted += len(evicted)
+
+        self.__close(evicted)
+        return adapter
+
+    def evict_idle(self):
+        """Close adapters that are not used for a while
+
+        :rtype: int
+        :return count of adapters closed
+        """
+        with self.__lock:
+            evicted = self.__pop_idle(time.time())
+            self.evicted += len(evicted)
+
+        self.__close(evicted)
+        return len(evicted)
+
+    def clear(self):
+        with self.__lock:
+            evicted = [entry[0] for entry in list(self.__adapters.values())]
+            self.__adapters.clear()
+
+        self.__close(evicted)
+
+    def stats(self):
+        with self.__lock:
+            return {
+                "size": len(self.__adapters),
+                "max_size": self.max_size,
+                "created": self.created,
+                "hits": self.hits,
+                "evicted": self.evicted
+            }
+
+    def __pop_idle(self, now):
+        idle_keys = [k for k, entry in list(self.__adapters.items()) if now - entry[1] > self.idle_seconds]
+        return [self.__adapters.pop(k)[0] for k in idle_keys]
+
+    def __close(self, adapters):
+        for adapter in adapters:
+            try:
+                adapter.close()
+            except Exception as e:
+                self.log.error("close k8s adapter of %s error: %s" % (adapter.api_url, e))
@@ -13,32 +13,46 @@ from kubernetes.client.rest import ApiException
 from hackathon.constants import HEALTH, HEALTH_STATUS, K8S_DEPLOYMENT_STATUS
 from .service_adapter import ServiceAdapter
 
-from .errors import DeploymentError, ServiceError, StatefulSetError, PVCError
+from .errors import EnvError, DeploymentError, ServiceError, StatefulSetError, PVCError
 
 __all__ = ["K8SServiceAdapter"]
 disable_warnings(InsecureRequestWarning)
 
 
 class K8SServiceAdapter(ServiceAdapter):
-    def __init__(self, api_url, token, namespace):
+    """Adapter of a namespace of k8s cluster
+
+    Connections are kept alive in the pool of api_client, get a shared adapter from K8SServiceAdapterPool instead of
+    creating one for each call so that connections and TLS sessions are reused.
+    """
+
+    def __init__(self, api_url, token, namespace, connection_pool_maxsize=None):
         configuration = client.Configuration()
         configuration.host = api_url
         configuration.api_key['Authorization'] = 'bearer ' + token
         # FIXME import ca cert file?
         configuration.verify_ssl = False
+        if connection_pool_maxsize:
+            configuration.connection_pool_maxsize = connection_pool_maxsize
 
         self.namespace = namespace
         self.api_url = api_url
         self.api_client = client.ApiClient(configuration)
+        self.apps_v1_api = client.AppsV1Api(self.api_client)
+        self.core_v1_api = client.CoreV1Api(self.api_client)
         super(K8SServiceAdapter, self).__init__(self.api_client)
 
+    def close(self):
+        """Close all connections to the cluster"""
+        self.api_client.rest_client.pool_manager.clear()
+
     def ping(self, timeout=20):
         report = self.report_health(timeout)
         return report[HEALTH.STATUS] == HEALTH_STATUS.OK
 
     def report_health(self, timeout=20):
         try:
-            api_instance = client.CoreV1Api(self.api_client)
+            api_instance = self.core_v1_api
             api_instance.list_namespaced_pod(self.namespace, timeout_seconds=timeout)
             return {HEALTH.STATUS: HEALTH_STATUS.OK}
         except ApiException as e:
@@ -53,6 +67,33 @@ class K8SServiceAdapter(ServiceAdapter):
                 HEALTH.DESCRIPTION: "Connect K8s ApiServer {} error: connection timeout".format(self.api_url),
             }
 
+    def delete_k8s_resources_by_label(self, label_key, label_values):
+        """Delete deployments, statefulsets, PVCs and services of many label values in bulk
+
+        One `deletecollection` call per kind instead of one call per object. Dependents like pods are removed by
+        background garbage collection, which is the default propagation of apps/v1, so calls return immediately.
+
+        :type label_key: str|unicode
+        :param label_key: key of the label, e.g. K8S_LABEL.EXPERIMENT
+
+        :type label_values: list
+        :param label_values: resources labeled with any of the values are deleted
+        """
+        label_selector = "{} in ({})".format(label_key, ",".join(label_values))
+        try:
+            self.apps_v1_api.delete_collection_namespaced_deployment(self.namespace, label_selector=label_selector)
+            self.apps_v1_api.delete_collection_namespaced_stateful_set(self.namespace, label_selector=label_selector)
+            self.core_v1_api.delete_collection_namespaced_persistent_volume_claim(self.namespace,
+                                                                                  label_selector=label_selector)
+
+            # service doesn't support deletecollection
+            services = self.core_v1_api.list_namespaced_service(self.namespace, label_selector=label_selector)
+            for svc in services.items:
+                self.core_v1_api.delete_namespaced_service(svc.metadata.name, self.namespace)
+        except ApiException as e:
+            self.log.error("Delete resources by label error: {}".format(e))
+            raise EnvError("Delete resources of {} error: {}".format(label_selector, e))
+
     ###
     # Deployment
     ###
@@ -64,7 +105,7 @@ class K8SServiceAdapter(ServiceAdapter):
             label_selector = ",".join(["{}={}".format(k, v) for k, v in list(labels.items())])
             kwargs['label_selector'] = label_selector
 
-        apps_v1_group = client.AppsV1Api(self.api_client)
+        apps_v1_group = self.apps_v1_api
         try:
             ret = apps_v1_group.list_namespaced_deployment(self.namespace, **kwargs)
         except ApiException as e:
@@ -79,7 +120,7 @@ class K8SServiceAdapter(ServiceAdapter):
         return self.get_deployment_by_name(name, need_raise=False) is not None
 
     def create_k8s_deployment(self, yaml):
-        api_instance = client.AppsV1Api(self.api_client)
+        api_instance = self.apps_v1_api
         if isinstance(yaml, str) or isinstance(yaml, str):
             # Only support ONE deployment yaml
             yaml = yaml_tool.load(yaml)
@@ -98,7 +139,7 @@ class K8SServiceAdapter(ServiceAdapter):
         return deploy_name
 
     def get_deployment_by_name(self, deployment_name, need_raise=True):
-        api_instance = client.AppsV1Api(self.api_client)
+        api_instance = self.apps_v1_api
         try:
             _deploy = api_instance.read_namespaced_deployment(deployment_name, self.namespace)
         except ApiException:
@@ -120,7 +161,7 @@ class K8SServiceAdapter(ServiceAdapter):
 
     def start_k8s_deployment(self, deployment_name):
         _deploy = self.get_deployment_by_name(deployment_name)
-        api_instance = client.AppsV1Api(self.api_client)
+        api_instance = self.apps_v1_api
         if not _deploy:
             raise DeploymentError("Deployment {} not found".format(deployment_name))
 
@@ -135,7 +176,7 @@ class K8SServiceAdapter(ServiceAdapter):
         _deploy = self.get_deployment_by_name(deployment_name)
         _spec = _deploy.spec
         _spec.replicas = 0
-        api_instance = client.AppsV1Api(self.api_client)
+        api_instance = self.apps_v1_api
         try:
             api_instance.patch_namespaced_deployment(deployment_name, self.namespace, _deploy)
         except ApiException as e:
@@ -144,7 +185,7 @@ class K8SServiceAdapter(ServiceAdapter):
         self.log.info("Paused existed deployment: {}".format(deployment_name))
 
     def delete_k8s_deployment(self, deployment_name):
-        api_instance = client.AppsV1Api(self.api_client)
+        api_instance = self.apps_v1_api
         try:
             api_instance.delete_namespaced_deployment(deployment_name, self.namespace)
         except ApiException as e:
@@ -157,7 +198,7 @@ class K8SServiceAdapter(ServiceAdapter):
     ###
 
     def get_service_by_name(self, service_name, need_raise=True):
-        api_instance = client.CoreV1Api(self.api_client)
+        api_instance = self.core_v1_api
         try:
             _svc = api_instance.read_namespaced_service(service_name, self.namespace)
         except ApiException:
@@ -166,22 +207,27 @@ class K8SServiceAdapter(ServiceAdapter):
             return None
         return _svc.to_dict()
 
-    def create_k8s_service(self, yaml):
+    def create_k8s_service(self, yaml, detail=False):
+        """Create a service
+
+        :type detail: bool
+        :param detail: return the created service in dict including ports allocated by k8s, instead of its name
+        """
         if isinstance(yaml, str) or isinstance(yaml, str):
             # Only support ONE deployment yaml
             yaml = yaml_tool.load(yaml)
         assert isinstance(yaml, dict), "Create a service without legal yaml."
 
-        api_instance = client.CoreV1Api(self.api_client)
+        api_instance = self.core_v1_api
         try:
-            svc = api_instance.create_namespaced_service(self.namespace, yaml)
-            return svc.to_dict()['metadata']['name']
+            svc = api_instance.create_namespaced_service(self.namespace, yaml).to_dict()
+            return svc if detail else svc['metadata']['name']
         except ApiException as e:
             self.log.error("Create service error: {}".format(e))
             raise ServiceError("Create service error: {}".format(e))
 
     def delete_k8s_service(self, service_name):
-        api_instance = client.CoreV1Api(self.api_client)
+        api_instance = self.core_v1_api
         try:
             api_instance.delete_namespaced_service(service_name, self.namespace)
         except ApiException as e:
@@ -198,7 +244,7 @@ class K8SServiceAdapter(ServiceAdapter):
             yaml = yaml_tool.load(yaml)
         assert isinstance(yaml, dict), "Create a statefulset without legal yaml."
 
-        api_instance = client.AppsV1Api(self.api_client)
+        api_instance = self.apps_v1_api
         try:
             api_instance.create_namespaced_stateful_set(self.namespace, yaml)
         except ApiException as e:
@@ -206,7 +252,7 @@ class K8SServiceAdapter(ServiceAdapter):
             raise StatefulSetError("Create StatefulSet error: {}".format(e))
 
     def delete_k8s_statefulset(self, statefulset_name):
-        api_instance = client.AppsV1Api(self.api_client)
+        api_instance = self.apps_v1_api
         try:
             api_instance.delete_namespaced_stateful_set(statefulset_name, self.namespace)
         except ApiException as e:
@@ -223,7 +269,7 @@ class K8SServiceAdapter(ServiceAdapter):
             yaml = yaml_tool.load(yaml)
         assert isinstance(yaml, dict), "Create a PVC without legal yaml."
 
-        api_instance = client.CoreV1Api(self.api_client)
+        api_instance = self.core_v1_api
         try:
             api_instance.create_namespaced_persistent_volume_claim(self.namespace, yaml)
         except ApiException as e:
@@ -231,7 +277,7 @@ class K8SServiceAdapter(ServiceAdapter):
             raise PVCError("Create PVC error: {}".format(e))
 
     def delete_k8s_pvc(self, pvc_name):
-        api_instance = client.CoreV1Api(self.api_client)
+        api_instance = self.core_v1_api
         try:
             api_instance.delete_namespaced_persistent_volume_claim(pvc_name, self.namespace)
         except ApiException as e:
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+This file is covered by the LICENSING file in the root of this project.
+"""
+
+import time
+import threading
+from collections import defaultdict
+
+from kubernetes import watch
+
+from hackathon import Component
+from hackathon.constants import K8S_LABEL, K8S_RESOURCE_KIND
+
+__all__ = ["K8SReadinessWatcher"]
+
+
+def watch_stream(adapter, kind, label_selector, timeout_seconds):
+    """Watch deployments or statefulsets of the adapter's namespace
+
+    :rtype: generator
+    :return events of kubernetes watch API, a dict like {"type": "MODIFIED", "object": V1Deployment}
+    """
+    api_instance = adapter.apps_v1_api
+    if kind == K8S_RESOURCE_KIND.DEPLOYMENT:
+        list_func = api_instance.list_namespaced_deployment
+    else:
+        list_func = api_instance.list_namespaced_stateful_set
+
+    return watch.Watch().stream(list_func, adapter.namespace,
+                                label_selector=label_selector,
+                                timeout_seconds=timeout_seconds)
+
+
+def is_available(kind, obj):
+    """Whether all replicas of a deployment or statefulset are ready"""
+    status = obj.status
+    if kind == K8S_RESOURCE_KIND.DEPLOYMENT:
+        return bool(status.replicas) and status.replicas == status.available_replicas
+
+    replicas = obj.spec.replicas
+    return bool(replicas) and replicas == status.ready_replicas
+
+
+class ReadinessWait(object):
+    def __init__(self, key, cluster, resources, callback, on_timeout, deadline):
+        self.key = key
+        self.cluster = cluster
+        self.resources = resources  # set of (kind, name) that are not available yet
+        self.callback = callback
+        self.on_timeout = on_timeout
+        self.deadline = deadline
+
+
+class K8SReadinessWatcher(Component):
+    """Notify when deployments and statefulsets of experiments become available
+
+    Instead of polling every resource of every experiment, one watch stream per resource kind per cluster is opened on
+    all resources labeled with K8S_LABEL.EXPERIMENT. The stream lists existing resources at beginning and then pushes
+    their changes, so a single thread keeps track of any number of starting experiments. Streams are opened when
+    the first wait of a cluster registered and closed once all waits of the cluster are done.
+
+    Callbacks are executed in the watcher thread, they should return quickly.
+
+    :Example:
+        watcher = RequiredFeature("k8s_readiness_watcher")
+
+        watcher.watch(adapter, str(experiment.id), ["deploy-name"], ["statefulset-name"],
+                      callback=on_ready, on_timeout=on_timeout, timeout=1800)
+        # on_ready(str(experiment.id)) is called when all resources are available
+    """
+
+    def __init__(self, stream=watch_stream, stream_timeout=60):
+        """
+        :type stream: function
+        :param stream: function(adapter, kind, label_selector, timeout_seconds) that returns watch events
+
+        :type stream_timeout: int
+        :param stream_timeout: seconds before a stream re-opened, waits get timed out at least so often
+        """
+        self.__stream = stream
+        self.__stream_timeout = stream_timeout
+        self.__lock = threading.RLock()
+        self.__waits = {}  # key -> ReadinessWait
+        self.__waiting = defaultdict(set)  # (cluster, kind, name) -> keys of waits
+        self.__available = defaultdict(set)  # (cluster, kind) -> names of available resources
+        self.__threads = {}  # (cluster, kind) -> watcher thread
+
+    def watch(self, adapter, key, deployments, stateful_sets, callback, on_timeout=None, timeout=1800):
+        """Call `callback(key)` once all deployments and statefulsets are available
+
+        :type adapter: K8SServiceAdapter
+        :param adapter: adapter of the cluster where resources are created
+
+        :type key: str|unicode
+        :param key: identity of the wait, usually the experiment id. Existing wait with same key is replaced
+
+        :type deployments: list
+        :param deployments: names of deployments
+
+        :type stateful_sets: list
+        :param stateful_sets: names of statefulsets
+
+        :type callback: function
+        :param callback: called with key when all resources are available
+
+        :type on_timeout: function
+        :param on_timeout: called with key if resources are not available in `timeout` seconds
+
+        :type timeout: int
+        :param timeout: seconds to wait
+        """
+        cluster = self.__get_cluster_key(adapter)
+        resources = set([(K8S_RESOURCE_KIND.DEPLOYMENT, n) for n in deployments] +
+                        [(K8S_RESOURCE_KIND.STATEFUL_SET, n) for n in stateful_sets])
+
+        with self.__lock:
+            self.cancel(key)
+            resources = set([(kind, name) for kind, name in resources
+                             if name not in self.__available[(cluster, kind)]])
+            if not resources:
+                ready = True
+            else:
+                ready = False
+                self.__waits[key] = ReadinessWait(key, cluster, resources, callback, on_timeout, time.time() + timeout)
+                for kind, name in resources:
+                    self.__waiting[(cluster, kind, name)].add(key)
+                    self.__ensure_thread(adapter, cluster, kind)
+
+        if ready:
+            self.__fire(callback, key)
+
+    def cancel(self, key):
+        """Stop waiting for resources of key, no callback will be called"""
+        with self.__lock:
+            wait = self.__waits.pop(key, None)
+            if wait:
+                self.__stop_waiting(wait)
+
+    def pending_count(self):
+        """Return the count of waits not finished yet"""
+        with self.__lock:
+            return len(self.__waits)
+
+    @staticmethod
+    def __get_cluster_key(adapter):
+        return adapter.api_url, adapter.namespace
+
+    def __ensure_thread(self, adapter, cluster, kind):
+        if (cluster, kind) in self.__threads:
+            return
+
+        t = threading.Thread(target=self.__run, args=(adapter, cluster, kind),
+                             name="k8s-readiness-%s-%s" % (kind, adapter.namespace))
+        t.daemon = True
+        self.__threads[(cluster, kind)] = t
+        t.start()
+
+    def __has_waits(self, cluster, kind):
+        # request threads add and remove waits at the same time, the lock is reentrant for callers holding it already
+        with self.__lock:
+            return any(k[0] == cluster and k[1] == kind for k in self.__waiting)
+
+    def __run(self, adapter, cluster, kind):
+        self.log.debug("k8s readiness watcher of %s %s started" % (kind, cluster))
+        while True:
+            with self.__lock:
+                if not self.__has_waits(cluster, kind):
+                    # quit in lock so that a new wait would start a new thread
+                    self.__threads.pop((cluster, kind), None)
+                    self.__available.pop((cluster, kind), None)
+                    self.log.debug("k8s readiness watcher of %s %s stopped" % (kind, cluster))
+                    return
+                # the stream lists all existing resources at beginning
+                self.__available[(cluster, kind)].clear()
+
+            try:
+                for event in self.__stream(adapter, kind, K8S_LABEL.EXPERIMENT, self.__stream_timeout):
+                    self.__on_event(cluster, kind, event)
+                    self.__expire_waits()
+                    if not self.__has_waits(cluster, kind):
+                        break
+            except Exception as e:
+                self.log.error("k8s readiness watcher of %s %s error: %s" % (kind, cluster, e))
+                time.sleep(1)
+
+            self.__expire_waits()
+
+    def __on_event(self, cluster, kind, event):
+        obj = event["object"]
+        name = obj.metadata.name
+        available = event["type"] != "DELETED" and is_available(kind, obj)
+
+        ready_waits = []
+        with self.__lock:
+            if not available:
+                self.__available[(cluster, kind)].discard(name)
+                return
+
+            self.__available[(cluster, kind)].add(name)
+            for key in self.__waiting.pop((cluster, kind, name), set()):
+                wait = self.__waits[key]
+                wait.resources.discard((kind, name))
+                if not wait.resources:
+                    self.__waits.pop(key)
+                    ready_waits.append(wait)
+
+        for wait in ready_waits:
+            self.__fire(wait.callback, wait.key)
+
+    def __expire_waits(self):
+        now = time.time()
+        with self.__lock:
+            expired = [w for w in list(self.__waits.values()) if w.deadline < now]
+            for wait in expired:
+                self.__waits.pop(wait.key)
+                self.__stop_waiting(wait)
+
+        for wait in expired:
+            self.log.warn("k8s resources of %s not ready in time: %s" % (wait.key, list(wait.resources)))
+            if wait.on_timeout:
+                self.__fire(wait.on_timeout, wait.key)
+
+    def __stop_waiting(self, wait):
+        for kind, name in wait.resources:
+            keys = self.__waiting.get((wait.cluster, kind, name))
+            if keys is None:
+                continue
+            keys.discard(wait.key)
+            if not keys:
+                self.__waiting.pop((wait.cluster, kind, name))
+
+    def __fire(self, func, key):
+        try:
+            func(key)
+        except Exception as e:
+            self.log.error("k8s readiness callback of %s error: %s" % (key, e))
@@ -3,6 +3,6 @@
 This file is covered by the LICENSING file in the root of this project.
 """
 
-__all__ = ["db", "client"]
+__all__ = ["db", "client", "query_profiler"]
 
-from .database import db, client
+from .database import db, client, query_profiler
@@ -1,6 +1,7 @@
 from mongoengine import connect
 
 from hackathon.hmongo.models import User
+from hackathon.hmongo.profiler import QueryProfiler
 from hackathon.util import safe_get_config
 from hackathon.config import Config
 
@@ -8,8 +9,11 @@ mongodb_host = Config.get("scheduler").get("host")
 mongodb_port = Config.get("scheduler").get("port")
 ohp_db = Config.get("scheduler").get("database")
 
+# listeners of a mongo client can't be added once it's created, so the profiler must be created first
+query_profiler = QueryProfiler()
+
 # mongodb client
-client = connect(ohp_db, host=mongodb_host, port=mongodb_port)
+client = connect(ohp_db, host=mongodb_host, port=mongodb_port, event_listeners=[query_profiler])
 
 # mongodb collection for OHP, authentication disabled for now.
 db = client[ohp_db]
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+This file is covered by the LICENSING file in the root of this project.
+"""
+
+from bson import DBRef
+from flask import g, has_app_context
+from mongoengine import ReferenceField, DoesNotExist
+from mongoengine.base import BaseDocument
+
+from hackathon.log import log
+
+__all__ = ["IdentityMap", "HReferenceField", "current_identity_map", "prefetch", "init_identity_map"]
+
+
+class IdentityMap(object):
+    """Documents loaded by reference in one request, at most one instance per (collection, id)
+
+    A reference dereferenced more than once in a request, e.g. the leader of many teams, is loaded from DB only once.
+    Documents are shared by all references to them in the request, so don't modify a referenced document unless you
+    mean to modify it for the whole request.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.hits = 0
+        self.loaded = 0
+        self.__documents = {}  # (collection name, id) -> document
+
+    def get(self, document_class, pk):
+        """Return the document of pk, load it from DB if not in map
+
+        :type document_class: class
+        :param document_class: class of the referenced document
+
+        :raise DoesNotExist if document not found
+        """
+        doc = self.load(document_class, [pk]).get(pk)
+        if doc is None:
+            raise DoesNotExist("Trying to dereference unknown document %s(%s)" % (document_class.__name__, pk))
+        return doc
+
+    def load(self, document_class, pks):
+        """Return documents of pks, those not in map are loaded with one query
+
+        :type document_class: class
+        :param document_class: class of the referenced documents
+
+        :type pks: list
+        :param pks: ids of documents
+
+        :rtype: dict
+        :return {id: document}, ids not found are absent
+        """
+        collection = document_class._get_collection_name()
+        result = {}
+        missing = []
+        for pk in set(pks):
+            doc = self.__documents.get((collection, pk))
+            if doc is None:
+                missing.append(pk)
+            else:
+                result[pk] = doc
+        self.hits += len(result)
+
+        if missing:
+            self.queries += 1
+            # query by _id only, the same as mongoengine dereferences a DBRef
+            for son in document_class._get_collection().find({"_id": {"$in": missing}}):
+                doc = document_class._from_son(son)
+                self.__documents[(collection, doc.pk)] = doc
+                result[doc.pk] = doc
+                self.loaded += 1
+
+        return result
+
+    def __len__(self):
+        return len(self.__documents)
+
+
+def current_identity_map():
+    """Return the identity map of current request, None if not in a request"""
+    if has_app_context():
+        return g.get("identity_map")
+    return None
+
+
+class HReferenceField(ReferenceField):
+    """ReferenceField that dereferences through the identity map of current request if any"""
+
+    def __get__(self, instance, owner):
+        if instance is not None:
+            value = instance._data.get(self.name)
+            identity_map = current_identity_map()
+            if identity_map is not None and isinstance(value, DBRef) and \
+                    instance._fields[self.name]._auto_dereference:
+                instance._data[self.name] = identity_map.get(self.document_type, value.id)
+
+        return super(HReferenceField, self).__get__(instance, owner)
+
+
+def prefetch(documents, *paths):
+    """Load references of a result set in batch, like select_related but across queries of a request
+
+    For each path, the references of all documents are loaded with one query per document class, so that accessing
+    them later doesn't query DB. Paths can go through embedded documents, lists and references prefetched by a
+    previous path, e.g. prefetch(teams, "leader", "members.user").
+
+    :type documents: list
+    :param documents: documents of a result set
+
+    :type paths: str
+    :param paths: dotted paths of reference fields
+
+    :rtype: list
+    :return documents, as a list
+    """
+    documents = list(documents)
+    identity_map = current_identity_map() or IdentityMap()
+
+    for path in paths:
+        names = path.split(".")
+        holders = documents
+        for name in names[:-1]:
+            holders = __children(holders, name)
+
+        refs = {}  # document class -> [(holder, field name, id)]
+        for holder in holders:
+            field = holder._fields.get(names[-1])
+            value = holder._data.get(names[-1])
+            if isinstance(field, ReferenceField) and isinstance(value, DBRef):
+                refs.setdefault(field.document_type, []).append((holder, names[-1], value.id))
+
+        for document_class, items in list(refs.items()):
+            loaded = identity_map.load(document_class, [pk for _, _, pk in items])
+            for holder, name, pk in items:
+                if pk in loaded:
+                    # set to _data directly so that the field isn't marked as changed
+                    holder._data[name] = loaded[pk]
+
+    return documents
+
+
+def __children(holders, name):
+    children = []
+    for holder in holders:
+        value = holder._data.get(name)
+        values = value if isinstance(value, list) else [value]
+        children.extend(v for v in values if isinstance(v, BaseDocument))
+    return children
+
+
+def init_identity_map(app):
+    """Create an identity map for each request and log its counters when the request ends"""
+
+    @app.before_request
+    def begin_identity_map():
+        g.identity_map = IdentityMap()
+
+    @app.teardown_request
+    def end_identity_map(exception=None):
+        identity_map = g.pop("identity_map", None)
+        if identity_map is not None and identity_map.queries:
+            log.debug("identity map: %d reference queries loaded %d documents, %d loads served from map" % (
+                identity_map.queries, identity_map.loaded, identity_map.hits))
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+This file is covered by the LICENSING file in the root of this project.
+"""
+
+from bson import ObjectId
+
+from hackathon.util import get_now
+from hackathon.constants import EStatus, HACK_USER_TYPE, HACK_USER_STATUS, HACK_STATUS, HACKATHON_STAT
+from hackathon.hmongo import models
+from hackathon.hmongo.models import HDocumentBase, UserHackathon, Team, Experiment, HackathonNotice, HackathonStat, \
+    UserToken, User, Hackathon
+
+__all__ = ["get_models", "create_indexes", "register_query_shape", "audit_query_shapes"]
+
+# name -> function that builds the queryset of a query shape, values in it don't matter
+query_shapes = {}
+
+
+def get_models():
+    """Return all document classes that own a collection
+
+    :rtype: list
+    """
+    return [cls for cls in list(vars(models).values())
+            if isinstance(cls, type) and issubclass(cls, HDocumentBase) and not cls._meta.get("abstract")]
+
+
+def create_indexes():
+    """Create the indexes declared in meta of all models in background, so that they can be created online
+
+    Existing indexes are not touched, an index that differs from the existing one of the same name fails.
+
+    :rtype: dict
+    :return {collection name: [index names]}
+    """
+    result = {}
+    for cls in get_models():
+        cls.ensure_indexes()
+        result[cls._get_collection_name()] = sorted(cls._get_collection().index_information().keys())
+    return result
+
+
+def register_query_shape(name, build):
+    """Register a query shape to be audited
+
+    :type name: str|unicode
+    :param name: name of the shape, e.g. "UserHackathon(hackathon, user)"
+
+    :type build: function
+    :param build: function without parameters that returns the queryset of the shape
+    """
+    query_shapes[name] = build
+
+
+def audit_query_shapes():
+    """Explain every registered query shape and flag those that scan the whole collection
+
+    :rtype: list
+    :return [{"name": name, "stages": [stages of winning plan], "collscan": bool}] of all shapes
+    """
+    report = []
+    for name, build in sorted(query_shapes.items()):
+        plan = build().explain()
+        winning_plan = plan.get("queryPlanner", {}).get("winningPlan", {})
+        stages = __get_stages(winning_plan)
+        report.append({
+            "name": name,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages
+        })
+    return report
+
+
+def __get_stages(plan):
+    stages = [plan["stage"]] if "stage" in plan else []
+    for key in ["inputStage", "queryPlan"]:
+        if key in plan:
+            stages.extend(__get_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(__get_stages(child))
+    return stages
+
+
+# hottest access paths
+register_query_shape("UserHackathon(hackathon, user)",
+                     lambda: UserHackathon.objects(hackathon=ObjectId(), user=ObjectId()))
+register_query_shape("UserHackathon(hackathon, role, status)",
+                     lambda: UserHackathon.objects(hackathon=ObjectId(), role=HACK_USER_TYPE.COMPETITOR,
+                                                   status__in=[HACK_USER_STATUS.AUTO_PASSED,
+                                                               HACK_USER_STATUS.AUDIT_PASSED]))
+register_query_shape("UserHackathon(user, role)",
+                     lambda: UserHackathon.objects(user=ObjectId(), role=HACK_USER_TYPE.ADMIN))
+register_query_shape("Team(members.user, hackathon)",
+                     lambda: Team.objects(members__user=ObjectId(), hackathon=ObjectId()))
+register_query_shape("Team(hackathon).order_by(name)",
+                     lambda: Team.objects(hackathon=ObjectId()).order_by("name"))
+register_query_shape("Experiment(hackathon, template, status, user)",
+                     lambda: Experiment.objects(hackathon=ObjectId(), template=ObjectId(), status=EStatus.RUNNING,
+                                                user=None))
+register_query_shape("Experiment(status, hackathon, user)",
+                     lambda: Experiment.objects(status__in=[EStatus.RUNNING, EStatus.STARTING], hackathon=ObjectId(),
+                                                user=ObjectId()))
+register_query_shape("Experiment(hackathon, status, create_time)",
+                     lambda: Experiment.objects(hackathon=ObjectId(), status=EStatus.RUNNING,
+                                                create_time__lt=get_now()))
+register_query_shape("Experiment(virtual_environments.name)",
+                     lambda: Experiment.objects(virtual_environments__name="name"))
+register_query_shape("HackathonNotice(receiver, is_read).order_by(-update_time)",
+                     lambda: HackathonNotice.objects(receiver=ObjectId(), is_read=False).order_by("-update_time"))
+register_query_shape("HackathonNotice(hackathon).order_by(-update_time)",
+                     lambda: HackathonNotice.objects(hackathon=ObjectId()).order_by("-update_time"))
+register_query_shape("HackathonStat(hackathon, type)",
+                     lambda: HackathonStat.objects(hackathon=ObjectId(), type=HACKATHON_STAT.REGISTER))
+register_query_shape("Hackathon(status).order_by(-register_count)",
+                     lambda: Hackathon.objects(status=HACK_STATUS.ONLINE).order_by("-register_count", "-id"))
+register_query_shape("UserToken(token)",
+                     lambda: UserToken.objects(token="token"))
+register_query_shape("User(online, last_active_time)",
+                     lambda: User.objects(online=True, last_active_time__lt=get_now()))
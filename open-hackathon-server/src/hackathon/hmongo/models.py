@@ -6,11 +6,12 @@ This file is covered by the LICENSING file in the root of this project.
 import hashlib
 from mongoengine import QuerySet, DateTimeField, DynamicDocument, EmbeddedDocument, StringField, \
     BooleanField, IntField, DynamicEmbeddedDocument, EmbeddedDocumentListField, URLField, ListField, \
-    EmbeddedDocumentField, ReferenceField, UUIDField, DictField, DynamicField, PULL
+    EmbeddedDocumentField, UUIDField, DictField, DynamicField, PULL
 
 from hackathon.util import get_now, make_serializable
-from hackathon.constants import TEMPLATE_STATUS, HACK_USER_TYPE, VE_PROVIDER
-from hackathon.hmongo.pagination import Pagination
+from hackathon.constants import TEMPLATE_STATUS, HACK_USER_TYPE, VE_PROVIDER, NOTIFICATION_STATUS, IMAGE_PULL_STATUS
+from hackathon.hmongo.pagination import Pagination, KeysetPagination, TOTAL
+from hackathon.hmongo.identity_map import HReferenceField
 from hackathon import app
 
 
@@ -33,8 +34,16 @@ class HQuerySet(QuerySet):
     """add some handy helpers on the default query set from mongoengine
     """
 
-    def paginate(self, page, per_page):
-        return Pagination(self, page, per_page)
+    def paginate(self, page, per_page, after=None, total=None):
+        """Return a page of the query
+
+        Offset pagination by page number unless `after` is given, in which case keyset pagination starts after the
+        cursor, see KeysetPagination. `total` is one of TOTAL, by default exact for offset pagination and estimated
+        for keyset pagination.
+        """
+        if after is not None:
+            return KeysetPagination(self, per_page, after, total or TOTAL.ESTIMATED)
+        return Pagination(self, page, per_page, total or TOTAL.EXACT)
 
 
 class HDocumentBase(DynamicDocument):
@@ -48,7 +57,9 @@ class HDocumentBase(DynamicDocument):
     meta = {
         'allow_inheritance': True,
         'abstract': True,
-        'queryset_class': HQuerySet}
+        'queryset_class': HQuerySet,
+        # build indexes without blocking the collection, see hackathon.hmongo.indexes
+        'index_background': True}
     unsafe_columns = []
 
     def __init__(self, **kwargs):
@@ -101,6 +112,7 @@ class User(HDocumentBase):
     access_token = StringField(max_length=1024)
     online = BooleanField(default=False)
     last_login_time = DateTimeField()
+    last_active_time = DateTimeField()  # maintained by PresenceTracker, precise to presence.slot_seconds
     login_times = IntField(default=1)  # a new user usually added upon whose first login, by default 1 thus
 
     unsafe_columns = ["password"]
@@ -111,7 +123,9 @@ class User(HDocumentBase):
                 # default unqiue is not sparse, so we have to set it by ourselves
                 "fields": ["provider", "openid"],
                 "unique": True,
-                "sparse": True}]}
+                "sparse": True},
+            # sweep online users by last activity
+            ["online", "last_active_time"]]}
 
     def __init__(self, **kwargs):
         super(User, self).__init__(**kwargs)
@@ -132,7 +146,7 @@ class User(HDocumentBase):
 
 class UserToken(HDocumentBase):
     token = StringField(required=True)
-    user = ReferenceField(User)
+    user = HReferenceField(User)
     issue_date = DateTimeField(default=get_now())
     expire_date = DateTimeField(required=True)
 
@@ -155,7 +169,7 @@ class K8sCluster(DynamicEmbeddedDocument):
     token = StringField(required=True)
     namespace = StringField(default="default")
     gateway = ListField()
-    creator = ReferenceField(User)
+    creator = HReferenceField(User)
 
 
 class NetworkConfigTemplate(HDocumentBase):
@@ -184,7 +198,7 @@ class Template(HDocumentBase):
     network_configs = ListField(NetworkConfigTemplate)
 
     virtual_environment_count = IntField(min_value=0, required=True)
-    creator = ReferenceField(User)
+    creator = HReferenceField(User)
 
     def __init__(self, **kwargs):
         super(Template, self).__init__(**kwargs)
@@ -266,14 +280,14 @@ class Hackathon(HDocumentBase):
     description = StringField()
     banners = ListField()
     status = IntField(default=0)  # 0-new 1-online 2-offline 3-apply-online
-    creator = ReferenceField(User)
+    creator = HReferenceField(User)
     config = DictField()  # max_enrollment, auto_approve, login_provider
     type = IntField(default=1)  # enum.HACK_TYPE
     organizers = EmbeddedDocumentListField(Organization)
     tags = ListField()
     awards = EmbeddedDocumentListField(Award)
-    templates = ListField(ReferenceField(Template, reverse_delete_rule=PULL))  # templates for hackathon
-    azure_keys = ListField(ReferenceField(AzureKey))
+    templates = ListField(HReferenceField(Template, reverse_delete_rule=PULL))  # templates for hackathon
+    azure_keys = ListField(HReferenceField(AzureKey))
 
     event_start_time = DateTimeField()
     event_end_time = DateTimeField()
@@ -283,13 +297,26 @@ class Hackathon(HDocumentBase):
     judge_end_time = DateTimeField()
     archive_time = DateTimeField()
 
+    # denormalized count of HackathonStat whose type is HACKATHON_STAT.REGISTER, for ranking of hot hackathons.
+    # Maintained by HackathonManager.update_hackathon_stat/increase_hackathon_stat
+    register_count = IntField(default=0)
+
+    meta = {
+        "indexes": [
+            {
+                "fields": ["-register_count", "-id"]
+            },
+            {
+                "fields": ["status", "-register_count", "-id"]
+            }]}
+
     def __init__(self, **kwargs):
         super(Hackathon, self).__init__(**kwargs)
 
 
 class UserHackathon(HDocumentBase):
-    user = ReferenceField(User)
-    hackathon = ReferenceField(Hackathon)
+    user = HReferenceField(User)
+    hackathon = HReferenceField(Hackathon)
     role = IntField(default=HACK_USER_TYPE.COMPETITOR)  # 0-visitor 1-admin 2-judge 3-competitor
     status = IntField()  # 0-not approved user 1-approved user 2-refused user 3-auto approved user
     like = BooleanField(default=True)
@@ -297,14 +324,32 @@ class UserHackathon(HDocumentBase):
     remark = StringField()
     deleted = BooleanField(default=False)
 
+    meta = {
+        "indexes": [
+            # registrations of a hackathon by role and status, e.g. counting approved competitors
+            ["hackathon", "role", "status"],
+            # registration of a user in a hackathon
+            ["hackathon", "user"],
+            # hackathons joined or administrated by a user
+            ["user", "role"]]}
+
     def __init__(self, **kwargs):
         super(UserHackathon, self).__init__(**kwargs)
 
 
 class HackathonStat(HDocumentBase):
     type = StringField()  # class HACKATHON_STAT
-    count = IntField(min_value=0)
-    hackathon = ReferenceField(Hackathon)
+    # no min_value, which would reject `$inc` by a negative delta. HackathonManager keeps it from going below zero
+    count = IntField()
+    hackathon = HReferenceField(Hackathon)
+
+    meta = {
+        "indexes": [
+            {
+                # one record per stat type of a hackathon so that counters can be upserted by `$inc`
+                "fields": ["hackathon", "type"],
+                "unique": True,
+                "cls": False}]}
 
 
 class HackathonNotice(HDocumentBase):
@@ -313,15 +358,49 @@ class HackathonNotice(HDocumentBase):
     content = StringField()
     related_id = DynamicField()
     link = StringField()
-    creator = ReferenceField(User)
-    hackathon = ReferenceField(Hackathon)
-    receiver = ReferenceField(User)
+    creator = HReferenceField(User)
+    hackathon = HReferenceField(Hackathon)
+    receiver = HReferenceField(User)
     is_read = BooleanField(default=False)
 
+    meta = {
+        "indexes": [
+            # notices of a user, unread first, latest first
+            ["receiver", "is_read", "-update_time"],
+            # notices of a hackathon, latest first
+            ["hackathon", "-update_time"]]}
+
     def __init__(self, **kwargs):
         super(HackathonNotice, self).__init__(**kwargs)
 
 
+class Notification(HDocumentBase):
+    """A message of the outbox, see hackathon.notify.NotificationOutbox"""
+    channel = StringField(required=True)  # class NOTIFICATION_CHANNEL
+    payload = DictField()  # arguments of the send method of the channel
+    dedup_key = StringField()
+    status = IntField(default=NOTIFICATION_STATUS.PENDING)  # class NOTIFICATION_STATUS
+    attempts = IntField(default=0)
+    next_attempt_time = DateTimeField()
+    claim = StringField()  # token of the dispatch that claimed it last
+    sent_time = DateTimeField()
+    last_error = StringField()
+
+    meta = {
+        "indexes": [
+            # notifications due to send
+            ["status", "next_attempt_time"],
+            {
+                # the same notification is enqueued once
+                "fields": ["dedup_key"],
+                "unique": True,
+                "sparse": True,
+                "cls": False}]}
+
+    def __init__(self, **kwargs):
+        super(Notification, self).__init__(**kwargs)
+
+
 class TeamWork(EmbeddedDocument):
     id = UUIDField(required=True)
     description = StringField()
@@ -335,32 +414,39 @@ class TeamScore(EmbeddedDocument):
     score = IntField(required=True, min_value=0)
     reason = StringField()
     score_date = DateTimeField(default=get_now())
-    judge = ReferenceField(User)
+    judge = HReferenceField(User)
 
 
 class TeamMember(EmbeddedDocument):
     join_time = DateTimeField()
     status = IntField()  # 0:unaudit ,1:audit_passed, 2:audit_refused
-    user = ReferenceField(User)
+    user = HReferenceField(User)
 
 
 class Team(HDocumentBase):
     name = StringField(required=True)
     description = StringField()
     logo = StringField()
-    leader = ReferenceField(User)
+    leader = HReferenceField(User)
     cover = StringField()
     project_name = StringField()
     project_description = StringField()
     dev_plan = StringField()
-    hackathon = ReferenceField(Hackathon)
+    hackathon = HReferenceField(Hackathon)
     works = EmbeddedDocumentListField(TeamWork)
     scores = EmbeddedDocumentListField(TeamScore)
     members = EmbeddedDocumentListField(TeamMember)
     awards = ListField()  # list of uuid. UUID reference class Award-id
     assets = DictField()  # assets for team
-    azure_keys = ListField(ReferenceField(AzureKey))
-    templates = ListField(ReferenceField(Template))  # templates for team
+    azure_keys = ListField(HReferenceField(AzureKey))
+    templates = ListField(HReferenceField(Template))  # templates for team
+
+    meta = {
+        "indexes": [
+            # team of a user in a hackathon
+            ["members.user", "hackathon"],
+            # teams of a hackathon by name
+            ["hackathon", "name"]]}
 
     def __init__(self, **kwargs):
         super(Team, self).__init__(**kwargs)
@@ -378,12 +464,36 @@ class DockerHostServer(HDocumentBase):
     is_auto = BooleanField(default=False)  # 0-started manually 1-started by OHP server
     state = IntField(default=0)  # 0-VM starting, 1-docker init, 2-docker API ready, 3-unavailable
     disabled = BooleanField(default=False)  # T-disabled by manager, F-available
-    hackathon = ReferenceField(Hackathon)
+    hackathon = HReferenceField(Hackathon)
 
     def __init__(self, **kwargs):
         super(DockerHostServer, self).__init__(**kwargs)
 
 
+class DockerImagePull(HDocumentBase):
+    """The latest pull of an image on a docker host, see hackathon.docker.image_puller.ImagePullPlanner"""
+    hackathon = HReferenceField(Hackathon)
+    host = HReferenceField(DockerHostServer, required=True)
+    image = StringField(required=True)
+    status = IntField(default=IMAGE_PULL_STATUS.PULLING)  # class IMAGE_PULL_STATUS
+    progress = IntField(default=0)  # percent of bytes downloaded
+    error = StringField()
+    start_time = DateTimeField()
+    end_time = DateTimeField()
+
+    meta = {
+        "indexes": [
+            {
+                # one record per image of a host, so that two pulls of the same image never run at the same time
+                "fields": ["host", "image"],
+                "unique": True,
+                "cls": False},
+            ["hackathon", "status"]]}
+
+    def __init__(self, **kwargs):
+        super(DockerImagePull, self).__init__(**kwargs)
+
+
 class PortBinding(DynamicEmbeddedDocument):
     # for simplicity, the port won't be released until the corresponding container removed(not stopped).
     # that means a port occupied by stopped container won't be allocated to new container. So it's possible to start the
@@ -400,7 +510,7 @@ class DockerContainer(DynamicEmbeddedDocument):
     name = StringField(required=True, unique=True)
     image = StringField()
     container_id = StringField()
-    host_server = ReferenceField(DockerHostServer)
+    host_server = HReferenceField(DockerHostServer)
     port_bindings = EmbeddedDocumentListField(PortBinding, default=[])
 
 
@@ -422,7 +532,7 @@ class AzureCloudService(DynamicEmbeddedDocument):
     location = StringField()
     # ACSStatus in enum.py
     status = StringField()
-    azure_key = ReferenceField(AzureKey)
+    azure_key = HReferenceField(AzureKey)
     deletable = BooleanField()  # F-cannot delete T-can be deleted
 
 
@@ -487,10 +597,24 @@ class VirtualEnvironment(DynamicEmbeddedDocument):
 class Experiment(HDocumentBase):
     status = IntField()  # EStatus in enum.py
     last_heart_beat_time = DateTimeField()
-    template = ReferenceField(Template)
-    user = ReferenceField(User)
-    hackathon = ReferenceField(Hackathon)
+    template = HReferenceField(Template)
+    user = HReferenceField(User)
+    hackathon = HReferenceField(Hackathon)
     virtual_environments = EmbeddedDocumentListField(VirtualEnvironment, default=[])
+    claim_time = DateTimeField()  # when a pre-allocated experiment is assigned to user
+
+    meta = {
+        "indexes": [
+            {
+                # to claim a pre-allocated experiment and to count the warm pool
+                "fields": ["hackathon", "template", "status", "user"]
+            },
+            # running or starting experiment of a user
+            ["hackathon", "user", "status"],
+            # experiments of a hackathon by status, e.g. to recycle
+            ["hackathon", "status", "create_time"],
+            # experiment of a guacamole connection
+            ["virtual_environments.name"]]}
 
     def __init__(self, **kwargs):
         super(Experiment, self).__init__(**kwargs)
@@ -5,17 +5,49 @@ This file is covered by the LICENSING file in the root of this project.
 
 import math
 import sys
+import base64
 
+from bson import json_util
 from flask import abort
 
 from mongoengine.queryset import QuerySet
 
-__all__ = ("Pagination")
+from hackathon.util import safe_get_config
+
+__all__ = ("Pagination", "KeysetPagination", "TOTAL")
+
+
+class TOTAL:
+    """How the total of a pagination is counted"""
+    EXACT = "exact"  # count() of the query
+    ESTIMATED = "estimated"  # metadata count if not filtered, otherwise count no more than "pagination.count_limit"
+    NONE = "none"  # not counted, total is None
+
+
+def count_total(iterable, total):
+    """Count items of iterable per mode of TOTAL
+
+    :rtype: int
+    :return count of items, None if total is TOTAL.NONE
+    """
+    if total == TOTAL.NONE:
+        return None
+    if not isinstance(iterable, QuerySet):
+        return len(iterable)
+    if total == TOTAL.EXACT:
+        return iterable.count(with_limit_and_skip=False)
+
+    collection = iterable._document._get_collection()
+    query = iterable._query
+    if not [k for k in query if k != "_cls"]:
+        return collection.estimated_document_count()
+    return collection.count_documents(query, limit=safe_get_config("pagination.count_limit", 10000))
 
 
 class Pagination(object):
+    """Offset pagination, page N skips the items of the N-1 pages before it"""
 
-    def __init__(self, iterable, page, per_page):
+    def __init__(self, iterable, page, per_page, total=TOTAL.EXACT):
 
         if page < 1:
             abort(404)
@@ -23,25 +55,21 @@ class Pagination(object):
         self.iterable = iterable
         self.page = page
         self.per_page = per_page
-
-        if isinstance(iterable, QuerySet):
-            self.total = iterable.count()
-        else:
-            self.total = len(iterable)
+        self.next_cursor = None
+        self.total = count_total(iterable, total)
 
         start_index = (page - 1) * per_page
         end_index = page * per_page
 
-        self.items = iterable[start_index:end_index]
-        if isinstance(self.items, QuerySet):
-            self.items = self.items.select_related()
+        # references are loaded on demand through the identity map of request instead of select_related()
+        self.items = list(iterable[start_index:end_index])
         if not self.items and page != 1:
             abort(404)
 
     @property
     def pages(self):
         """The total number of pages"""
-        return int(math.ceil(self.total / float(self.per_page)))
+        return int(math.ceil((self.total or 0) / float(self.per_page)))
 
     def prev(self, error_out=False):
         """Returns a :class:`Pagination` object for the previous page."""
@@ -118,3 +146,72 @@ class Pagination(object):
                 last = num
         if last != self.pages:
             yield None
+
+
+class KeysetPagination(object):
+    """Keyset pagination, a page starts after the sort key of the last item of the previous page
+
+    The cost of a page doesn't grow with its depth since it's an index range scan instead of skipping. The order of
+    the queryset is made unique by appending _id, and its sort keys must not be null. The cursor is opaque to clients,
+    pass `next_cursor` of a page as `after` to get the next page, an empty `after` for the first page.
+
+    :Example:
+        pagination = Notice.objects(receiver=user).order_by("-update_time").paginate(1, 20, after=args.get("after"))
+        pagination.items, pagination.next_cursor
+    """
+
+    def __init__(self, queryset, per_page, after=None, total=TOTAL.ESTIMATED):
+        if per_page < 1:
+            abort(400)
+
+        self.per_page = per_page
+        self.page = None
+        self.total = count_total(queryset, total)
+
+        ordering = list(queryset._ordering or [])
+        if "_id" not in [key for key, _ in ordering]:
+            ordering.append(("_id", ordering[-1][1] if ordering else 1))
+        queryset = queryset.order_by(*[("+" if direction > 0 else "-") + key for key, direction in ordering])
+
+        if after:
+            queryset = queryset.filter(__raw__=self.__after_condition(ordering, self.decode_cursor(after)))
+
+        items = list(queryset.limit(per_page + 1))
+        self.has_next = len(items) > per_page
+        self.items = items[:per_page]
+        self.next_cursor = self.encode_cursor(self.__sort_values(self.items[-1], ordering)) if self.has_next else None
+
+    @staticmethod
+    def encode_cursor(values):
+        return base64.urlsafe_b64encode(json_util.dumps(values).encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            return json_util.loads(base64.urlsafe_b64decode(str(cursor)).decode("utf-8"))
+        except Exception:
+            abort(400)
+
+    @staticmethod
+    def __sort_values(item, ordering):
+        son = item.to_mongo()
+        values = []
+        for key, _ in ordering:
+            value = son
+            for part in key.split("."):
+                value = value.get(part) if value is not None else None
+            values.append(value)
+        return values
+
+    @staticmethod
+    def __after_condition(ordering, values):
+        """(k1 > v1) or (k1 == v1 and k2 > v2) or ..., with < for descending keys"""
+        if len(values) != len(ordering):
+            abort(400)
+
+        conditions = []
+        for i, (key, direction) in enumerate(ordering):
+            condition = dict((k, values[j]) for j, (k, _) in enumerate(ordering[:i]))
+            condition[key] = {"$gt" if direction > 0 else "$lt": values[i]}
+            conditions.append(condition)
+        return {"$or": conditions}
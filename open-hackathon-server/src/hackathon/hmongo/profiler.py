@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+This file is covered by the LICENSING file in the root of this project.
+"""
+
+import time
+import threading
+from collections import deque
+
+from flask import request
+from pymongo import monitoring
+
+from hackathon.log import log
+from hackathon.util import safe_get_config
+from hackathon.constants import HEALTH, HEALTH_STATUS
+
+__all__ = ["QueryProfiler", "query_shape", "init_query_profiler"]
+
+# keys of a command that make up the shape of a query, values in them are replaced by "?"
+SHAPE_KEYS = ["filter", "query", "q", "sort", "pipeline", "updates", "deletes", "u"]
+
+
+def query_shape(command_name, command):
+    """Return the shape of a command, that is its collection and the structure of its conditions without values
+
+    :Example:
+        query_shape("find", {"find": "user", "filter": {"name": "a", "age": {"$gt": 1}}})
+        # "find user {'filter': {'name': '?', 'age': {'$gt': '?'}}}"
+    """
+
+    def normalize(value, level):
+        if level > 4:
+            return "..."
+        if isinstance(value, dict):
+            return dict((k, normalize(v, level + 1)) for k, v in list(value.items()))
+        if isinstance(value, (list, tuple)):
+            # all items of a list are supposed to be of the same shape
+            return [normalize(value[0], level + 1)] if value else []
+        return "?"
+
+    shape = dict((k, normalize(command[k], 0)) for k in SHAPE_KEYS if k in command)
+    return "%s %s %s" % (command_name, command.get(command_name), shape)
+
+
+class RequestProfile(object):
+    """Mongo commands issued by one API request"""
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.resource = None
+        self.start = time.time()
+        self.count = 0
+        self.total_ms = 0.0
+        self.slowest_ms = 0.0
+        self.slowest_shape = None
+
+    def dic(self):
+        return {
+            "request": "%s %s" % (self.method, self.path),
+            "resource": self.resource,
+            "elapsed_ms": round((time.time() - self.start) * 1000, 2),
+            "queries": self.count,
+            "query_ms": round(self.total_ms, 2),
+            "slowest_query_ms": round(self.slowest_ms, 2),
+            "slowest_query": self.slowest_shape
+        }
+
+
+class QueryProfiler(monitoring.CommandListener):
+    """Attribute every Mongo command to the API request and resource class that issued it
+
+    The listener is passed to the mongo client so it must be created before the client. pymongo calls it in the thread
+    that runs the command, so the profile of a request is kept in a thread local between begin() and end().
+
+    Requests that take more than "profiler.slow_request_ms" or issue more than "profiler.slow_request_queries"
+    commands are logged as warnings, and the last of them together with counters per resource are reported via
+    /health?q=query_profiler
+    """
+
+    def __init__(self):
+        self.enabled = safe_get_config("profiler.enabled", True)
+        self.slow_request_ms = safe_get_config("profiler.slow_request_ms", 1000)
+        self.slow_request_queries = safe_get_config("profiler.slow_request_queries", 100)
+        self.__local = threading.local()
+        # (connection id, request id) of command -> (profile, command name, command). Request ids are unique per
+        # connection only and listeners are called from the threads of all requests
+        self.__started = {}
+        self.__started_lock = threading.Lock()
+        self.__resources = {}  # resource -> counters
+        self.__slow_requests = deque(maxlen=safe_get_config("profiler.recent_slow_requests", 20))
+        self.__lock = threading.Lock()
+
+    def begin(self, method, path):
+        """Start profiling the request of current thread"""
+        if self.enabled:
+            self.__local.profile = RequestProfile(method, path)
+
+    def set_resource(self, resource):
+        """Set the resource class and method that handles the request of current thread, e.g. "UserResource.get" """
+        profile = self.current()
+        if profile:
+            profile.resource = resource
+
+    def current(self):
+        """Return the profile of the request of current thread, None if not profiling"""
+        return getattr(self.__local, "profile", None)
+
+    def end(self):
+        """Finish profiling the request of current thread
+
+        :rtype: RequestProfile
+        """
+        profile = self.current()
+        if profile is None:
+            return None
+        self.__local.profile = None
+
+        elapsed_ms = (time.time() - profile.start) * 1000
+        resource = profile.resource or "%s %s" % (profile.method, profile.path)
+        with self.__lock:
+            counters = self.__resources.setdefault(resource, {"requests": 0, "queries": 0, "query_ms": 0.0,
+                                                              "max_queries": 0})
+            counters["requests"] += 1
+            counters["queries"] += profile.count
+            counters["query_ms"] += profile.total_ms
+            counters["max_queries"] = max(counters["max_queries"], profile.count)
+
+        if elapsed_ms > self.slow_request_ms or profile.count > self.slow_request_queries:
+            detail = profile.dic()
+            with self.__lock:
+                self.__slow_requests.append(detail)
+            log.warn("slow request: %s" % detail)
+
+        return profile
+
+    def started(self, event):
+        profile = self.current()
+        if profile is not None:
+            with self.__started_lock:
+                self.__started[(event.connection_id, event.request_id)] = (profile, event.command_name, event.command)
+
+    def succeeded(self, event):
+        self.__finish(event)
+
+    def failed(self, event):
+        self.__finish(event)
+
+    def report_health(self):
+        with self.__lock:
+            resources = dict((r, dict(c, avg_queries=float(c["queries"]) / c["requests"]))
+                             for r, c in list(self.__resources.items()))
+            return {
+                HEALTH.STATUS: HEALTH_STATUS.OK,
+                "resources": resources,
+                "slow_requests": list(self.__slow_requests)
+            }
+
+    def __finish(self, event):
+        with self.__started_lock:
+            started = self.__started.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+
+        profile, command_name, command = started
+        duration_ms = event.duration_micros / 1000.0
+        profile.count += 1
+        profile.total_ms += duration_ms
+        if duration_ms >= profile.slowest_ms:
+            profile.slowest_ms = duration_ms
+            profile.slowest_shape = query_shape(command_name, command)
+
+
+def init_query_profiler(app, profiler):
+    """Profile every request of app"""
+
+    @app.before_request
+    def begin_query_profile():
+        profiler.begin(request.method, request.path)
+
+    @app.teardown_request
+    def end_query_profile(exception=None):
+        profiler.end()
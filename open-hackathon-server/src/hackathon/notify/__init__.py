@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""
+This file is covered by the LICENSING file in the root of this project.
+"""
+
+from hackathon.notify.outbox import NotificationOutbox
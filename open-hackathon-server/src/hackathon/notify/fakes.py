@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+This file is covered by the LICENSING file in the root of this project.
+
+Stand-ins of the email, SMS and voice verify services which record what is sent instead of talking to SMTP or HTTP
+servers, for tests and local development.
+
+:Example:
+    email = FakeEmail(fail_times=1)
+    outbox = NotificationOutbox(email=email, sms=FakeSms(), voice_verify=FakeVoiceVerify())
+    outbox.dispatch()
+    print(email.sent)
+"""
+
+from threading import Lock
+
+__all__ = ["FakeEmail", "FakeSms", "FakeVoiceVerify"]
+
+
+class FakeService(object):
+    """Record sent messages, the first `fail_times` messages fail"""
+
+    def __init__(self, fail_times=0):
+        self.fail_times = fail_times
+        self.sent = []
+        self.failed = []
+        self.lock = Lock()
+
+    def record(self, message):
+        with self.lock:
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                self.failed.append(message)
+                return False
+            self.sent.append(message)
+            return True
+
+
+class FakeEmail(FakeService):
+    """Stand-in of hackathon.util.Email, counts SMTP connections"""
+
+    def __init__(self, fail_times=0):
+        super(FakeEmail, self).__init__(fail_times)
+        self.connections = 0
+
+    def send_emails(self, sender, receivers, subject, content, cc=[], bcc=[], attachments=[]):
+        return self.send_batch([{"sender": sender, "receivers": receivers, "subject": subject,
+                                 "content": content}])[0] is None
+
+    def send_batch(self, messages):
+        with self.lock:
+            self.connections += 1
+        return [None if self.record(m) else "fake email fails" for m in messages]
+
+
+class FakeSms(FakeService):
+    """Stand-in of hackathon.util.Sms"""
+
+    def send_sms(self, receiver, template_id, content):
+        return self.record({"receiver": receiver, "template_id": template_id, "content": content})
+
+
+class FakeVoiceVerify(FakeService):
+    """Stand-in of hackathon.util.VoiceVerify"""
+
+    def send_voice_verify(self, receiver, content):
+        return self.record({"receiver": receiver, "content": content})
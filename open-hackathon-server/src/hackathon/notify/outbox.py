@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+This file is covered by the LICENSING file in the root of this project.
+"""
+
+import json
+import uuid
+import hashlib
+from datetime import timedelta
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+from mongoengine import Q
+from pymongo.errors import BulkWriteError
+
+from hackathon import Component, RequiredFeature
+from hackathon.util import get_now, safe_get_config
+from hackathon.constants import HEALTH, HEALTH_STATUS, NOTIFICATION_CHANNEL, NOTIFICATION_STATUS, HACK_USER_TYPE
+from hackathon.hmongo.models import Notification, UserHackathon, User
+
+__all__ = ["NotificationOutbox"]
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class NotificationOutbox(Component):
+    """Durable outbox of emails, SMS and voice verifications
+
+    Requests only insert notifications into the `notification` collection. The scheduler calls dispatch() every
+    "notification.interval_seconds" to send them in background:
+    - notifications due are claimed in batch of "notification.batch_size" for "notification.lease_seconds", so that
+      two dispatchers never send the same one, and those claimed by a dispatcher that crashed are sent again later
+    - they are sent by a pool of "notification.workers" threads, emails of a worker go through one SMTP connection
+    - a failed notification is retried with exponential backoff, and given up after "notification.max_attempts"
+    - a notification is dropped if the same one was enqueued in the last "notification.dedup_seconds", by a unique
+      dedup_key which callers can also specify
+    - an email to the admins of a hackathon is enqueued as one notification, and expanded to an email per admin when
+      dispatched, so that the request doesn't look up admins
+
+    :Example:
+        outbox = RequiredFeature("notification_outbox")
+
+        outbox.enqueue_email("sender@a.com", ["receiver@b.com"], "Hello", "<b>Hi!</b>")
+        outbox.enqueue_admins_email(hackathon.id, "sender@a.com", "Hello", "<b>Hi!</b>")
+    """
+
+    def __init__(self, email=None, sms=None, voice_verify=None, clock=get_now):
+        self.senders = {
+            NOTIFICATION_CHANNEL.EMAIL: email or RequiredFeature("email"),
+            NOTIFICATION_CHANNEL.SMS: sms or RequiredFeature("sms"),
+            NOTIFICATION_CHANNEL.VOICE_VERIFY: voice_verify or RequiredFeature("voice_verify")
+        }
+        # channels whose notifications are expanded to other notifications instead of sent
+        self.expanders = {
+            NOTIFICATION_CHANNEL.ADMINS_EMAIL: self.__expand_admins_email
+        }
+        self.clock = clock
+        self.batch_size = safe_get_config("notification.batch_size", 100)
+        self.max_attempts = safe_get_config("notification.max_attempts", 5)
+        self.backoff_seconds = safe_get_config("notification.backoff_seconds", 30)
+        self.max_backoff_seconds = safe_get_config("notification.max_backoff_seconds", 3600)
+        self.lease_seconds = safe_get_config("notification.lease_seconds", 300)
+        self.dedup_seconds = safe_get_config("notification.dedup_seconds", 3600)
+        self.workers = safe_get_config("notification.workers", 4)
+        self.__executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.__counters = {"enqueued": 0, "duplicates": 0, "sent": 0, "retried": 0, "failed": 0}
+        self.__lock = Lock()
+
+    def enqueue_email(self, sender, receivers, subject, content, dedup_key=None):
+        """Enqueue an email, see Email.send_emails for parameters
+
+        :rtype: bool
+        :return False if the same email was enqueued in the dedup window
+        """
+        payload = {"sender": sender, "receivers": receivers, "subject": subject, "content": content}
+        return self.enqueue(NOTIFICATION_CHANNEL.EMAIL, [payload], [dedup_key]) == 1
+
+    def enqueue_admins_email(self, hackathon_id, sender, subject, content, receivers_forced=None, dedup_key=None):
+        """Enqueue an email to every admin of a hackathon, admins are looked up when it's dispatched
+
+        :type hackathon_id: str|unicode|ObjectId
+        :param hackathon_id: id of the hackathon
+
+        :type receivers_forced: list
+        :param receivers_forced: receivers of one more email besides those of admins
+
+        :rtype: bool
+        :return False if the same email was enqueued in the dedup window
+        """
+        payload = {"hackathon_id": str(hackathon_id), "sender": sender, "subject": subject, "content": content,
+                   "receivers_forced": receivers_forced or []}
+        return self.enqueue(NOTIFICATION_CHANNEL.ADMINS_EMAIL, [payload], [dedup_key]) == 1
+
+    def enqueue_sms(self, receiver, template_id, content, dedup_key=None):
+        """Enqueue a SMS, see Sms.send_sms for parameters"""
+        payload = {"receiver": receiver, "template_id": template_id, "content": content}
+        return self.enqueue(NOTIFICATION_CHANNEL.SMS, [payload], [dedup_key]) == 1
+
+    def enqueue_voice_verify(self, receiver, content, dedup_key=None):
+        """Enqueue a voice verification, see VoiceVerify.send_voice_verify for parameters"""
+        payload = {"receiver": receiver, "content": content}
+        return self.enqueue(NOTIFICATION_CHANNEL.VOICE_VERIFY, [payload], [dedup_key]) == 1
+
+    def enqueue(self, channel, payloads, dedup_keys=None):
+        """Enqueue notifications of a channel with one insert
+
+        :type channel: str|unicode
+        :param channel: class NOTIFICATION_CHANNEL
+
+        :type payloads: list
+        :param payloads: keyword arguments of the send method of the channel, one per notification
+
+        :type dedup_keys: list
+        :param dedup_keys: key of each notification, a notification is dropped if its key was enqueued in the last
+            dedup_seconds. None for a key derived from the channel and the payload
+
+        :rtype: int
+        :return count of notifications inserted, duplicates excluded
+        """
+        if not payloads:
+            return 0
+
+        now = self.clock()
+        dedup_keys = dedup_keys or [None] * len(payloads)
+        docs = [Notification(channel=channel,
+                             payload=payload,
+                             dedup_key=key or self.__default_dedup_key(channel, payload),
+                             status=NOTIFICATION_STATUS.PENDING,
+                             next_attempt_time=now,
+                             create_time=now,
+                             update_time=now).to_mongo() for payload, key in zip(payloads, dedup_keys)]
+
+        duplicates = self.__insert(docs)
+        if duplicates:
+            # release keys enqueued before the dedup window, and insert those notifications again
+            keys = [doc["dedup_key"] for doc in duplicates]
+            window_start = now - timedelta(seconds=self.dedup_seconds)
+            if Notification.objects(dedup_key__in=keys, create_time__lte=window_start).update(unset__dedup_key=True):
+                duplicates = self.__insert(duplicates)
+
+        self.__count(enqueued=len(docs) - len(duplicates), duplicates=len(duplicates))
+        return len(docs) - len(duplicates)
+
+    def dispatch(self):
+        """Send notifications due until none left, called by scheduler"""
+        while True:
+            batch = self.__claim()
+            if batch:
+                self.__send(batch)
+            # notifications expanded from the batch are due at once
+            if len(batch) < self.batch_size and not [n for n in batch if n.channel in self.expanders]:
+                break
+
+    def report_health(self):
+        with self.__lock:
+            counters = dict(self.__counters)
+        counters["pending"] = Notification.objects(status=NOTIFICATION_STATUS.PENDING).count()
+        counters[HEALTH.STATUS] = HEALTH_STATUS.OK
+        return counters
+
+    def __insert(self, docs):
+        """Insert docs with one insert_many
+
+        :rtype: list
+        :return docs not inserted because of a duplicate dedup_key
+        """
+        try:
+            # unordered so that a duplicate doesn't stop the others
+            Notification._get_collection().insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if [err for err in errors if err.get("code") != DUPLICATE_KEY_ERROR]:
+                raise
+            return [docs[err["index"]] for err in errors]
+        return []
+
+    def __claim(self):
+        now = self.clock()
+        due = Q(status__in=[NOTIFICATION_STATUS.PENDING, NOTIFICATION_STATUS.SENDING], next_attempt_time__lte=now)
+        due_notifications = Notification.objects(due).only("id").order_by("next_attempt_time").limit(self.batch_size)
+        ids = [n.id for n in due_notifications]
+        if not ids:
+            return []
+
+        # those claimed by another dispatcher at the same time don't match `due` any more
+        claim = uuid.uuid1().hex
+        lease_until = now + timedelta(seconds=self.lease_seconds)
+        Notification.objects(Q(id__in=ids) & due).update(set__status=NOTIFICATION_STATUS.SENDING,
+                                                         set__next_attempt_time=lease_until,
+                                                         set__claim=claim)
+        return list(Notification.objects(claim=claim))
+
+    def __send(self, batch):
+        # split emails evenly among workers, a worker sends its emails through one connection
+        emails = [n for n in batch if n.channel == NOTIFICATION_CHANNEL.EMAIL]
+        chunk_size = max(1, -(-len(emails) // self.workers))
+        tasks = [(emails[i:i + chunk_size], self.__send_emails) for i in range(0, len(emails), chunk_size)]
+        tasks.extend(([n], self.expanders.get(n.channel, self.__send_one))
+                     for n in batch if n.channel != NOTIFICATION_CHANNEL.EMAIL)
+
+        futures = [(notifications, self.__executor.submit(func, notifications)) for notifications, func in tasks]
+        sent = []
+        for notifications, future in futures:
+            try:
+                errors = future.result()
+            except Exception as e:
+                errors = [str(e)] * len(notifications)
+            for notification, error in zip(notifications, errors):
+                if error is None:
+                    sent.append(notification.id)
+                else:
+                    self.__retry(notification, error)
+
+        if sent:
+            Notification.objects(id__in=sent).update(set__status=NOTIFICATION_STATUS.SENT,
+                                                     set__sent_time=self.clock(),
+                                                     inc__attempts=1,
+                                                     unset__last_error=True)
+            self.__count(sent=len(sent))
+
+    def __send_emails(self, notifications):
+        return self.senders[NOTIFICATION_CHANNEL.EMAIL].send_batch([n.payload for n in notifications])
+
+    def __send_one(self, notifications):
+        notification = notifications[0]
+        sender = self.senders.get(notification.channel)
+        if sender is None:
+            return ["unsupported channel %s" % notification.channel]
+
+        if notification.channel == NOTIFICATION_CHANNEL.SMS:
+            ok = sender.send_sms(**notification.payload)
+        else:
+            ok = sender.send_voice_verify(**notification.payload)
+        return [None if ok else "send %s fails" % notification.channel]
+
+    def __expand_admins_email(self, notifications):
+        # an email per admin, to primary emails of the admin or one of the others if no primary email
+        notification = notifications[0]
+        payload = dict(notification.payload)
+        hackathon_id = payload.pop("hackathon_id")
+        receivers_forced = payload.pop("receivers_forced", [])
+
+        admin_ids = [uh.user.id for uh in UserHackathon.objects(hackathon=hackathon_id, role=HACK_USER_TYPE.ADMIN)
+                     .only("user").no_dereference() if uh.user]
+        receivers = []
+        for admin in User.objects(id__in=admin_ids).only("emails"):
+            primary_emails = [email.email for email in admin.emails if email.primary_email]
+            nonprimary_emails = [email.email for email in admin.emails if not email.primary_email]
+            if primary_emails or nonprimary_emails:
+                receivers.append(primary_emails or nonprimary_emails[:1])
+        if receivers_forced:
+            receivers.append(receivers_forced)
+
+        # keyed by the notification expanded, so that expanding it again after a crash enqueues nothing more
+        self.enqueue(NOTIFICATION_CHANNEL.EMAIL,
+                     [dict(payload, receivers=r) for r in receivers],
+                     ["%s:%d" % (notification.id, i) for i in range(len(receivers))])
+        return [None]
+
+    def __retry(self, notification, error):
+        attempts = notification.attempts + 1
+        self.log.warn("send notification %s fails in attempt %d: %s" % (notification.id, attempts, error))
+        if attempts >= self.max_attempts:
+            Notification.objects(id=notification.id).update_one(set__status=NOTIFICATION_STATUS.FAILED,
+                                                                set__attempts=attempts,
+                                                                set__last_error=error)
+            self.__count(failed=1)
+            return
+
+        backoff = min(self.backoff_seconds * 2 ** (attempts - 1), self.max_backoff_seconds)
+        next_attempt_time = self.clock() + timedelta(seconds=backoff)
+        Notification.objects(id=notification.id).update_one(set__status=NOTIFICATION_STATUS.PENDING,
+                                                            set__attempts=attempts,
+                                                            set__last_error=error,
+                                                            set__next_attempt_time=next_attempt_time)
+        self.__count(retried=1)
+
+    def __default_dedup_key(self, channel, payload):
+        raw = json.dumps([channel, payload], sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def __count(self, **kwargs):
+        with self.__lock:
+            for key, value in list(kwargs.items()):
+                self.__counters[key] += value
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+This file is covered by the LICENSING file in the root of this project.
+"""
+
+import hashlib
+from threading import Lock
+
+import yaml
+from jinja2 import Template
+from cachetools import LRUCache
+
+from hackathon.util import safe_get_config
+
+__all__ = ["CompiledK8sTemplate", "CompiledTemplateCache", "compiled_templates"]
+
+# variables a k8s yaml template is rendered with, see K8STemplateUnit
+K8S_TEMPLATE_VARIABLES = ["expr_name", "created_at"]
+
+# two sets of sample values to verify a skeleton with, values of created_at look like time.time()
+SAMPLE_VALUES = [{"expr_name": "ohp-sample-a", "created_at": "1600000000.123"},
+                 {"expr_name": "ohp-sample-bb", "created_at": "1600000001.4567"}]
+
+
+class CompiledK8sTemplate(object):
+    """A k8s yaml template compiled once and rendered for every experiment
+
+    Besides the compiled Jinja template, the yaml is parsed once into a skeleton with placeholders in place of the
+    template variables, so that loading the resources of an experiment substitutes the placeholders in a copy of the
+    skeleton, instead of rendering and parsing the yaml again. A template whose variables change the structure or the
+    scalar types of the yaml, e.g. `replicas: {{ created_at }}`, has no skeleton and is rendered and parsed every time.
+    """
+
+    def __init__(self, yml_template):
+        self.template = Template(yml_template)
+        self.skeleton = self.__parse_skeleton()
+        self.__valid = None
+
+    def render(self, **kwargs):
+        """Render the yaml template
+
+        :rtype: str
+        """
+        return self.template.render(**kwargs)
+
+    def load(self, **kwargs):
+        """Return the yaml documents rendered with kwargs, as new objects that the caller can modify
+
+        :rtype: list
+        """
+        if self.skeleton is None:
+            return [d for d in yaml.safe_load_all(self.render(**kwargs)) if d]
+        return self.__substitute(self.skeleton, self.__placeholder_values(kwargs))
+
+    def is_valid(self):
+        """A template is valid if rendered differently for different experiments, computed once"""
+        if self.__valid is None:
+            self.__valid = self.render(**SAMPLE_VALUES[0]) != self.render(**SAMPLE_VALUES[1])
+        return self.__valid
+
+    def __parse_skeleton(self):
+        placeholders = dict((name, "__OHP_VAR_%s__" % name) for name in K8S_TEMPLATE_VARIABLES)
+        try:
+            skeleton = [d for d in yaml.safe_load_all(self.render(**placeholders)) if d]
+            for values in SAMPLE_VALUES:
+                expected = [d for d in yaml.safe_load_all(self.render(**values)) if d]
+                if self.__substitute(skeleton, self.__placeholder_values(values)) != expected:
+                    return None
+            return skeleton
+        except yaml.YAMLError:
+            return None
+
+    @staticmethod
+    def __placeholder_values(kwargs):
+        return [("__OHP_VAR_%s__" % name, str(kwargs.get(name, ""))) for name in K8S_TEMPLATE_VARIABLES]
+
+    @classmethod
+    def __substitute(cls, node, values):
+        """Deep copy node and replace placeholders in strings of it"""
+        if isinstance(node, dict):
+            return dict((cls.__substitute(k, values), cls.__substitute(v, values)) for k, v in list(node.items()))
+        if isinstance(node, list):
+            return [cls.__substitute(v, values) for v in node]
+        if isinstance(node, str) and "__OHP_VAR_" in node:
+            for placeholder, value in values:
+                node = node.replace(placeholder, value)
+        return node
+
+
+class CompiledTemplateCache(object):
+    """Bounded cache of CompiledK8sTemplate keyed by template id and the hash of template content
+
+    Since the content hash is part of the key, a template updated elsewhere is never served stale, invalidate() only
+    frees the entries of a template updated or deleted.
+    """
+
+    def __init__(self, max_size=None):
+        self.__cache = LRUCache(maxsize=max_size or safe_get_config("template.compiled_cache_size", 256))
+        self.__lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, template_id, yml_template):
+        """Return the compiled template of content yml_template, compile it if not cached
+
+        :type template_id: ObjectId|None
+        :param template_id: id of Template, None for template content not saved yet
+
+        :rtype: CompiledK8sTemplate
+        """
+        key = (template_id, hashlib.sha1(yml_template.encode("utf-8")).hexdigest())
+        with self.__lock:
+            compiled = self.__cache.get(key)
+            if compiled is not None:
+                self.hits += 1
+                return compiled
+            self.misses += 1
+
+        # compile outside the lock, the same template compiled by two threads at the same time is harmless
+        compiled = CompiledK8sTemplate(yml_template)
+        with self.__lock:
+            self.__cache[key] = compiled
+        return compiled
+
+    def invalidate(self, template_id):
+        """Remove compiled templates of template_id"""
+        with self.__lock:
+            for key in [k for k in self.__cache if k[0] == template_id]:
+                del self.__cache[key]
+
+    def stats(self):
+        with self.__lock:
+            return {
+                "size": len(self.__cache),
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+compiled_templates = CompiledTemplateCache()
@@ -23,10 +23,10 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 import time
-from jinja2 import Template
 
 from hackathon.template.template_constants import K8S_UNIT
 from hackathon.template.template_unit import TemplateUnit
+from hackathon.template.compiled_template import compiled_templates
 from hackathon.constants import VE_PROVIDER
 
 __all__ = ["K8STemplateUnit"]
@@ -37,17 +37,42 @@ class K8STemplateUnit(TemplateUnit):
     Smallest unit in k8s template
     """
 
-    def __init__(self, config):
+    def __init__(self, config, template_id=None):
         super(K8STemplateUnit, self).__init__(VE_PROVIDER.K8S)
 
         self.yml_template = config[K8S_UNIT.YAML_TEMPLATE]
+        self.template_id = template_id
         self.template_args = {}
 
+    @property
+    def compiled(self):
+        """The compiled template, shared by all units of the same template content
+
+        :rtype: CompiledK8sTemplate
+        """
+        return compiled_templates.get(self.template_id, self.yml_template)
+
     def gen_k8s_yaml(self, expr_name):
-        return Template(self.yml_template).render(**{
-            "expr_name": expr_name,
-            "created_at": "{}".format(time.time())
-        })
+        return self.compiled.render(**self.__variables(expr_name))
+
+    def gen_k8s_resources(self, expr_name):
+        """Return the resources of an experiment grouped by kind in lower case, e.g. {"deployment": [dict]}
+
+        Resources are new objects which can be modified by the caller.
+
+        :rtype: dict
+        """
+        resources = {}
+        for doc in self.compiled.load(**self.__variables(expr_name)):
+            resources.setdefault(str(doc.get("kind", "")).lower(), []).append(doc)
+        return resources
 
     def is_valid(self):
-        return self.gen_k8s_yaml("first") != self.gen_k8s_yaml("second")
+        return self.compiled.is_valid()
+
+    @staticmethod
+    def __variables(expr_name):
+        return {
+            "expr_name": expr_name,
+            "created_at": "{}".format(time.time())
+        }
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+This file is covered by the LICENSING file in the root of this project.
+"""
+
+from threading import Lock
+
+from cachetools import LRUCache
+
+from hackathon.util import safe_get_config
+
+__all__ = ["TemplateContentCache"]
+
+# estimated bytes of a TemplateContent besides its yaml content and docker image
+CONTENT_OVERHEAD_BYTES = 2048
+
+
+class TemplateContentCache(object):
+    """Parsed TemplateContent of templates, keyed by template id and update_time
+
+    A template updated gets a new update_time, so that its old content is never hit again and is evicted in LRU order.
+    Entries are weighed by the estimated size of their contents and the cache holds at most
+    "template.content_cache_bytes" of them.
+
+    TemplateContent objects are shared by all readers, don't modify them.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.__cache = LRUCache(maxsize=max_bytes or safe_get_config("template.content_cache_bytes", 16 * 1024 * 1024),
+                                getsizeof=lambda entry: entry[1])
+        self.__lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, template, load):
+        """Return the TemplateContent of template, load it if not cached
+
+        :type template: Template
+        :param template: the template document
+
+        :type load: function
+        :param load: function that takes template and returns its TemplateContent
+
+        :rtype: TemplateContent
+        """
+        key = (template.id, template.update_time)
+        with self.__lock:
+            entry = self.__cache.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        content = load(template)
+        if template.id is not None:
+            size = CONTENT_OVERHEAD_BYTES + len(template.content or "") + len(template.docker_image or "")
+            with self.__lock:
+                if size <= self.__cache.maxsize:
+                    self.__cache[key] = (content, size)
+        return content
+
+    def invalidate(self, template_id):
+        """Remove contents of all versions of template_id"""
+        with self.__lock:
+            for key in [k for k in self.__cache if k[0] == template_id]:
+                del self.__cache[key]
+
+    def stats(self):
+        with self.__lock:
+            requests = self.hits + self.misses
+            return {
+                "size": len(self.__cache),
+                "bytes": self.__cache.currsize,
+                "max_bytes": self.__cache.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": float(self.hits) / requests if requests else 0.0
+            }
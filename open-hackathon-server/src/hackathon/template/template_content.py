@@ -19,10 +19,11 @@ class TemplateContent:
     It's the only type that for template saving and loading.
     """
 
-    def __init__(self, name, description, environment_config):
+    def __init__(self, name, description, environment_config, template_id=None):
         self.name = name
         self.description = description
-        self.environment = self.__load_environment(environment_config)
+        self.template_id = template_id
+        self.environment = self.__load_environment(environment_config, template_id)
 
         self.provider = self.environment.provider
 
@@ -34,7 +35,7 @@ class TemplateContent:
     @classmethod
     def load_from_template(cls, template):
         env_cfg = template.unit_config()
-        return TemplateContent(template.name, template.description, env_cfg)
+        return TemplateContent(template.name, template.description, env_cfg, template.id)
 
     @property
     def docker_image(self):
@@ -71,15 +72,28 @@ class TemplateContent:
             return self.environment.is_valid() is True
 
     @classmethod
-    def __load_environment(cls, environment_config):
+    def __load_environment(cls, environment_config, template_id):
         provider = int(environment_config[TEMPLATE.VIRTUAL_ENVIRONMENT_PROVIDER])
         if provider == VE_PROVIDER.DOCKER:
             return DockerTemplateUnit(environment_config)
         elif provider == VE_PROVIDER.K8S:
-            return K8STemplateUnit(environment_config)
+            return K8STemplateUnit(environment_config, template_id)
         else:
             raise Exception("unsupported virtual environment provider")
 
+    def get_resources(self, expr_name):
+        """Return the k8s resources of an experiment grouped by kind in lower case
+
+        :type expr_name: str|unicode
+        :param expr_name: name of the experiment the template rendered for
+
+        :rtype: dict
+        :return {kind: [resource dict]}, resources are new objects every call
+        """
+        if self.provider != VE_PROVIDER.K8S:
+            return self.resource
+        return self.environment.gen_k8s_resources(expr_name)
+
     # todo delete
     def get_resource(self, resource_type):
         # always return a list of resource desc dict or empty
@@ -7,12 +7,14 @@ from werkzeug.exceptions import BadRequest, InternalServerError, Forbidden, NotF
 from mongoengine import Q
 
 from hackathon import Component, RequiredFeature
-from hackathon.constants import VE_PROVIDER
+from hackathon.constants import VE_PROVIDER, HEALTH, HEALTH_STATUS
 from hackathon.hmongo.models import Template, Experiment, NetworkConfigTemplate
 from hackathon.hackathon_response import ok, internal_server_error, forbidden
 from hackathon.constants import TEMPLATE_STATUS
 from hackathon.template.template_constants import TEMPLATE
 from hackathon.template.template_content import TemplateContent
+from hackathon.template.compiled_template import compiled_templates
+from hackathon.template.template_cache import TemplateContentCache
 
 __all__ = ["TemplateLibrary"]
 
@@ -44,13 +46,17 @@ class TemplateLibrary(Component):
         criterion = self.__generate_search_criterion(args)
         return [t.dic() for t in Template.objects(criterion)]
 
-    @staticmethod
-    def load_template(template):
+    def load_template(self, template):
         """load template content
-        :param template:
-        :return:
+
+        Contents are cached by template id and update_time, and shared by all callers, don't modify them.
+
+        :type template: Template
+        :param template: the template document
+
+        :rtype: TemplateContent
         """
-        return TemplateContent.load_from_template(template)
+        return self.content_cache.get(template, TemplateContent.load_from_template)
 
     def create_template(self, args):
         """ Create template """
@@ -97,6 +103,8 @@ class TemplateLibrary(Component):
             # the Hackathon used this template will imply the mongoengine's PULL reverse_delete_rule
             self.log.debug("delete template {}".format(template.name))
             template.delete()
+            self.content_cache.invalidate(template.id)
+            compiled_templates.invalidate(template.id)
 
             return ok("delete template success")
         except Exception as ex:
@@ -106,8 +114,15 @@ class TemplateLibrary(Component):
     def template_verified(self, template_id):
         Template.objects(id=template_id).update_one(status=TEMPLATE_STATUS.CHECK_PASS)
 
+    def report_health(self):
+        return {
+            HEALTH.STATUS: HEALTH_STATUS.OK,
+            "content_cache": self.content_cache.stats(),
+            "compiled_cache": compiled_templates.stats()
+        }
+
     def __init__(self):
-        pass
+        self.content_cache = TemplateContentCache()
 
     def __create_or_update_template(self, template_content):
         """Internally create template
@@ -149,6 +164,9 @@ class TemplateLibrary(Component):
                     docker_image=template_content.docker_image,
                     network_configs=network_configs,
                 )
+                # loaded from the old content, never hit again
+                self.content_cache.invalidate(template.id)
+                compiled_templates.invalidate(template.id)
                 return template.dic()
             except Exception as ex:
                 self.log.error(ex)
@@ -6,3 +6,4 @@ This file is covered by the LICENSING file in the root of this project.
 from hackathon.user.user_manager import UserManager
 from hackathon.user.user_profile_manager import UserProfileManager
 from hackathon.user.oauth_login import OAuthLoginManager
+from hackathon.user.presence import PresenceTracker
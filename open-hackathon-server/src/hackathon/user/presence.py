@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+This file is covered by the LICENSING file in the root of this project.
+"""
+
+import time
+from threading import Lock
+from datetime import datetime
+
+from mongoengine import Q
+
+from hackathon import Component
+from hackathon.util import safe_get_config
+from hackathon.constants import HEALTH, HEALTH_STATUS
+from hackathon.hmongo.models import User
+
+__all__ = ["TimingWheel", "PresenceTracker"]
+
+
+class TimingWheel(object):
+    """Track the last tick each key is seen in, and expire keys not seen for a timeout
+
+    Time is divided into ticks of `slot_seconds`. A key lives in the slot of the last tick it was seen in, so that both
+    touching a key and expiring a key cost O(1), and expire() only visits the slots that passed the timeout.
+    """
+
+    def __init__(self, slot_seconds, timeout_seconds, clock=time.time):
+        self.slot_seconds = slot_seconds
+        self.timeout_ticks = int(-(-timeout_seconds // slot_seconds))  # ceil
+        self.clock = clock
+        self.__slots = [set() for _ in range(self.timeout_ticks + 1)]
+        self.__ticks = {}  # key -> last tick seen
+        self.__expired_tick = self.current_tick() - self.timeout_ticks
+
+    def current_tick(self):
+        return int(self.clock() // self.slot_seconds)
+
+    def tick_time(self, tick):
+        """Return the beginning of tick as datetime in UTC, the same as get_now()"""
+        return datetime.utcfromtimestamp(tick * self.slot_seconds)
+
+    def touch(self, key):
+        """Record that key is seen now
+
+        :rtype: int
+        :return the current tick if key is new or moved to the current tick, otherwise None
+        """
+        tick = self.current_tick()
+        last = self.__ticks.get(key)
+        if last == tick:
+            return None
+
+        if last is not None:
+            self.__slots[last % len(self.__slots)].discard(key)
+        self.__slots[tick % len(self.__slots)].add(key)
+        self.__ticks[key] = tick
+        return tick
+
+    def remove(self, key):
+        last = self.__ticks.pop(key, None)
+        if last is not None:
+            self.__slots[last % len(self.__slots)].discard(key)
+
+    def expire(self):
+        """Remove and return keys not seen for the timeout
+
+        :rtype: list
+        """
+        expired = []
+        until = self.current_tick() - self.timeout_ticks
+        # a slot is visited only once even if expire() was not called for longer than a round of the wheel
+        for tick in range(max(self.__expired_tick + 1, until - len(self.__slots) + 1), until + 1):
+            slot = self.__slots[tick % len(self.__slots)]
+            for key in [k for k in slot if self.__ticks[k] <= until]:
+                slot.discard(key)
+                del self.__ticks[key]
+                expired.append(key)
+        self.__expired_tick = max(self.__expired_tick, until)
+        return expired
+
+    def __len__(self):
+        return len(self.__ticks)
+
+
+class PresenceTracker(Component):
+    """Maintain User.online from the activities of users
+
+    validate_token() records an activity by touch() at O(1) cost. Every "presence.slot_seconds" the scheduler calls
+    advance(), which sets users active in the last slots online and raises User.last_active_time, and sets users of
+    this process not seen for "presence.timeout_seconds" offline, all in batched update_many.
+
+    Since last_active_time is shared by all processes, a user is set offline only if no process has seen the user for
+    the timeout. Users left online by a process that exited are swept by last_active_time once per timeout.
+
+    :Example:
+        presence = RequiredFeature("presence")
+
+        presence.touch(user.id)
+    """
+
+    def __init__(self, slot_seconds=None, timeout_seconds=None, batch_size=None, clock=time.time):
+        self.slot_seconds = slot_seconds or safe_get_config("presence.slot_seconds", 60)
+        self.timeout_seconds = timeout_seconds or safe_get_config("presence.timeout_seconds", 3600)
+        self.batch_size = batch_size or safe_get_config("presence.batch_size", 1000)
+        self.__wheel = TimingWheel(self.slot_seconds, self.timeout_seconds, clock)
+        self.__pending = {}  # user_id -> tick seen, not flushed to DB yet
+        self.__last_sweep_tick = None
+        self.__lock = Lock()
+
+    def touch(self, user_id):
+        """Record an activity of user"""
+        with self.__lock:
+            tick = self.__wheel.touch(user_id)
+            if tick is not None:
+                self.__pending[user_id] = tick
+
+    def leave(self, user_id):
+        """Stop tracking user, e.g. when user logout"""
+        with self.__lock:
+            self.__wheel.remove(user_id)
+            self.__pending.pop(user_id, None)
+
+    def advance(self):
+        """Flush online and offline users to DB, called by scheduler every slot"""
+        with self.__lock:
+            pending, self.__pending = self.__pending, {}
+            expired = self.__wheel.expire()
+            current_tick = self.__wheel.current_tick()
+
+        by_tick = {}
+        for user_id, tick in list(pending.items()):
+            by_tick.setdefault(tick, []).append(user_id)
+        for tick, user_ids in list(by_tick.items()):
+            for chunk in self.__chunks(user_ids):
+                User.objects(id__in=chunk).update(set__online=True,
+                                                  max__last_active_time=self.__wheel.tick_time(tick))
+
+        cutoff = self.__wheel.tick_time(current_tick - self.__wheel.timeout_ticks + 1)
+        for chunk in self.__chunks(expired):
+            User.objects(id__in=chunk, last_active_time__lt=cutoff).update(set__online=False)
+
+        if self.__last_sweep_tick is None or current_tick - self.__last_sweep_tick >= self.__wheel.timeout_ticks:
+            self.__last_sweep_tick = current_tick
+            swept = User.objects(Q(online=True) & (Q(last_active_time__lt=cutoff) |
+                                                   Q(last_active_time=None, last_login_time__not__gte=cutoff))
+                                 ).update(set__online=False)
+            self.log.debug("presence: %d users swept offline" % swept)
+
+        self.log.debug("presence: %d users active, %d expired" % (len(pending), len(expired)))
+
+    def report_health(self):
+        with self.__lock:
+            return {
+                HEALTH.STATUS: HEALTH_STATUS.OK,
+                "tracked": len(self.__wheel),
+                "pending": len(self.__pending)
+            }
+
+    def __chunks(self, items):
+        for i in range(0, len(items), self.batch_size):
+            yield items[i:i + self.batch_size]
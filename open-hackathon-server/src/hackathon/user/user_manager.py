@@ -17,13 +17,13 @@ from hackathon.util import get_remote, get_config
 
 __all__ = ["UserManager"]
 
-users_operation_time = {}
-
 
 class UserManager(Component):
     """Component for user management"""
     admin_manager = RequiredFeature("admin_manager")
     oauth_login_manager = RequiredFeature("oauth_login_manager")
+    token_cache = RequiredFeature("token_cache")
+    presence = RequiredFeature("presence")
 
     def validate_token(self):
         """Make sure user token is included in http request headers and it must NOT be expired
@@ -42,6 +42,7 @@ class UserManager(Component):
             return False
 
         g.user = user
+        self.presence.touch(user.id)
         return True
 
     def logout(self, user_id):
@@ -50,8 +51,11 @@ class UserManager(Component):
             if user:
                 user.online = False
                 user.save()
+                self.token_cache.invalidate_user(user.id)
+                self.presence.leave(user.id)
             g.user = None
-            g.token.delete()
+            self.token_cache.invalidate(g.token)
+            UserToken.objects(token=g.token).delete()
             return ok()
         except Exception as e:
             self.log.error(e)
@@ -112,6 +116,7 @@ class UserManager(Component):
                 last_login_time=self.util.get_now(),
                 login_times=user.login_times + 1,
                 online=True)
+            self.token_cache.invalidate_user(user.id)
             list(map(lambda x: self.__create_or_update_email(user, x), email_list))
         else:
             user = User(openid=open_id,
@@ -154,16 +159,6 @@ class UserManager(Component):
         resp.update(user.dic())
         return resp
 
-    def check_user_online_status(self):
-        """Check whether the user is offline. If the answer is yes, update its status in DB."""
-        overtime_user_ids = [user_id for user_id in users_operation_time
-                             if (self.util.get_now() - users_operation_time[user_id]).seconds > 3600]
-        # 3600s- expire as token expire
-
-        User.objects(id__in=overtime_user_ids).update(online=False)
-        for user_id in overtime_user_ids:
-            users_operation_time.pop(user_id, "")
-
     def get_user_by_id(self, user_id):
         """Query user by unique id
 
@@ -278,12 +273,12 @@ class UserManager(Component):
         self.log.debug("get talents {}".format(users))
         return [self.user_display_info(u) for u in users]
 
-    @staticmethod
-    def update_user_avatar_url(user, url):
+    def update_user_avatar_url(self, user, url):
         if not user.profile:
             user.profile = UserProfile()
         user.profile.avatar_url = url
         user.save()
+        self.token_cache.invalidate_user(user.id)
         return True
 
     def upload_files(self, user_id, file_type):
@@ -331,15 +326,24 @@ class UserManager(Component):
         """
         if "authenticated" in g and g.authenticated:
             return g.user
-        else:
-            # todo eliminate the warning related to 'objects'
-            t = UserToken.objects(token=token).first()
-            if t and t.expire_date >= self.util.get_now():
-                g.authenticated = True
-                g.user = t.user
-                # save token to g, to determine which one to remove, when logout
-                g.token = t
-                return t.user
+
+        user = self.token_cache.get(token)
+        if user is not None:
+            g.authenticated = True
+            g.user = user
+            # save token to g, to determine which one to remove, when logout
+            g.token = token
+            return user
+
+        # todo eliminate the warning related to 'objects'
+        t = UserToken.objects(token=token).first()
+        if t and t.expire_date >= self.util.get_now():
+            g.authenticated = True
+            g.user = t.user
+            g.token = token
+            if t.user:
+                self.token_cache.set(token, t.user, t.expire_date)
+            return t.user
 
         return None
 
@@ -352,6 +356,7 @@ class UserManager(Component):
                                expire_date=token_expire_date,
                                issue_date=token_issue_date)
         user_token.save()
+        self.presence.touch(admin.id)
         return user_token
 
     def __db_login(self, context):
@@ -366,6 +371,7 @@ class UserManager(Component):
         user.online = True
         user.login_times = (user.login_times or 0) + 1
         user.save()
+        self.token_cache.invalidate_user(user.id)
 
         token = self.__generate_api_token(user)
         return {
@@ -393,6 +399,7 @@ class UserManager(Component):
             user.emails.append(new_mail)
 
         user.save()
+        self.token_cache.invalidate_user(user.id)
 
     def __get_existing_user(self, openid, provider):
         return User.objects(openid=openid, provider=provider).first()
@@ -418,6 +425,7 @@ class UserManager(Component):
                 last_login_time=self.util.get_now(),
                 login_times=user.login_times + 1,
                 online=True)
+            self.token_cache.invalidate_user(user.id)
             list(map(lambda x: self.__create_or_update_email(user, x), email_list))
         else:
             user = User(openid=openid,
@@ -261,12 +261,16 @@ class Utility(object):
         if func:
             items = [func(item) for item in pagination.items]
 
-        return {
+        result = {
             "items": items,
             "page": pagination.page,
             "per_page": pagination.per_page,
             "total": pagination.total
         }
+        # pass as `after` to get the next page of keyset pagination, None if no more pages
+        if pagination.page is None:
+            result["next_cursor"] = pagination.next_cursor
+        return result
 
     def is_local(self):
         return safe_get_config("environment", "local") == "local"
@@ -384,6 +388,37 @@ class Email(object):
             log.error(e)
             return False
 
+    def send_batch(self, messages):
+        """Send emails through one SMTP connection
+
+        :type messages: list
+        :param messages: list of dict, whose keys are the parameters of send_emails(), e.g.
+            [{"sender": "a@b.com", "receivers": ["c@d.com"], "subject": "Hello", "content": "<b>Hi!</b>"}]
+
+        :rtype list
+        :return error message of each email in order, None if sent successfully
+        """
+        if not self.available:
+            return [self.error_message] * len(messages)
+
+        errors = []
+        try:
+            with self.postman.connection() as conn:
+                for message in messages:
+                    try:
+                        response = self.postman.deliver(conn, email(**message))
+                        if response.status_code == EMAIL_SMTP_STATUSCODE.SUCCESS:
+                            errors.append(None)
+                        else:
+                            errors.append("Send emails fail: %s" % response.message)
+                    except Exception as e:
+                        errors.append(str(e))
+        except Exception as e:
+            # connection failed, the emails not sent yet fail together
+            log.error(e)
+            errors.extend([str(e)] * (len(messages) - len(errors)))
+        return errors
+
 
 class VoiceVerify(object, metaclass=abc.ABCMeta):
     """Base and abstract class for voice verify"""
@@ -76,6 +76,7 @@ def init_routes():
     api.add_resource(HackathonCheckNameResource, "/api/admin/hackathon/checkname")  # check hackathon name exists
     api.add_resource(AdminHackathonListResource, "/api/admin/hackathon/list")  # get entitled hackathon list
     api.add_resource(AdminRegisterListResource, "/api/admin/registration/list")  # get registered users
+    api.add_resource(AdminRegisterExportResource, "/api/admin/registration/export")  # export registered users
     api.add_resource(AdminRegisterResource, "/api/admin/registration")  # create, delete or query registration
     api.add_resource(AdminHackathonTemplateListResource,"/api/admin/hackathon/template/list")  # get templates of hackathon
     api.add_resource(AdminHackathonTemplateResource, "/api/admin/hackathon/template")  # select template for hackathon
@@ -20,6 +20,7 @@ from hackathon import RequiredFeature, Context
 __all__ = ["Resource", "HackathonResource"]
 
 log = RequiredFeature("log")
+query_profiler = RequiredFeature("query_profiler")
 
 
 def get_input_schema(class_name, method_name):
@@ -61,6 +62,8 @@ def validate(func):
         if hasattr(func, "original"):
             method_name = func.original
 
+        query_profiler.set_resource("%s.%s" % (class_name, method_name))
+
         input_schema = get_input_schema(class_name, method_name)
         output_schema = get_output_schema(class_name, method_name)
 
@@ -96,7 +99,13 @@ def validate(func):
         code = "200"
         if output_data is not None and isinstance(output_data, dict) and "error" in output_data:
             code = output_data["error"]["code"]
-        log.debug("API call %s.%s -- %s %d" % (class_name, method_name, code, len(str(output_data))))
+        profile = query_profiler.current()
+        if profile:
+            log.debug("API call %s.%s -- %s %d, %d queries in %.2f ms" % (class_name, method_name, code,
+                                                                          len(str(output_data)), profile.count,
+                                                                          profile.total_ms))
+        else:
+            log.debug("API call %s.%s -- %s %d" % (class_name, method_name, code, len(str(output_data))))
         return output_data
 
     return wrapper
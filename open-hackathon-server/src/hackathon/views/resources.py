@@ -6,21 +6,25 @@ This file is covered by the LICENSING file in the root of this project.
 import sys
 
 sys.path.append("..")
+import os
 import time
+import tempfile
 
-from flask import g, request
+from flask import g, request, Response, stream_with_context, send_file
 from flask_restful import reqparse
 
 from hackathon import RequiredFeature, Component
 from hackathon.decorators import hackathon_name_required, token_required, admin_privilege_required
 from hackathon.health import report_health
 from hackathon.hackathon_response import bad_request, not_found
+from hackathon.hack.registration_export import EXPORT_FORMAT
 from .hackathon_resource import HackathonResource
 
 hackathon_manager = RequiredFeature("hackathon_manager")
 user_manager = RequiredFeature("user_manager")
 user_profile_manager = RequiredFeature("user_profile_manager")
 register_manager = RequiredFeature("register_manager")
+registration_exporter = RequiredFeature("registration_exporter")
 hackathon_template_manager = RequiredFeature("hackathon_template_manager")
 template_library = RequiredFeature("template_library")
 team_manager = RequiredFeature("team_manager")
@@ -509,6 +513,34 @@ class AdminRegisterListResource(HackathonResource):
         return register_manager.get_hackathon_registration_list(g.hackathon.id)
 
 
+class AdminRegisterExportResource(HackathonResource):
+    @admin_privilege_required
+    def get(self):
+        parse = reqparse.RequestParser()
+        parse.add_argument("format", type=str, location="args", default=EXPORT_FORMAT.CSV,
+                           choices=[EXPORT_FORMAT.CSV, EXPORT_FORMAT.XLSX])
+        args = parse.parse_args()
+
+        filename = "%s-registrations.%s" % (g.hackathon.name, args["format"])
+        if args["format"] == EXPORT_FORMAT.CSV:
+            # rows are sent as soon as their chunk is fetched, the request context is kept till the end of stream
+            response = Response(stream_with_context(registration_exporter.stream_csv(g.hackathon)),
+                                mimetype="text/csv")
+            response.headers["Content-Disposition"] = "attachment; filename=%s" % filename
+            return response
+
+        # XLSX can't be streamed before complete, write it to a temporary file and send the file
+        with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as f:
+            path = f.name
+        try:
+            registration_exporter.write_xlsx(g.hackathon, path)
+            # the file is removed once opened, its content is freed when the response is closed
+            xlsx = open(path, "rb")
+        finally:
+            os.remove(path)
+        return send_file(xlsx, as_attachment=True, attachment_filename=filename)
+
+
 class AdminRegisterResource(HackathonResource):
     def get(self):
         parse = reqparse.RequestParser()
@@ -4,7 +4,7 @@ This file is covered by the LICENSING file in the root of this project.
 """
 from flask_script import Manager, Server, Shell
 
-from hackathon import app
+from hackathon import app, RequiredFeature
 from hackathon.hmongo.database import drop_db, setup_db, add_super_user
 
 import click
@@ -60,5 +60,43 @@ def create_test_user(username, password):
     add_super_user(username, username, password, is_super=False)
     click.echo('Success Add A Test Count. ({0}@{1})'.format(username, password))
 
+
+@manager.command
+def sync_hackathon_register_count():
+    hackathon_manager = RequiredFeature("hackathon_manager")
+    count = hackathon_manager.sync_hackathon_register_count()
+    click.echo('Success sync register count of {0} hackathons.'.format(count))
+
+
+@manager.command
+def export_registrations(hackathon_name, filename):
+    from hackathon.hmongo.models import Hackathon
+    hackathon = Hackathon.objects(name=hackathon_name).no_dereference().first()
+    if not hackathon:
+        raise click.ClickException('hackathon {0} cannot be found.'.format(hackathon_name))
+    RequiredFeature("registration_exporter").write_file(hackathon, filename)
+    click.echo('Success export registrations of {0} to {1}.'.format(hackathon_name, filename))
+
+
+@manager.command
+def create_indexes():
+    from hackathon.hmongo.indexes import create_indexes
+    for collection, indexes in sorted(create_indexes().items()):
+        click.echo('{0}: {1}'.format(collection, ', '.join(indexes)))
+    click.echo('Success create indexes in background.')
+
+
+@manager.command
+def audit_indexes():
+    from hackathon.hmongo.indexes import audit_query_shapes
+    report = audit_query_shapes()
+    for shape in report:
+        click.echo('{0} {1}: {2}'.format('COLLSCAN' if shape["collscan"] else 'ok', shape["name"],
+                                         ' <- '.join(shape["stages"])))
+    collscans = [s for s in report if s["collscan"]]
+    if collscans:
+        raise click.ClickException('{0} query shapes scan the whole collection.'.format(len(collscans)))
+    click.echo('All {0} query shapes use indexes.'.format(len(report)))
+
 if __name__ == "__main__":
     manager.run()
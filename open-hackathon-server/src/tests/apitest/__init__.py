@@ -4,6 +4,7 @@ import logging
 from datetime import timedelta, datetime
 
 from hackathon import app
+from hackathon.constants import HTTP_HEADER
 from hackathon.hmongo.models import UserToken
 from hackathon.hmongo.database import drop_db, setup_db
 
@@ -109,7 +110,9 @@ class ApiTestCase(object):
                                expire_date=token_expire_date,
                                issue_date=token_issue_date)
         user_token.save()
-        self.client.update_headers(dict(token=user_token.token))
+        self.client.update_headers({
+            HTTP_HEADER.TOKEN: user_token.token,
+            HTTP_HEADER.AUTHORIZATION: "token " + user_token.token})
         return user_token
 
     @classmethod
@@ -1,3 +1,7 @@
+from hackathon import RequiredFeature
+from hackathon.constants import HACKATHON_STAT, HACK_USER_TYPE, HACK_USER_STATUS
+from hackathon.hmongo.models import Hackathon, HackathonStat, UserHackathon
+
 from . import ApiTestCase
 
 
@@ -5,6 +9,28 @@ class TestHackathonApi(ApiTestCase):
     def test_list_hackathons(self):
         pass
 
+    def test_list_hot_hackathons(self):
+        hackathon_manager = RequiredFeature("hackathon_manager")
+        cold = Hackathon(name="test_cold_hackathon", display_name="cold").save()
+        warm = Hackathon(name="test_warm_hackathon", display_name="warm").save()
+        hot = Hackathon(name="test_hot_hackathon", display_name="hot").save()
+
+        hackathon_manager.update_hackathon_stat(warm, HACKATHON_STAT.REGISTER, 3)
+        hackathon_manager.increase_hackathon_stat(hot, HACKATHON_STAT.REGISTER, 2)
+        hackathon_manager.increase_hackathon_stat(hot, HACKATHON_STAT.REGISTER, 3)
+        hackathon_manager.increase_hackathon_stat(cold, HACKATHON_STAT.LIKE, 10)
+
+        payload = self.client.get("/api/hackathon/list?order_by=registered_users_num")
+        assert payload["total"] == 2
+        assert [h["name"] for h in payload["items"]] == ["test_hot_hackathon", "test_warm_hackathon"]
+        assert [h["stat"]["register"] for h in payload["items"]] == [5, 3]
+
+        # register_count can be rebuilt from HackathonStat
+        Hackathon.objects(id=hot.id).update_one(set__register_count=0)
+        assert hackathon_manager.sync_hackathon_register_count() == 1
+        assert Hackathon.objects(id=hot.id).first().register_count == 5
+        assert HackathonStat.objects(hackathon=cold, type=HACKATHON_STAT.REGISTER).count() == 0
+
     def test_get_hackathon_statistics(self):
         pass
 
@@ -14,14 +40,39 @@ class TestHackathonApi(ApiTestCase):
     def test_get_hackathon_tags(self):
         pass
 
-    def test_like_unlike_hackathon(self):
-        pass
+    def test_like_unlike_hackathon(self, user1, user2):
+        hackathon_manager = RequiredFeature("hackathon_manager")
+        hackathon = Hackathon(name="test_like_hackathon", display_name="like").save()
+
+        hackathon_manager.like_hackathon(user1, hackathon)
+        hackathon_manager.like_hackathon(user2, hackathon)
+        hackathon_manager.unlike_hackathon(user1, hackathon)
+        assert HackathonStat.objects(hackathon=hackathon, type=HACKATHON_STAT.LIKE).first().count == 1
+
+        # never below zero, even if the stat drifted
+        HackathonStat.objects(hackathon=hackathon, type=HACKATHON_STAT.LIKE).update_one(set__count=0)
+        hackathon_manager.unlike_hackathon(user2, hackathon)
+        assert HackathonStat.objects(hackathon=hackathon, type=HACKATHON_STAT.LIKE).first().count == 0
+        assert UserHackathon.objects(hackathon=hackathon, like=True).count() == 0
 
 
 class TestParticipantApi(ApiTestCase):
     def test_registration(self):
         pass
 
+    def test_delete_registration(self, user1):
+        hackathon_manager = RequiredFeature("hackathon_manager")
+        register_manager = RequiredFeature("register_manager")
+        hackathon = Hackathon(name="test_delete_registration", display_name="delete registration").save()
+        registration = UserHackathon(user=user1, hackathon=hackathon, role=HACK_USER_TYPE.COMPETITOR,
+                                     status=HACK_USER_STATUS.AUTO_PASSED).save()
+        hackathon_manager.increase_hackathon_stat(hackathon, HACKATHON_STAT.REGISTER, 1)
+
+        assert register_manager.delete_registration({"id": str(registration.id)})["code"] == 200
+        assert UserHackathon.objects(id=registration.id).count() == 0
+        assert HackathonStat.objects(hackathon=hackathon, type=HACKATHON_STAT.REGISTER).first().count == 0
+        assert Hackathon.objects(id=hackathon.id).first().register_count == 0
+
     def test_list_participated_hackathon(self):
         pass
 
@@ -1,5 +1,6 @@
 from . import ApiTestCase
 
+from hackathon import RequiredFeature
 from hackathon.constants import HACK_NOTICE_EVENT, HACK_NOTICE_CATEGORY
 from hackathon.hmongo.models import HackathonNotice
 
@@ -48,6 +49,25 @@ class TestUserLoginApi(ApiTestCase):
         payload = self.client.get("/api/user/profile")
         assert "error" in payload and payload["error"]["code"] == 401
 
+    def test_token_cache(self, user1):
+        token_cache = RequiredFeature("token_cache")
+        self.login(user1)
+
+        # the first request loads token from DB and the second one should hit the cache
+        self.client.get("/api/user/profile")
+        hits = token_cache.stats()["hits"]
+        payload = self.client.get("/api/user/profile")
+        assert payload["id"] == str(user1.id)
+        assert token_cache.stats()["hits"] == hits + 1
+
+    def test_token_cache_invalidated_on_update(self, user1):
+        self.login(user1)
+        self.client.get("/api/user/profile")
+
+        self.client.put("/api/user/profile", json_data={"real_name": "renamed"})
+        payload = self.client.get("/api/user/profile")
+        assert payload["profile"]["real_name"] == "renamed"
+
 
 class TestUserInfoApi(ApiTestCase):
 
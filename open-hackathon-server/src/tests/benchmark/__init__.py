@@ -0,0 +1,40 @@
+import time
+import logging
+
+from hackathon.hmongo.database import db
+
+log = logging.getLogger("benchmark")
+
+
+class DBOpCounter(object):
+    """Count operations received by MongoDB server and the time elapsed in a code block
+
+    Counters come from `serverStatus` so operations issued by other clients at the same time are counted too.
+
+    ::Example:
+        with DBOpCounter("list hackathons") as counter:
+            ...
+        print(counter.ops, counter.elapsed)
+    """
+
+    def __init__(self, name=""):
+        self.name = name
+        self.ops = 0
+        self.elapsed = 0.0
+
+    @staticmethod
+    def __get_ops():
+        counters = db.command("serverStatus")["opcounters"]
+        return counters["query"] + counters["getmore"] + counters["command"] + counters["insert"] + \
+            counters["update"] + counters["delete"]
+
+    def __enter__(self):
+        self.__start_ops = self.__get_ops()
+        self.__start_time = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.elapsed = time.time() - self.__start_time
+        # exclude the serverStatus command of __enter__
+        self.ops = self.__get_ops() - self.__start_ops - 1
+        log.info("%s: %d db operations in %.2f ms" % (self.name, self.ops, self.elapsed * 1000))
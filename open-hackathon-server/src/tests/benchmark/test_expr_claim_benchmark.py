@@ -0,0 +1,82 @@
+import time
+import threading
+from datetime import timedelta
+
+import pytest
+
+from hackathon import RequiredFeature
+from hackathon.util import get_now
+from hackathon.constants import EStatus, VEStatus, VE_PROVIDER, CLOUD_PROVIDER, HACKATHON_CONFIG, TEMPLATE_STATUS
+from hackathon.hmongo.models import Hackathon, Template, Experiment, User, VirtualEnvironment
+
+from tests.apitest import ApiTestCase
+from . import DBOpCounter, log
+
+
+class TestExprClaimBenchmark(ApiTestCase):
+
+    def prepare(self, num):
+        Experiment.objects().delete()
+        Hackathon.objects(name="test_claim_hackathon").delete()
+        Template.objects(name="test_claim_template").delete()
+        User.objects(name__startswith="test_claim_user_").delete()
+
+        template = Template(name="test_claim_template", provider=VE_PROVIDER.K8S, virtual_environment_count=1,
+                            status=TEMPLATE_STATUS.CHECK_PASS).save()
+        hackathon = Hackathon(name="test_claim_hackathon", display_name="claim",
+                              config={HACKATHON_CONFIG.CLOUD_PROVIDER: CLOUD_PROVIDER.KUBERNETES},
+                              event_end_time=get_now() + timedelta(days=1),
+                              templates=[template]).save()
+
+        Experiment.objects.insert([
+            Experiment(status=EStatus.RUNNING, hackathon=hackathon, template=template, user=None,
+                       virtual_environments=[VirtualEnvironment(provider=VE_PROVIDER.K8S,
+                                                                name="test_claim_env_%d" % i,
+                                                                status=VEStatus.RUNNING)])
+            for i in range(num)])
+
+        return User.objects.insert([User(name="test_claim_user_%d" % i, nickname="claim %d" % i)
+                                    for i in range(num)])
+
+    @pytest.mark.parametrize("num", [20, 100])
+    def test_concurrent_claim(self, num):
+        expr_manager = RequiredFeature("expr_manager")
+        users = self.prepare(num)
+
+        results = {}
+        errors = []
+
+        def start(user):
+            try:
+                results[user.id] = expr_manager.start_expr(user, "test_claim_template", "test_claim_hackathon")
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=start, args=(u,)) for u in users]
+        with DBOpCounter("%d concurrent claims" % num) as counter:
+            begin = time.time()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.time() - begin
+
+        log.info("%d concurrent start_expr: %.2f ms, %d db operations" % (num, elapsed * 1000, counter.ops))
+
+        assert errors == []
+        # every user gets a distinct pre-allocated experiment, no new one started
+        assert len(set(r["expr_id"] for r in list(results.values()))) == num
+        assert Experiment.objects().count() == num
+        for u in users:
+            assert Experiment.objects(user=u).count() == 1
+
+        hackathon = Hackathon.objects(name="test_claim_hackathon").first()
+        template = Template.objects(name="test_claim_template").first()
+        ready = Experiment(status=EStatus.RUNNING, hackathon=hackathon, template=template, user=None).save()
+        user = User(name="test_claim_user_last", nickname="claim last").save()
+        with DBOpCounter("single claim") as counter:
+            expr = expr_manager.claim_pre_alloc_expr(user, hackathon, template)
+        # claim itself is a single findAndModify
+        assert counter.ops == 1
+        assert expr.id == ready.id
+        assert expr_manager.claim_pre_alloc_expr(user, hackathon, template) is None
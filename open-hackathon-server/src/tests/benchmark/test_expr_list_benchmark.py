@@ -0,0 +1,41 @@
+from hackathon import RequiredFeature, Context, app
+from hackathon.constants import EStatus, VEStatus, VE_PROVIDER
+from hackathon.hmongo.models import Hackathon, Experiment, User, VirtualEnvironment
+from hackathon.hmongo.identity_map import current_identity_map
+
+from tests.apitest import ApiTestCase
+from . import DBOpCounter
+
+EXPERIMENTS = 30
+
+
+class TestExprListBenchmark(ApiTestCase):
+
+    def test_expr_list(self):
+        expr_manager = RequiredFeature("expr_manager")
+        Hackathon.objects(name="test_expr_list").delete()
+        User.objects(name__startswith="test_expr_list_user_").delete()
+
+        hackathon = Hackathon(name="test_expr_list", display_name="expr list").save()
+        users = User.objects.insert([User(name="test_expr_list_user_%d" % i, nickname="expr list %d" % i)
+                                     for i in range(EXPERIMENTS)])
+        Experiment.objects.insert([
+            Experiment(status=EStatus.RUNNING, hackathon=hackathon, user=user,
+                       virtual_environments=[VirtualEnvironment(provider=VE_PROVIDER.K8S,
+                                                                name="test_expr_list_env_%d" % i,
+                                                                status=VEStatus.RUNNING)])
+            for i, user in enumerate(users)])
+
+        with app.test_request_context():
+            app.preprocess_request()
+            with DBOpCounter("list %d experiments" % EXPERIMENTS) as counter:
+                result = expr_manager.get_expr_list_by_hackathon_id(hackathon, Context(per_page=EXPERIMENTS))
+
+            identity_map = current_identity_map()
+            assert len(result["items"]) == EXPERIMENTS
+            assert set(e["user"]["name"] for e in result["items"]) == set(u.name for u in users)
+            # users of the page are loaded with one query
+            assert identity_map.queries == 1
+            assert identity_map.loaded == EXPERIMENTS
+            # count, experiments, users, and the status saved for each experiment
+            assert counter.ops == 3 + EXPERIMENTS
@@ -0,0 +1,100 @@
+import json
+from datetime import timedelta
+
+import pytest
+
+from hackathon import RequiredFeature
+from hackathon.util import get_now, make_serializable
+from hackathon.constants import HACKATHON_STAT, HACK_USER_TYPE, HACK_USER_STATUS
+from hackathon.hmongo.models import Hackathon, HackathonStat, UserHackathon, Team, TeamMember
+
+from tests.apitest import ApiTestCase
+from . import DBOpCounter, log
+
+
+def legacy_hackathon_list(user, per_page):
+    """The N*M implementation that get_hackathon_list used before, kept as the baseline"""
+    user_manager = RequiredFeature("user_manager")
+    hackathon_list = Hackathon.objects().order_by("-event_start_time").paginate(1, per_page).items
+    hackathon_stat = HackathonStat.objects(hackathon__in=hackathon_list)
+    user_hackathon = UserHackathon.objects(user=user, hackathon__in=hackathon_list)
+    team = Team.objects(members__user=user, hackathon__in=hackathon_list)
+
+    def fill(hackathon):
+        detail = hackathon.dic()
+        detail["stat"] = {"register": 0, "like": 0}
+        for stat in hackathon_stat:
+            if stat.type == HACKATHON_STAT.REGISTER and stat.hackathon.id == hackathon.id:
+                detail["stat"]["register"] = stat.count
+            elif stat.type == HACKATHON_STAT.LIKE and stat.hackathon.id == hackathon.id:
+                detail["stat"]["like"] = stat.count
+
+        detail['user'] = user_manager.user_display_info(user)
+        detail['user']['admin'] = user.is_super
+        for uh in user_hackathon:
+            if uh.hackathon.id == hackathon.id:
+                detail['user']['admin'] = detail['user']['admin'] or (uh.role == HACK_USER_TYPE.ADMIN)
+                if uh.like:
+                    detail['like'] = uh.like
+                if uh.role == HACK_USER_TYPE.COMPETITOR:
+                    detail['registration'] = uh.dic()
+                    for t in team:
+                        if t.hackathon.id == hackathon.id:
+                            detail['team'] = t.dic()
+                            break
+                break
+        return detail
+
+    return [fill(h) for h in hackathon_list]
+
+
+class TestHackathonListBenchmark(ApiTestCase):
+
+    def prepare(self, user, num):
+        Hackathon.objects().delete()
+        HackathonStat.objects().delete()
+        UserHackathon.objects().delete()
+        Team.objects().delete()
+
+        now = get_now()
+        hackathons = Hackathon.objects.insert([
+            Hackathon(name="bench-%d-%d" % (num, i),
+                      display_name="bench %d" % i,
+                      event_start_time=now + timedelta(minutes=i))
+            for i in range(num)])
+
+        stats = []
+        for i, h in enumerate(hackathons):
+            stats.append(HackathonStat(hackathon=h, type=HACKATHON_STAT.REGISTER, count=i))
+            stats.append(HackathonStat(hackathon=h, type=HACKATHON_STAT.LIKE, count=i * 2))
+        HackathonStat.objects.insert(stats)
+
+        # the user registers every other hackathon and has a team there
+        registered = hackathons[::2]
+        UserHackathon.objects.insert([
+            UserHackathon(user=user, hackathon=h, role=HACK_USER_TYPE.COMPETITOR,
+                          status=HACK_USER_STATUS.AUTO_PASSED, like=True)
+            for h in registered])
+        Team.objects.insert([
+            Team(name="team-%s" % h.name, hackathon=h, leader=user,
+                 members=[TeamMember(user=user, status=1, join_time=now)])
+            for h in registered])
+
+    @pytest.mark.parametrize("num", [20, 100, 1000])
+    def test_list_hackathons(self, user1, num):
+        self.prepare(user1, num)
+        self.login(user1)
+        url = "/api/hackathon/list?order_by=event_start_time&per_page=%d" % num
+
+        with DBOpCounter("legacy hackathon list of %d" % num) as legacy:
+            expected = make_serializable(legacy_hackathon_list(user1, num))
+
+        with DBOpCounter("hackathon list of %d" % num) as batch:
+            payload = self.client.get(url)
+
+        log.info("hackathon list of %d: %d -> %d db operations, %.2f -> %.2f ms" % (
+            num, legacy.ops, batch.ops, legacy.elapsed * 1000, batch.elapsed * 1000))
+
+        assert json.dumps(payload["items"]) == json.dumps(expected)
+        # stat, registration and team are queried once per page regardless of page size
+        assert batch.ops < legacy.ops
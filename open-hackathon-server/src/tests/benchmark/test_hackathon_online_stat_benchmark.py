@@ -0,0 +1,63 @@
+import pytest
+
+from hackathon import RequiredFeature
+from hackathon.constants import HACK_USER_TYPE, HACK_USER_STATUS
+from hackathon.hmongo.models import Hackathon, UserHackathon, User
+
+from tests.apitest import ApiTestCase
+from . import DBOpCounter, log
+
+
+def legacy_count_online(hackathon):
+    """The implementation before aggregation: pull user ids of registrations and send them back in `id__in`"""
+    reg_list = UserHackathon.objects(hackathon=hackathon,
+                                     role=HACK_USER_TYPE.COMPETITOR,
+                                     deleted=False,
+                                     status__in=[HACK_USER_STATUS.AUTO_PASSED, HACK_USER_STATUS.AUDIT_PASSED]
+                                     ).only("user").no_dereference().all()
+    reg_list = [uh.user.id for uh in reg_list]
+    online_count = User.objects(id__in=reg_list, online=True).count() if reg_list else 0
+    return {"online": online_count, "offline": len(reg_list) - online_count}
+
+
+class TestHackathonOnlineStatBenchmark(ApiTestCase):
+
+    def prepare(self, num):
+        Hackathon.objects(name="test_online_stat").delete()
+        User.objects(name__startswith="test_online_stat_").delete()
+
+        hackathon = Hackathon(name="test_online_stat", display_name="online stat").save()
+        user_ids = User.objects.insert([User(name="test_online_stat_%d" % i, nickname="online stat", online=i % 3 == 0)
+                                        for i in range(num)], load_bulk=False)
+        UserHackathon.objects.insert([UserHackathon(user=user_id, hackathon=hackathon, role=HACK_USER_TYPE.COMPETITOR,
+                                                    status=HACK_USER_STATUS.AUTO_PASSED)
+                                      for user_id in user_ids], load_bulk=False)
+        # a pending registration doesn't count
+        UserHackathon(user=user_ids[0], hackathon=hackathon, role=HACK_USER_TYPE.COMPETITOR,
+                      status=HACK_USER_STATUS.UNAUDIT).save()
+        return hackathon
+
+    @pytest.mark.parametrize("num", [1000, 10000, 50000])
+    def test_online_stat(self, num):
+        hackathon_manager = RequiredFeature("hackathon_manager")
+        hackathon = self.prepare(num)
+
+        with DBOpCounter("legacy online stat of %d registrations" % num) as legacy:
+            expected = legacy_count_online(hackathon)
+
+        hackathon_manager.cache.invalidate("hackathon_stat_%s" % hackathon.id)
+        with DBOpCounter("aggregated online stat of %d registrations" % num) as aggregated:
+            stat = hackathon_manager.get_hackathon_stat(hackathon)
+
+        log.info("%d registrations: legacy %.2f ms, aggregation %.2f ms" % (num, legacy.elapsed * 1000,
+                                                                           aggregated.elapsed * 1000))
+
+        online = len(range(0, num, 3))
+        assert expected == {"online": online, "offline": num - online}
+        assert stat["online"] == online
+        assert stat["offline"] == num - online
+        # stats of hackathon plus one aggregation
+        assert aggregated.ops == 2
+
+        UserHackathon.objects(hackathon=hackathon).delete()
+        User.objects(name__startswith="test_online_stat_").delete()
@@ -0,0 +1,85 @@
+import time
+import threading
+
+from hackathon import RequiredFeature
+from hackathon.constants import HACKATHON_STAT, HACK_USER_TYPE, HACK_USER_STATUS
+from hackathon.hmongo.models import Hackathon, HackathonStat, UserHackathon, User
+
+from tests.apitest import ApiTestCase
+from . import log
+
+THREADS = 20
+INCREASES_PER_THREAD = 50
+
+
+def run_in_threads(target):
+    errors = []
+
+    def run():
+        try:
+            target()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(THREADS)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    return time.time() - start
+
+
+class TestHackathonStatBenchmark(ApiTestCase):
+
+    def test_concurrent_increase(self):
+        hackathon_manager = RequiredFeature("hackathon_manager")
+        # stat doesn't exist before, so that the threads race on upserting it, too
+        hackathon = Hackathon(name="test_concurrent_stat", display_name="concurrent stat").save()
+
+        def increase():
+            for _ in range(INCREASES_PER_THREAD):
+                hackathon_manager.increase_hackathon_stat(hackathon, HACKATHON_STAT.REGISTER, 1)
+
+        elapsed = run_in_threads(increase)
+        log.info("%d increases in %d threads: %.2f ms" % (THREADS * INCREASES_PER_THREAD, THREADS, elapsed * 1000))
+
+        stats = HackathonStat.objects(hackathon=hackathon, type=HACKATHON_STAT.REGISTER)
+        assert stats.count() == 1
+        assert stats.first().count == THREADS * INCREASES_PER_THREAD
+        assert Hackathon.objects(id=hackathon.id).first().register_count == THREADS * INCREASES_PER_THREAD
+
+    def test_concurrent_like(self, user1):
+        hackathon_manager = RequiredFeature("hackathon_manager")
+        hackathon = Hackathon(name="test_concurrent_like", display_name="concurrent like").save()
+        UserHackathon(user=user1, hackathon=hackathon, role=HACK_USER_TYPE.VISITOR, like=False).save()
+
+        # repeated clicks of the same user count once
+        run_in_threads(lambda: hackathon_manager.like_hackathon(user1, hackathon))
+        assert HackathonStat.objects(hackathon=hackathon, type=HACKATHON_STAT.LIKE).first().count == 1
+
+        run_in_threads(lambda: hackathon_manager.unlike_hackathon(user1, hackathon))
+        assert HackathonStat.objects(hackathon=hackathon, type=HACKATHON_STAT.LIKE).first().count == 0
+
+    def test_reconcile(self):
+        hackathon_manager = RequiredFeature("hackathon_manager")
+        # settle the stats left by other tests
+        hackathon_manager.reconcile_hackathon_stat()
+
+        hackathon = Hackathon(name="test_reconcile_stat", display_name="reconcile stat").save()
+        for i in range(3):
+            user = User(name="test_reconcile_%d" % i, nickname="test_reconcile_%d" % i).save()
+            UserHackathon(user=user, hackathon=hackathon, role=HACK_USER_TYPE.COMPETITOR,
+                          status=HACK_USER_STATUS.AUTO_PASSED, like=i > 0).save()
+
+        hackathon_manager.update_hackathon_stat(hackathon, HACKATHON_STAT.REGISTER, 10)
+
+        # register drifted and like is missing
+        assert hackathon_manager.reconcile_hackathon_stat() == 2
+        assert HackathonStat.objects(hackathon=hackathon, type=HACKATHON_STAT.REGISTER).first().count == 3
+        assert HackathonStat.objects(hackathon=hackathon, type=HACKATHON_STAT.LIKE).first().count == 2
+        assert Hackathon.objects(id=hackathon.id).first().register_count == 3
+
+        assert hackathon_manager.reconcile_hackathon_stat() == 0
@@ -0,0 +1,35 @@
+from hackathon import RequiredFeature, app
+from hackathon.constants import TEAM_MEMBER_STATUS
+from hackathon.hmongo.models import Hackathon, Team, TeamMember
+from hackathon.hmongo.identity_map import current_identity_map
+
+from tests.apitest import ApiTestCase
+from . import DBOpCounter
+
+TEAMS = 30
+
+
+class TestIdentityMapBenchmark(ApiTestCase):
+
+    def test_team_list(self, user1, user2):
+        team_manager = RequiredFeature("team_manager")
+        hackathon = Hackathon(name="test_identity_map", display_name="identity map").save()
+        for i in range(TEAMS):
+            leader, member = (user1, user2) if i % 2 else (user2, user1)
+            Team(name="test_identity_map_%d" % i, leader=leader, hackathon=hackathon,
+                 members=[TeamMember(user=leader, status=TEAM_MEMBER_STATUS.APPROVED),
+                          TeamMember(user=member, status=TEAM_MEMBER_STATUS.APPROVED)]).save()
+
+        with app.test_request_context():
+            app.preprocess_request()
+            with DBOpCounter("list %d teams" % TEAMS) as counter:
+                teams = team_manager.get_hackathon_team_list(hackathon.id)
+
+            identity_map = current_identity_map()
+            assert len(teams) == TEAMS
+            assert set(t["leader"]["name"] for t in teams) == {user1.name, user2.name}
+            # leaders are loaded once, members are served from the identity map
+            assert identity_map.queries == 1
+            assert identity_map.loaded == 2
+            # teams, and users referenced by teams
+            assert counter.ops == 2
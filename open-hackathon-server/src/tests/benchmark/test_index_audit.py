@@ -0,0 +1,16 @@
+from hackathon.hmongo.indexes import create_indexes, audit_query_shapes
+
+from tests.apitest import ApiTestCase
+from . import log
+
+
+class TestIndexAudit(ApiTestCase):
+
+    def test_no_collscan(self):
+        indexes = create_indexes()
+        assert "hackathon_1_user_1" in " ".join(indexes["user_hackathon"])
+
+        report = audit_query_shapes()
+        for shape in report:
+            log.info("%s: %s" % (shape["name"], " <- ".join(shape["stages"])))
+        assert [s["name"] for s in report if s["collscan"]] == []
@@ -0,0 +1,117 @@
+import time
+
+import yaml
+from jinja2 import Template
+
+from hackathon.template.template_constants import K8S_UNIT
+from hackathon.template.k8s_template_unit import K8STemplateUnit
+from hackathon.template.compiled_template import CompiledK8sTemplate, compiled_templates
+
+from . import log
+
+STARTS = 300
+
+YAML_TEMPLATE = """
+apiVersion: apps/v1
+kind: Deployment
+metadata:
+  name: {{ expr_name }}
+  annotations:
+    created-at: "{{ created_at }}"
+spec:
+  replicas: 1
+  selector:
+    matchLabels:
+      app: {{ expr_name }}
+  template:
+    metadata:
+      labels:
+        app: {{ expr_name }}
+    spec:
+      containers:
+      - name: environment
+        image: ubuntu:18.04
+        ports:
+        - containerPort: 5901
+        env:
+        - name: EXPR_NAME
+          value: {{ expr_name }}
+        volumeMounts:
+        - name: data
+          mountPath: /data
+      volumes:
+      - name: data
+        persistentVolumeClaim:
+          claimName: data
+---
+apiVersion: v1
+kind: Service
+metadata:
+  name: {{ expr_name }}
+spec:
+  selector:
+    app: {{ expr_name }}
+  ports:
+  - protocol: TCP
+    name: vnc
+    port: 5901
+  type: NodePort
+---
+apiVersion: v1
+kind: PersistentVolumeClaim
+metadata:
+  name: data
+spec:
+  accessModes:
+  - ReadWriteOnce
+  resources:
+    requests:
+      storage: 1Gi
+"""
+
+
+def legacy_start(expr_name):
+    rendered = Template(YAML_TEMPLATE).render(expr_name=expr_name, created_at="{}".format(time.time()))
+    return [d for d in yaml.safe_load_all(rendered) if d]
+
+
+def test_skeleton_equals_rendered():
+    compiled = CompiledK8sTemplate(YAML_TEMPLATE)
+    assert compiled.skeleton is not None
+
+    docs = compiled.load(expr_name="expr-1", created_at="1600000000.5")
+    rendered = compiled.render(expr_name="expr-1", created_at="1600000000.5")
+    assert docs == [d for d in yaml.safe_load_all(rendered) if d]
+    # copies are independent of each other and of the skeleton
+    docs[0]["metadata"]["name"] = "changed"
+    assert compiled.load(expr_name="expr-1")[0]["metadata"]["name"] == "expr-1"
+
+
+def test_type_changing_variable_falls_back():
+    compiled = CompiledK8sTemplate("kind: Deployment\nmetadata:\n  generation: {{ created_at }}\n")
+    assert compiled.skeleton is None
+    assert compiled.load(created_at="12.5") == [{"kind": "Deployment", "metadata": {"generation": 12.5}}]
+
+
+def test_per_start_cpu():
+    unit = K8STemplateUnit({K8S_UNIT.YAML_TEMPLATE: YAML_TEMPLATE})
+    assert unit.is_valid()
+
+    start = time.process_time()
+    for i in range(STARTS):
+        legacy_start("expr-%d" % i)
+    legacy = (time.process_time() - start) / STARTS
+
+    stats = compiled_templates.stats()
+    start = time.process_time()
+    for i in range(STARTS):
+        resources = unit.gen_k8s_resources("expr-%d" % i)
+    cached = (time.process_time() - start) / STARTS
+
+    log.info("k8s template per start: %.3f ms rendered and parsed, %.3f ms from compiled cache" % (
+        legacy * 1000, cached * 1000))
+    assert sorted(resources.keys()) == ["deployment", "persistentvolumeclaim", "service"]
+    assert resources["deployment"][0]["metadata"]["name"] == "expr-%d" % (STARTS - 1)
+    # compiled once, every start is a hit
+    assert compiled_templates.stats()["hits"] - stats["hits"] == STARTS
+    assert cached < legacy
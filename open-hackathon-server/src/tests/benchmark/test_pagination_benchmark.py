@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+import pytest
+
+from hackathon.util import get_now
+from hackathon.hmongo.models import HackathonNotice
+from hackathon.hmongo.pagination import TOTAL, KeysetPagination
+
+from tests.apitest import ApiTestCase
+from . import DBOpCounter
+
+NOTICES = 5000
+
+
+class TestPaginationBenchmark(ApiTestCase):
+
+    @pytest.fixture(scope="class")
+    def notices(self):
+        HackathonNotice.objects().delete()
+        now = get_now()
+        # update_time of every two notices are the same so that _id breaks the tie
+        HackathonNotice.objects.insert([HackathonNotice(content="notice %d" % i,
+                                                        update_time=now - timedelta(seconds=i // 2))
+                                        for i in range(NOTICES)], load_bulk=False)
+        return HackathonNotice.objects().order_by("-update_time", "-id")
+
+    def test_keyset_walks_all(self, notices):
+        seen = []
+        after = ""
+        while after is not None:
+            pagination = notices.paginate(1, 300, after=after, total=TOTAL.NONE)
+            seen.extend(n.id for n in pagination.items)
+            after = pagination.next_cursor
+
+        assert len(seen) == NOTICES
+        assert len(set(seen)) == NOTICES
+        assert seen[:300] == [n.id for n in notices.paginate(1, 300).items]
+
+    def test_deep_page(self, notices):
+        with DBOpCounter("offset page 15") as offset:
+            offset_items = notices.paginate(15, 300).items
+
+        cursor = notices.paginate(14, 300).items[-1]
+        after = KeysetPagination.encode_cursor([cursor.update_time, cursor.id])
+        with DBOpCounter("keyset page 15") as keyset:
+            keyset_items = notices.paginate(1, 300, after=after, total=TOTAL.NONE).items
+
+        assert [n.id for n in keyset_items] == [n.id for n in offset_items]
+        # no count, one query
+        assert keyset.ops == 1
+        assert offset.ops == 2
@@ -0,0 +1,176 @@
+import os
+import time
+import tempfile
+import threading
+
+from hackathon.cache.backends import MemoryCacheBackend, LocalSocketCacheBackend
+from hackathon.cache.cache_mgr import CacheManagerExt
+
+
+class TestCacheBackends(object):
+
+    def test_memory_lru_and_ttl(self):
+        backend = MemoryCacheBackend(max_size=2)
+        backend.set("a", 1, 60)
+        backend.set("b", 2, 60)
+        backend.get("a")
+        backend.set("c", 3, 60)
+
+        assert backend.get("a") == (True, 1)
+        assert backend.get("b") == (False, None)
+
+        backend.set("d", 4, 0.05)
+        time.sleep(0.1)
+        assert backend.get("d") == (False, None)
+
+    def test_memory_returns_copies(self):
+        backend = MemoryCacheBackend()
+        backend.set("a", {"list": [1]}, 60)
+        backend.get("a")[1]["list"].append(2)
+
+        assert backend.get("a") == (True, {"list": [1]})
+
+    def test_local_socket(self):
+        address = os.path.join(tempfile.mkdtemp(), "cache.sock")
+        server = LocalSocketCacheBackend(address=address)
+        client = LocalSocketCacheBackend(address=address)
+
+        server.set("key", {"count": [1, 2]}, 60)
+        assert client.get("key") == (True, {"count": [1, 2]})
+
+        client.delete("key")
+        assert server.get("key") == (False, None)
+
+
+class TestCacheManagerExt(object):
+
+    def test_tiers(self):
+        upper, lower = MemoryCacheBackend(), MemoryCacheBackend()
+        cache = CacheManagerExt(backends=[upper, lower])
+        calls = []
+
+        def create():
+            calls.append(1)
+            return "value"
+
+        assert cache.get_cache("key", create) == "value"
+        assert cache.get_cache("key", create) == "value"
+        assert len(calls) == 1
+
+        # a hit in the lower tier fills the upper one
+        upper.clear()
+        assert cache.get_cache("key", create) == "value"
+        assert upper.get("key")[1].value == "value"
+        assert len(calls) == 1
+
+        assert cache.invalidate("key")
+        assert lower.get("key") == (False, None)
+
+    def test_max_ttl_in_front_of_shared_tiers(self):
+        cache = CacheManagerExt()
+        # memory is the only tier by default, so values live for their own ttl
+        assert [b.name for b in cache.backends] == ["memory"]
+        assert cache.backends[0].max_ttl_seconds is None
+
+    def test_ttl_by_prefix(self):
+        cache = CacheManagerExt(backends=[])
+        cache.default_ttl_seconds = 100
+        cache.ttl_seconds = {"hackathon_": 10, "hackathon_stat_": 5}
+
+        assert cache.get_ttl("hackathon_stat_1") == 5
+        assert cache.get_ttl("hackathon_config_1") == 10
+        assert cache.get_ttl("other") == 100
+
+    def test_single_flight(self):
+        cache = CacheManagerExt(backends=[MemoryCacheBackend()])
+        calls = []
+        results = []
+
+        def create():
+            calls.append(1)
+            time.sleep(0.2)
+            return "value"
+
+        threads = [threading.Thread(target=lambda: results.append(cache.get_cache("key", create)))
+                   for i in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(calls) == 1
+        assert results == ["value"] * 20
+        assert cache.stats()["waits"] == 19
+
+    def test_stale_while_revalidate(self):
+        cache = CacheManagerExt(backends=[MemoryCacheBackend()])
+        cache.ttl_seconds = {"key": 0.1}
+        cache.stale_seconds = 60
+        cache.early_expiry_beta = 0
+        values = iter(["old", "new"])
+        refreshed = threading.Event()
+
+        def create():
+            value = next(values)
+            if value == "new":
+                time.sleep(0.2)
+                refreshed.set()
+            return value
+
+        assert cache.get_cache("key", create) == "old"
+        time.sleep(0.2)
+        # expired, the stale value is served at once while refreshed in background
+        begin = time.time()
+        assert cache.get_cache("key", create) == "old"
+        assert time.time() - begin < 0.1
+        assert refreshed.wait(1)
+        time.sleep(0.05)
+        assert cache.get_cache("key", create) == "new"
+        assert cache.stats()["refreshes"] == 1
+
+    def test_early_expiry(self):
+        cache = CacheManagerExt(backends=[MemoryCacheBackend()])
+        cache.ttl_seconds = {"key": 60}
+        calls = []
+
+        def create():
+            calls.append(1)
+            time.sleep(0.01)
+            return "value"
+
+        cache.get_cache("key", create)
+        # a small beta never refreshes a fresh value early, a huge one always does
+        cache.early_expiry_beta = 1e-9
+        cache.get_cache("key", create)
+        assert cache.stats()["refreshes"] == 0
+        cache.early_expiry_beta = 1e9
+        cache.get_cache("key", create)
+        assert cache.stats()["refreshes"] == 1
+
+    def test_stale_while_revalidate_by_default(self, monkeypatch):
+        # default config, where memory is the only tier
+        cache = CacheManagerExt()
+        now = [time.time()]
+        monkeypatch.setattr(time, "time", lambda: now[0])
+        ttl = cache.get_ttl("hackathon_stat_1")
+        assert ttl > 60
+        values = iter(["old", "new"])
+        refreshed = threading.Event()
+
+        def create():
+            value = next(values)
+            if value == "new":
+                refreshed.set()
+            return value
+
+        assert cache.get_cache("hackathon_stat_1", create) == "old"
+        # still cached after the memory tier's max_ttl_seconds
+        now[0] += 61
+        assert cache.get_cache("hackathon_stat_1", create) == "old"
+
+        # expired but within stale_seconds, served while refreshed
+        now[0] += ttl - 61 + cache.stale_seconds / 2.0
+        assert cache.get_cache("hackathon_stat_1", create) == "old"
+        assert refreshed.wait(1)
+        assert cache.stats()["misses"] == 1
+        assert cache.stats()["refreshes"] == 1
@@ -0,0 +1,62 @@
+from hackathon import app
+from hackathon.hackathon_factory import HackathonFactory, SCOPE
+
+
+class Dummy(object):
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+
+
+class TestHackathonFactory(object):
+
+    def test_singleton_by_default(self):
+        f = HackathonFactory()
+        f.provide("dummy", Dummy)
+
+        assert f["dummy"] is f["dummy"]
+        assert f.get_instance_counts()["dummy"] == 1
+
+    def test_transient(self):
+        f = HackathonFactory()
+        f.provide("dummy", Dummy, scope=SCOPE.TRANSIENT)
+
+        assert f["dummy"] is not f["dummy"]
+        assert f.get_instance_counts()["dummy"] == 2
+
+    def test_request(self):
+        f = HackathonFactory()
+        f.provide("dummy", Dummy, scope=SCOPE.REQUEST)
+
+        with app.app_context():
+            first = f["dummy"]
+            assert f["dummy"] is first
+
+        with app.app_context():
+            assert f["dummy"] is not first
+
+        assert f.get_instance_counts()["dummy"] == 2
+
+    def test_replace_drops_singleton(self):
+        f = HackathonFactory(allow_replace=True)
+        f.provide("dummy", Dummy)
+        first = f["dummy"]
+
+        f.provide("dummy", Dummy)
+        assert f["dummy"] is not first
+
+    def test_object_provider(self):
+        f = HackathonFactory()
+        obj = Dummy()
+        f.provide("dummy", obj)
+
+        assert f["dummy"] is obj
+        assert "dummy" not in f.get_instance_counts()
+
+    def test_init_args(self):
+        f = HackathonFactory()
+        f.provide("dummy", Dummy, 1, 2, name="x", scope=SCOPE.TRANSIENT)
+
+        dummy = f["dummy"]
+        assert dummy.args == (1, 2)
+        assert dummy.kwargs == {"name": "x"}
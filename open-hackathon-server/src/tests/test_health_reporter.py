@@ -0,0 +1,73 @@
+import time
+import threading
+
+from hackathon.constants import HEALTH_STATUS
+from hackathon.health import HealthReporter, STATUS
+
+
+class FakeItem(object):
+    def __init__(self, status=HEALTH_STATUS.OK, delay=0):
+        self.status = status
+        self.delay = delay
+        self.calls = 0
+        self.released = threading.Event()
+
+    def report_health(self):
+        self.calls += 1
+        if self.delay:
+            self.released.wait(self.delay)
+        return {STATUS: self.status}
+
+
+class BrokenItem(object):
+    def report_health(self):
+        raise Exception("broken")
+
+
+def new_reporter(ttl_seconds=30, deadline_seconds=0.2):
+    reporter = HealthReporter()
+    reporter.ttl_seconds = ttl_seconds
+    reporter.deadline_seconds = deadline_seconds
+    return reporter
+
+
+class TestHealthReporter(object):
+
+    def test_concurrent_under_deadline(self):
+        reporter = new_reporter()
+        items = dict(("item%d" % i, FakeItem(delay=0.15)) for i in range(4))
+        items["dead"] = FakeItem(delay=30)
+
+        start = time.time()
+        reports = reporter.get_reports(items)
+        # items run in parallel, the dead one doesn't hold the others
+        assert time.time() - start < 0.5
+        assert [reports["item%d" % i][STATUS] for i in range(4)] == [HEALTH_STATUS.OK] * 4
+        assert reports["dead"][STATUS] == HEALTH_STATUS.WARNING
+
+        # still running, not checked again
+        reporter.get_reports({"dead": items["dead"]})
+        assert items["dead"].calls == 1
+        items["dead"].released.set()
+
+    def test_cached_and_refreshed_in_background(self):
+        reporter = new_reporter(ttl_seconds=0.1)
+        item = FakeItem()
+        reporter.get_reports({"item": item})
+        reporter.get_reports({"item": item})
+        assert item.calls == 1
+
+        time.sleep(0.15)
+        item.status = HEALTH_STATUS.ERROR
+        item.delay = 1
+        start = time.time()
+        # the stale report is returned at once while checked again
+        assert reporter.get_reports({"item": item})["item"][STATUS] == HEALTH_STATUS.OK
+        assert time.time() - start < 0.1
+        item.released.set()
+        time.sleep(0.05)
+        assert reporter.get_reports({"item": item})["item"][STATUS] == HEALTH_STATUS.ERROR
+
+    def test_error_reported(self):
+        reporter = new_reporter()
+        assert reporter.get_reports({"broken": BrokenItem()})["broken"][STATUS] == HEALTH_STATUS.ERROR
@@ -0,0 +1,172 @@
+import time
+from datetime import timedelta
+from threading import Lock
+
+from hackathon.util import get_now
+from hackathon.constants import IMAGE_PULL_STATUS
+from hackathon.hmongo.models import DockerHostServer, DockerImagePull, Hackathon
+from hackathon.docker.image_puller import ImagePullPlanner, PullProgress, _split_image, _normalize_image
+from hackathon.docker.hosted_docker import HostedDockerFormation
+
+from tests.apitest import ApiTestCase
+
+
+class FakeDocker(object):
+    """Stand-in of HostedDockerFormation, records how many pulls run at the same time"""
+
+    def __init__(self, pulled=None, broken_hosts=(), broken_images=(), delay=0.05):
+        self.pulled = pulled or {}
+        self.broken_hosts = broken_hosts
+        self.broken_images = broken_images
+        self.delay = delay
+        self.pulls = []
+        self.running = {}
+        self.max_running = 0
+        self.max_running_per_host = 0
+        self.lock = Lock()
+
+    def get_pulled_images(self, docker_host):
+        if docker_host.vm_name in self.broken_hosts:
+            raise Exception("connection refused")
+        return self.pulled.get(docker_host.vm_name, [])
+
+    def pull_image(self, docker_host, image_name, tag, on_progress=None, timeout=60):
+        with self.lock:
+            self.pulls.append((docker_host.vm_name, "%s:%s" % (image_name, tag)))
+            self.running[docker_host.vm_name] = self.running.get(docker_host.vm_name, 0) + 1
+            self.max_running = max(self.max_running, sum(self.running.values()))
+            self.max_running_per_host = max(self.max_running_per_host, self.running[docker_host.vm_name])
+        try:
+            on_progress({"status": "Downloading", "id": "layer", "progressDetail": {"current": 1, "total": 2}})
+            time.sleep(self.delay)
+            if image_name in self.broken_images:
+                raise Exception("manifest unknown")
+        finally:
+            with self.lock:
+                self.running[docker_host.vm_name] -= 1
+
+
+class FakeScheduler(object):
+    """Stand-in of HackathonScheduler, adding the jobs in `broken` fails"""
+
+    def __init__(self, jobs=(), broken=()):
+        self.jobs = dict((job_id, {}) for job_id in jobs)
+        self.broken = broken
+
+    def has_job(self, job_id):
+        return job_id in self.jobs
+
+    def add_interval(self, **kwargs):
+        if kwargs["id"] in self.broken:
+            raise Exception("scheduler is down")
+        self.jobs[kwargs["id"]] = kwargs
+
+    def remove_job(self, job_id):
+        self.jobs.pop(job_id)
+
+
+class FakeHackathonManager(object):
+    def __init__(self, hackathons):
+        self.hackathons = hackathons
+
+    def get_online_hackathons(self):
+        return self.hackathons
+
+
+def new_hosts(count):
+    hosts = [DockerHostServer(vm_name="host%d" % i, container_max_count=10) for i in range(count)]
+    for host in hosts:
+        host.save()
+    return hosts
+
+
+class TestImagePullPlanner(ApiTestCase):
+
+    def setup_method(self, method):
+        DockerHostServer.objects().delete()
+        DockerImagePull.objects().delete()
+
+    def test_image_names(self):
+        assert _split_image("ubuntu") == ("ubuntu", "latest")
+        assert _split_image("ubuntu:18.04") == ("ubuntu", "18.04")
+        assert _split_image("registry:5000/ns/app") == ("registry:5000/ns/app", "latest")
+        assert _split_image("registry:5000/ns/app:v1") == ("registry:5000/ns/app", "v1")
+        assert _normalize_image("docker.io/library/ubuntu") == "ubuntu:latest"
+
+    def test_progress(self):
+        progress = PullProgress()
+        progress.update({"status": "Downloading", "id": "a", "progressDetail": {"current": 10, "total": 100}})
+        progress.update({"status": "Downloading", "id": "b", "progressDetail": {"current": 0, "total": 100}})
+        assert progress.percent == 5
+        progress.update({"status": "Pull complete", "id": "a", "progressDetail": {}})
+        assert progress.percent == 50
+
+    def test_plan(self):
+        hosts = new_hosts(3)
+        docker = FakeDocker(pulled={"host0": ["ubuntu:latest", "redis:5"], "host1": ["redis:5"]},
+                            broken_hosts=["host2"])
+        planner = ImagePullPlanner(docker=docker)
+
+        plan = planner.plan(hosts, ["docker.io/library/ubuntu", "redis:5"])
+        # host0 has all, host2 is unreachable
+        assert [(h.vm_name, image) for h, image in plan] == [("host1", "docker.io/library/ubuntu")]
+
+    def test_concurrency_limits(self):
+        hosts = new_hosts(4)
+        docker = FakeDocker()
+        planner = ImagePullPlanner(docker=docker)
+        planner.per_host_concurrency = 2
+
+        result = planner.pull_images(None, hosts, ["image%d" % i for i in range(5)])
+        assert result == {"planned": 20, "done": 20, "failed": 0, "skipped": 0}
+        assert len(docker.pulls) == 20
+        assert docker.max_running <= planner.max_concurrency
+        assert docker.max_running_per_host == 2
+        assert DockerImagePull.objects(status=IMAGE_PULL_STATUS.DONE, progress=100).count() == 20
+
+    def test_failure_recorded_and_retried(self):
+        hosts = new_hosts(1)
+        docker = FakeDocker(broken_images=["broken"])
+        planner = ImagePullPlanner(docker=docker)
+
+        result = planner.pull_images(None, hosts, ["ok", "broken"])
+        assert result["done"] == 1
+        assert result["failed"] == 1
+        record = DockerImagePull.objects(image="broken").first()
+        assert record.status == IMAGE_PULL_STATUS.FAILED
+        assert record.error == "manifest unknown"
+
+        # pulled again in the next round
+        docker.broken_images = []
+        assert planner.pull_images(None, hosts, ["broken"])["done"] == 1
+        assert DockerImagePull.objects(image="broken").first().status == IMAGE_PULL_STATUS.DONE
+
+    def test_skip_pulling(self):
+        host = new_hosts(1)[0]
+        DockerImagePull(host=host, image="ubuntu", status=IMAGE_PULL_STATUS.PULLING).save()
+        docker = FakeDocker()
+        planner = ImagePullPlanner(docker=docker)
+
+        # being pulled by another round
+        assert planner.pull_images(None, [host], ["ubuntu"])["skipped"] == 1
+        assert docker.pulls == []
+
+    def test_ensure_images(self):
+        Hackathon.objects(name__startswith="test_ensure_images_").delete()
+        now = get_now()
+        broken, no_end, ended, running = [Hackathon(name="test_ensure_images_%d" % i, display_name="ensure images",
+                                                    event_end_time=end).save()
+                                          for i, end in enumerate([now + timedelta(days=1), None,
+                                                                   now - timedelta(days=1), now + timedelta(days=1)])]
+
+        def job_id(hackathon):
+            return "pull_images_for_hackathon_%s" % hackathon.id
+
+        docker = HostedDockerFormation()
+        docker.hackathon_manager = FakeHackathonManager([broken, no_end, ended, running])
+        docker.scheduler = FakeScheduler(jobs=[job_id(ended)], broken=[job_id(broken)])
+
+        # the failure of one hackathon doesn't stop the others
+        docker.ensure_images()
+        assert sorted(docker.scheduler.jobs) == sorted([job_id(no_end), job_id(running)])
+        assert docker.scheduler.jobs[job_id(running)]["method"] == "pull_images_for_hackathon"
@@ -0,0 +1,56 @@
+import time
+
+from hackathon.hk8s.adapter_pool import K8SServiceAdapterPool
+
+
+class FakeAdapter(object):
+    def __init__(self, api_url, token, namespace, connection_pool_maxsize=None):
+        self.api_url = api_url
+        self.token = token
+        self.namespace = namespace
+        self.connection_pool_maxsize = connection_pool_maxsize
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestK8SServiceAdapterPool(object):
+
+    def test_reuse(self):
+        pool = K8SServiceAdapterPool(max_size=4, idle_seconds=60, connection_pool_maxsize=8, adapter_class=FakeAdapter)
+
+        adapter = pool.get("https://cluster1", "token", "default")
+        assert pool.get("https://cluster1", "token", "default") is adapter
+        assert adapter.connection_pool_maxsize == 8
+
+        assert pool.get("https://cluster1", "token", "other") is not adapter
+        assert pool.get("https://cluster1", "new_token", "default") is not adapter
+        assert pool.stats()["created"] == 3
+        assert pool.stats()["hits"] == 1
+
+    def test_bounded_size(self):
+        pool = K8SServiceAdapterPool(max_size=2, idle_seconds=60, adapter_class=FakeAdapter)
+
+        first = pool.get("https://cluster1", "token", "default")
+        second = pool.get("https://cluster2", "token", "default")
+        # first is the most recently used now
+        pool.get("https://cluster1", "token", "default")
+        pool.get("https://cluster3", "token", "default")
+
+        assert second.closed
+        assert not first.closed
+        assert pool.stats()["size"] == 2
+        assert pool.stats()["evicted"] == 1
+
+    def test_idle_eviction(self):
+        pool = K8SServiceAdapterPool(max_size=4, idle_seconds=0.1, adapter_class=FakeAdapter)
+
+        adapter = pool.get("https://cluster1", "token", "default")
+        time.sleep(0.2)
+        assert pool.evict_idle() == 1
+        assert adapter.closed
+        assert pool.get("https://cluster1", "token", "default") is not adapter
+
+        pool.clear()
+        assert pool.stats()["size"] == 0
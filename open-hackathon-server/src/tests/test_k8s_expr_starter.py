@@ -0,0 +1,257 @@
+import time
+import uuid
+import threading
+
+import yaml
+
+from hackathon import Context
+from hackathon.constants import EStatus, VEStatus, VE_PROVIDER, K8S_RESOURCE_KIND, K8S_LABEL
+from hackathon.hmongo.models import Experiment, VirtualEnvironment, K8sEnvironment, Template, K8sCluster
+from hackathon.expr import k8s_expr_starter
+from hackathon.expr.k8s_expr_starter import K8SExprStarter
+
+from tests.apitest import ApiTestCase
+
+
+class FakeAdapter(object):
+    """Stand-in of K8SServiceAdapter, records the resources created and deleted"""
+
+    def __init__(self, failures=(), delay=0.1, slow=()):
+        self.failures = failures
+        self.delay = delay
+        self.slow = slow
+        self.created = []  # (kind, name, start time, end time)
+        self.deleted = []  # (kind, name)
+        self.deleted_by_label = []  # (label, values)
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def create(self, kind, y):
+        name = y["metadata"]["name"]
+        start = time.time()
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(self.delay * (3 if name in self.slow else 1))
+            if name in self.failures:
+                raise Exception("create %s %s failed" % (kind, name))
+            with self.lock:
+                self.created.append((kind, name, start, time.time()))
+        finally:
+            with self.lock:
+                self.running -= 1
+        return y
+
+    def create_k8s_pvc(self, y):
+        return self.create(K8S_RESOURCE_KIND.PVC, y)
+
+    def create_k8s_deployment(self, y):
+        return self.create(K8S_RESOURCE_KIND.DEPLOYMENT, y)
+
+    def create_k8s_statefulset(self, y):
+        return self.create(K8S_RESOURCE_KIND.STATEFUL_SET, y)
+
+    def create_k8s_service(self, y, detail=False):
+        self.create(K8S_RESOURCE_KIND.SERVICE, y)
+        # the public port is allocated by k8s
+        return dict(y, spec={"type": "NodePort", "ports": [{"node_port": 30001}]})
+
+    def delete_k8s_pvc(self, name):
+        self.deleted.append((K8S_RESOURCE_KIND.PVC, name))
+
+    def delete_k8s_deployment(self, name):
+        self.deleted.append((K8S_RESOURCE_KIND.DEPLOYMENT, name))
+
+    def delete_k8s_statefulset(self, name):
+        self.deleted.append((K8S_RESOURCE_KIND.STATEFUL_SET, name))
+
+    def delete_k8s_service(self, name):
+        self.deleted.append((K8S_RESOURCE_KIND.SERVICE, name))
+
+    def delete_k8s_resources_by_label(self, label_key, label_values):
+        if [v for v in label_values if v in self.failures]:
+            raise Exception("delete by label failed")
+        self.deleted_by_label.append((label_key, list(label_values)))
+
+
+class FakeAdapterPool(object):
+    """Return the given adapter, or a new one per cluster namespace if not given"""
+
+    def __init__(self, adapter=None, failures=()):
+        self.adapter = adapter
+        self.failures = failures
+        self.adapters = {}
+
+    def get(self, api_url, token, namespace):
+        if self.adapter:
+            return self.adapter
+        key = (api_url, token, namespace)
+        if key not in self.adapters:
+            self.adapters[key] = FakeAdapter(failures=self.failures)
+        return self.adapters[key]
+
+
+class FakeReadinessWatcher(object):
+    def __init__(self):
+        self.watched = []
+        self.cancelled = []
+
+    def watch(self, adapter, key, deployments, stateful_sets, callback, on_timeout=None, timeout=None):
+        self.watched.append((key, deployments, stateful_sets))
+
+    def cancel(self, key):
+        self.cancelled.append(key)
+
+
+def resource(name):
+    return yaml.dump({"metadata": {"name": name}, "spec": {}})
+
+
+def new_experiment():
+    k8s_env = K8sEnvironment(name="env",
+                             persistent_volume_claims=[resource("pvc1"), resource("pvc2")],
+                             services=[resource("svc1"), resource("svc2")],
+                             deployments=[resource("d1"), resource("d2"), resource("d3")],
+                             stateful_sets=[resource("s1")])
+    experiment = Experiment(status=EStatus.INIT,
+                            virtual_environments=[VirtualEnvironment(provider=VE_PROVIDER.K8S,
+                                                                     name="env-%s" % uuid.uuid4().hex,
+                                                                     status=VEStatus.INIT,
+                                                                     k8s_resource=k8s_env)])
+    experiment.save()
+    return experiment
+
+
+def new_template(name, api_url):
+    return Template(name=name, provider=VE_PROVIDER.K8S, virtual_environment_count=1,
+                    k8s_cluster=K8sCluster(api_url=api_url, token="t")).save()
+
+
+def new_stopping_experiments(template, count):
+    experiments = [Experiment(status=EStatus.RUNNING,
+                              template=template,
+                              virtual_environments=[VirtualEnvironment(provider=VE_PROVIDER.K8S,
+                                                                       name="env-%s" % uuid.uuid4().hex,
+                                                                       status=VEStatus.RUNNING)])
+                   for i in range(count)]
+    for e in experiments:
+        e.save()
+    return experiments
+
+
+def new_starter(adapter=None, pool=None):
+    starter = K8SExprStarter()
+    starter.adapter_pool = pool or FakeAdapterPool(adapter)
+    starter.readiness_watcher = FakeReadinessWatcher()
+    return starter
+
+
+def start_context(experiment):
+    cluster = Context(api_url="https://fake-cluster", token="token", namespace="default")
+    return Context(experiment_id=experiment.id, template_content=Context(cluster_info=cluster))
+
+
+class TestK8SExprStarter(ApiTestCase):
+
+    def setup_method(self, method):
+        Experiment.objects().delete()
+        Template.objects().delete()
+
+    def test_create_concurrently(self):
+        adapter = FakeAdapter()
+        starter = new_starter(adapter)
+        experiment = new_experiment()
+
+        start = time.time()
+        starter.schedule_start_k8s_service(start_context(experiment))
+        # 2 PVCs then 6 other resources, each round takes one delay instead of one per resource
+        assert time.time() - start < adapter.delay * 5
+        assert adapter.max_running > 1
+        assert len(adapter.created) == 8
+
+        # PVCs are mounted by pods so they're created before the others start
+        pvc_done = max(end for kind, name, begin, end in adapter.created if kind == K8S_RESOURCE_KIND.PVC)
+        others_start = min(begin for kind, name, begin, end in adapter.created if kind != K8S_RESOURCE_KIND.PVC)
+        assert pvc_done <= others_start
+
+        assert starter.readiness_watcher.watched == [(str(experiment.id), ["d1", "d2", "d3"], ["s1"])]
+        experiment.reload()
+        assert experiment.status == EStatus.INIT
+        # services are overwritten with the public port allocated
+        services = [yaml.load(s) for s in experiment.virtual_environments[0].k8s_resource.services]
+        assert [s["spec"]["ports"][0]["node_port"] for s in services] == [30001, 30001]
+
+    def test_rollback(self):
+        # d2 fails at once while the slow s1 is still being created
+        adapter = FakeAdapter(failures=["d2"], slow=["s1"])
+        starter = new_starter(adapter)
+        experiment = new_experiment()
+
+        starter.schedule_start_k8s_service(start_context(experiment))
+
+        # the error is raised after all creations done, so that the slow one is rolled back as well
+        created = sorted((kind, name) for kind, name, begin, end in adapter.created)
+        assert ("statefulset", "s1") in created
+        assert ("deployment", "d2") not in created
+        assert sorted(adapter.deleted) == created
+        assert starter.readiness_watcher.watched == []
+        experiment.reload()
+        assert experiment.status == EStatus.FAILED
+
+    def test_rollback_pvc_failure(self):
+        adapter = FakeAdapter(failures=["pvc2"])
+        starter = new_starter(adapter)
+        experiment = new_experiment()
+
+        starter.schedule_start_k8s_service(start_context(experiment))
+
+        # nothing else is created once a PVC fails
+        assert [(kind, name) for kind, name, begin, end in adapter.created] == [("persistentvolumeclaim", "pvc1")]
+        assert adapter.deleted == [("persistentvolumeclaim", "pvc1")]
+        experiment.reload()
+        assert experiment.status == EStatus.FAILED
+
+    def test_teardown_in_batch(self, monkeypatch):
+        monkeypatch.setattr(k8s_expr_starter, "K8S_TEARDOWN_CHUNK_SIZE", 2)
+        pool = FakeAdapterPool()
+        starter = new_starter(pool=pool)
+        template1 = new_template("t1", "https://cluster1")
+        template2 = new_template("t2", "https://cluster2")
+        experiments1 = new_stopping_experiments(template1, 3)
+        experiments2 = new_stopping_experiments(template2, 1)
+        running = new_stopping_experiments(template1, 1)[0]
+
+        for e in experiments1 + experiments2:
+            starter.schedule_stop_k8s_service(Context(experiment_id=e.id))
+        assert starter.readiness_watcher.cancelled == [str(e.id) for e in experiments1 + experiments2]
+        assert Experiment.objects(status=EStatus.STOPPING).count() == 4
+
+        starter.schedule_teardown_k8s_services()
+
+        # one adapter per cluster, stopping experiments of a cluster are deleted by label 2 at a time
+        adapter1 = pool.adapters[("https://cluster1", "t", "default")]
+        adapter2 = pool.adapters[("https://cluster2", "t", "default")]
+        assert [(label, len(values)) for label, values in adapter1.deleted_by_label] == [(K8S_LABEL.EXPERIMENT, 2),
+                                                                                          (K8S_LABEL.EXPERIMENT, 1)]
+        assert sorted(v for label, values in adapter1.deleted_by_label for v in values) == \
+            sorted(str(e.id) for e in experiments1)
+        assert adapter2.deleted_by_label == [(K8S_LABEL.EXPERIMENT, [str(experiments2[0].id)])]
+        assert [e.id for e in Experiment.objects()] == [running.id]
+
+    def test_teardown_retried(self):
+        template = new_template("t1", "https://cluster1")
+        experiment = new_stopping_experiments(template, 1)[0]
+        pool = FakeAdapterPool(failures=[str(experiment.id)])
+        starter = new_starter(pool=pool)
+        starter.schedule_stop_k8s_service(Context(experiment_id=experiment.id))
+
+        # kept STOPPING and torn down again next time
+        starter.schedule_teardown_k8s_services()
+        assert Experiment.objects(id=experiment.id, status=EStatus.STOPPING).count() == 1
+
+        pool.adapters.clear()
+        pool.failures = []
+        starter.schedule_teardown_k8s_services()
+        assert Experiment.objects(id=experiment.id).count() == 0
@@ -0,0 +1,102 @@
+import threading
+
+from hackathon.constants import K8S_LABEL, K8S_RESOURCE_KIND
+from hackathon.hk8s.readiness_watcher import K8SReadinessWatcher
+
+
+class FakeObject(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def deployment(name, replicas, available):
+    return FakeObject(metadata=FakeObject(name=name),
+                      spec=FakeObject(replicas=replicas),
+                      status=FakeObject(replicas=replicas, available_replicas=available))
+
+
+def stateful_set(name, replicas, ready):
+    return FakeObject(metadata=FakeObject(name=name),
+                      spec=FakeObject(replicas=replicas),
+                      status=FakeObject(replicas=replicas, ready_replicas=ready))
+
+
+class FakeAdapter(object):
+    api_url = "https://fake-cluster"
+    namespace = "default"
+
+
+class FakeWatch(object):
+    """Serve watch events pushed by test, like the kubernetes watch API"""
+
+    def __init__(self):
+        self.events = {K8S_RESOURCE_KIND.DEPLOYMENT: [], K8S_RESOURCE_KIND.STATEFUL_SET: []}
+        self.condition = threading.Condition()
+        self.label_selectors = set()
+
+    def push(self, kind, event_type, obj):
+        with self.condition:
+            self.events[kind].append({"type": event_type, "object": obj})
+            self.condition.notify_all()
+
+    def stream(self, adapter, kind, label_selector, timeout_seconds):
+        self.label_selectors.add(label_selector)
+        with self.condition:
+            if not self.events[kind]:
+                self.condition.wait(timeout_seconds)
+            events, self.events[kind] = self.events[kind], []
+        for e in events:
+            yield e
+
+
+class TestK8SReadinessWatcher(object):
+
+    def test_ready(self):
+        fake = FakeWatch()
+        watcher = K8SReadinessWatcher(stream=fake.stream, stream_timeout=0.1)
+        ready = threading.Event()
+        keys = []
+
+        def callback(key):
+            keys.append(key)
+            ready.set()
+
+        watcher.watch(FakeAdapter(), "expr1", ["d1"], ["s1"], callback)
+        fake.push(K8S_RESOURCE_KIND.DEPLOYMENT, "ADDED", deployment("d1", 1, 0))
+        fake.push(K8S_RESOURCE_KIND.DEPLOYMENT, "MODIFIED", deployment("d1", 1, 1))
+        fake.push(K8S_RESOURCE_KIND.STATEFUL_SET, "ADDED", stateful_set("s1", 2, 1))
+        assert not ready.wait(0.5)
+
+        fake.push(K8S_RESOURCE_KIND.STATEFUL_SET, "MODIFIED", stateful_set("s1", 2, 2))
+        assert ready.wait(5)
+        assert keys == ["expr1"]
+        assert watcher.pending_count() == 0
+        assert fake.label_selectors == {K8S_LABEL.EXPERIMENT}
+
+    def test_many_experiments(self):
+        fake = FakeWatch()
+        watcher = K8SReadinessWatcher(stream=fake.stream, stream_timeout=0.1)
+        done = threading.Semaphore(0)
+        for i in range(200):
+            watcher.watch(FakeAdapter(), "expr%d" % i, ["d%d" % i], [], lambda key: done.release())
+
+        for i in range(200):
+            fake.push(K8S_RESOURCE_KIND.DEPLOYMENT, "ADDED", deployment("d%d" % i, 1, 1))
+
+        for i in range(200):
+            assert done.acquire(timeout=5)
+        assert watcher.pending_count() == 0
+
+    def test_timeout_and_cancel(self):
+        fake = FakeWatch()
+        watcher = K8SReadinessWatcher(stream=fake.stream, stream_timeout=0.1)
+        timed_out = threading.Event()
+
+        watcher.watch(FakeAdapter(), "expr1", ["d1"], [], lambda key: None,
+                      on_timeout=lambda key: timed_out.set(), timeout=0.2)
+        assert timed_out.wait(5)
+
+        watcher.watch(FakeAdapter(), "expr2", ["d2"], [], lambda key: None)
+        assert watcher.pending_count() == 1
+        watcher.cancel("expr2")
+        assert watcher.pending_count() == 0
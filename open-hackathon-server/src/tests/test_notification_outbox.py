@@ -0,0 +1,151 @@
+from datetime import timedelta
+
+from hackathon.util import get_now
+from hackathon.constants import NOTIFICATION_CHANNEL, NOTIFICATION_STATUS, HACK_USER_TYPE
+from hackathon.hmongo.models import Notification, Hackathon, User, UserEmail, UserHackathon
+from hackathon.notify import NotificationOutbox
+from hackathon.notify.fakes import FakeEmail, FakeSms, FakeVoiceVerify
+
+from tests.apitest import ApiTestCase
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = get_now()
+
+    def __call__(self):
+        return self.now
+
+
+def new_outbox(email=None, clock=None):
+    outbox = NotificationOutbox(email=email or FakeEmail(), sms=FakeSms(), voice_verify=FakeVoiceVerify(),
+                                clock=clock or FakeClock())
+    outbox.workers = 2
+    outbox.batch_size = 10
+    outbox.max_attempts = 3
+    return outbox
+
+
+class TestNotificationOutbox(ApiTestCase):
+
+    def setup_method(self, method):
+        Notification.objects().delete()
+
+    def test_dispatch(self):
+        email = FakeEmail()
+        outbox = new_outbox(email=email)
+        payloads = [{"sender": "a@b.com", "receivers": ["%d@b.com" % i], "subject": "s", "content": "c"}
+                    for i in range(25)]
+        assert outbox.enqueue(NOTIFICATION_CHANNEL.EMAIL, payloads) == 25
+        assert outbox.enqueue_sms("18217511111", 1, {"param1": "1849"})
+        assert outbox.enqueue_voice_verify("18217511111", "1849")
+
+        outbox.dispatch()
+
+        assert len(email.sent) == 25
+        # 3 batches, emails of a batch go through one connection per worker
+        assert email.connections == 6
+        assert len(outbox.senders[NOTIFICATION_CHANNEL.SMS].sent) == 1
+        assert len(outbox.senders[NOTIFICATION_CHANNEL.VOICE_VERIFY].sent) == 1
+        assert Notification.objects(status=NOTIFICATION_STATUS.SENT).count() == 27
+
+        # nothing left
+        outbox.dispatch()
+        assert len(email.sent) == 25
+
+    def test_dedup(self):
+        clock = FakeClock()
+        outbox = new_outbox(clock=clock)
+        assert outbox.enqueue_email("a@b.com", ["c@d.com"], "s", "c")
+        assert not outbox.enqueue_email("a@b.com", ["c@d.com"], "s", "c")
+        assert outbox.enqueue_email("a@b.com", ["c@d.com"], "s", "c", dedup_key="again")
+        assert Notification.objects().count() == 2
+
+        # the window starts from the first one, instead of a fixed bucket
+        clock.now += timedelta(seconds=outbox.dedup_seconds - 1)
+        assert not outbox.enqueue_email("a@b.com", ["c@d.com"], "s", "c")
+        clock.now += timedelta(seconds=1)
+        assert outbox.enqueue(NOTIFICATION_CHANNEL.EMAIL, [{"sender": "a@b.com", "receivers": ["c@d.com"],
+                                                            "subject": "s", "content": "c"},
+                                                           {"sender": "a@b.com", "receivers": ["e@f.com"],
+                                                            "subject": "s", "content": "c"}]) == 2
+        assert not outbox.enqueue_email("a@b.com", ["c@d.com"], "s", "c")
+        assert Notification.objects().count() == 4
+
+    def test_admins_email(self):
+        User.objects(name__startswith="test_outbox_").delete()
+        hackathon = Hackathon(name="test_outbox", display_name="outbox").save()
+        admins = [User(name="test_outbox_1", nickname="admin 1",
+                       emails=[UserEmail(email="1@a.com", primary_email=True),
+                               UserEmail(email="1@b.com", primary_email=False)]).save(),
+                  User(name="test_outbox_2", nickname="admin 2",
+                       emails=[UserEmail(email="2@b.com", primary_email=False),
+                               UserEmail(email="2@c.com", primary_email=False)]).save(),
+                  User(name="test_outbox_3", nickname="admin 3", emails=[]).save()]
+        for admin in admins:
+            UserHackathon(user=admin, hackathon=hackathon, role=HACK_USER_TYPE.ADMIN).save()
+
+        email = FakeEmail()
+        outbox = new_outbox(email=email)
+        # one notification, no lookup of admins on enqueue
+        assert outbox.enqueue_admins_email(hackathon.id, "a@b.com", "s", "c", receivers_forced=["x@y.com"])
+        assert Notification.objects().count() == 1
+
+        outbox.dispatch()
+        assert sorted(m["receivers"] for m in email.sent) == [["1@a.com"], ["2@b.com"], ["x@y.com"]]
+        assert Notification.objects(status=NOTIFICATION_STATUS.SENT).count() == 4
+
+        # expanded again by a dispatcher after a crash, nothing more is sent
+        Notification.objects(channel=NOTIFICATION_CHANNEL.ADMINS_EMAIL).update(
+            set__status=NOTIFICATION_STATUS.PENDING)
+        outbox.dispatch()
+        assert len(email.sent) == 3
+
+    def test_retry_with_backoff(self):
+        clock = FakeClock()
+        email = FakeEmail(fail_times=1)
+        outbox = new_outbox(email=email, clock=clock)
+        outbox.enqueue_email("a@b.com", ["c@d.com"], "s", "c")
+
+        outbox.dispatch()
+        notification = Notification.objects().first()
+        assert notification.status == NOTIFICATION_STATUS.PENDING
+        assert notification.attempts == 1
+
+        # not due before backoff
+        outbox.dispatch()
+        assert email.sent == []
+
+        clock.now += timedelta(seconds=outbox.backoff_seconds)
+        outbox.dispatch()
+        assert len(email.sent) == 1
+        assert Notification.objects().first().status == NOTIFICATION_STATUS.SENT
+
+    def test_give_up(self):
+        clock = FakeClock()
+        outbox = new_outbox(email=FakeEmail(fail_times=10), clock=clock)
+        outbox.enqueue_email("a@b.com", ["c@d.com"], "s", "c")
+
+        for i in range(outbox.max_attempts):
+            outbox.dispatch()
+            clock.now += timedelta(seconds=outbox.max_backoff_seconds)
+
+        notification = Notification.objects().first()
+        assert notification.status == NOTIFICATION_STATUS.FAILED
+        assert notification.attempts == outbox.max_attempts
+
+    def test_lease_expired(self):
+        clock = FakeClock()
+        email = FakeEmail()
+        outbox = new_outbox(email=email, clock=clock)
+        outbox.enqueue_email("a@b.com", ["c@d.com"], "s", "c")
+        # claimed by a dispatcher that crashed
+        Notification.objects().update(set__status=NOTIFICATION_STATUS.SENDING,
+                                      set__next_attempt_time=clock.now + timedelta(seconds=outbox.lease_seconds))
+
+        outbox.dispatch()
+        assert email.sent == []
+
+        clock.now += timedelta(seconds=outbox.lease_seconds)
+        outbox.dispatch()
+        assert len(email.sent) == 1
@@ -0,0 +1,95 @@
+import time
+from datetime import datetime, timedelta
+
+from hackathon.hmongo.models import User
+from hackathon.user.presence import TimingWheel, PresenceTracker
+
+from tests.apitest import ApiTestCase
+
+
+class FakeClock(object):
+    def __init__(self, now=1000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestTimingWheel(object):
+
+    def test_touch(self):
+        clock = FakeClock()
+        wheel = TimingWheel(slot_seconds=60, timeout_seconds=600, clock=clock)
+
+        assert wheel.touch("user1") is not None
+        # touched again in the same slot, nothing to flush
+        assert wheel.touch("user1") is None
+        clock.now += 60
+        assert wheel.touch("user1") == wheel.current_tick()
+        assert len(wheel) == 1
+
+    def test_expire(self):
+        clock = FakeClock()
+        wheel = TimingWheel(slot_seconds=60, timeout_seconds=600, clock=clock)
+
+        wheel.touch("user1")
+        wheel.touch("user2")
+        clock.now += 300
+        wheel.touch("user2")
+        assert wheel.expire() == []
+
+        clock.now += 300
+        assert wheel.expire() == ["user1"]
+        assert wheel.expire() == []
+
+        wheel.touch("user3")
+        wheel.remove("user3")
+        # not expired for several rounds of the wheel
+        clock.now += 6000
+        assert wheel.expire() == ["user2"]
+        assert len(wheel) == 0
+
+
+class TestPresenceTracker(ApiTestCase):
+
+    def setup_method(self, method):
+        User.objects(name__startswith="test_presence_").delete()
+
+    def test_advance(self):
+        clock = FakeClock(time.time())
+        now = datetime.utcfromtimestamp(clock.now)
+        tracker = PresenceTracker(slot_seconds=60, timeout_seconds=600, clock=clock)
+        user1 = User(name="test_presence_1", nickname="1").save()
+        user2 = User(name="test_presence_2", nickname="2").save()
+        # left online by a process that exited
+        dead = User(name="test_presence_dead", nickname="dead", online=True,
+                    last_active_time=now - timedelta(hours=2)).save()
+        # just logged in via another process, not active yet
+        login = User(name="test_presence_login", nickname="login", online=True, last_login_time=now).save()
+
+        tracker.touch(user1.id)
+        tracker.touch(user2.id)
+        tracker.advance()
+
+        first_tick_time = datetime.utcfromtimestamp(int(clock.now // 60) * 60)
+        for u in [user1, user2]:
+            u.reload()
+            assert u.online
+            assert u.last_active_time == first_tick_time
+        # swept on the first advance
+        assert not User.objects(id=dead.id).first().online
+        assert User.objects(id=login.id).first().online
+
+        # another process has seen user2 later, which is never moved back
+        later = first_tick_time + timedelta(minutes=20)
+        User.objects(id=user2.id).update_one(set__last_active_time=later)
+        clock.now += 60
+        tracker.touch(user2.id)
+        tracker.advance()
+        assert User.objects(id=user2.id).first().last_active_time == later
+
+        # neither is seen by this process for the timeout, but user2 is still active in another one
+        clock.now += 600
+        tracker.advance()
+        assert not User.objects(id=user1.id).first().online
+        assert User.objects(id=user2.id).first().online
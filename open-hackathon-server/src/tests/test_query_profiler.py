@@ -0,0 +1,55 @@
+from hackathon.hmongo.profiler import QueryProfiler, query_shape
+
+
+class FakeEvent(object):
+    def __init__(self, request_id, command_name, command=None, duration_micros=0, connection_id=("localhost", 27017)):
+        self.connection_id = connection_id
+        self.request_id = request_id
+        self.command_name = command_name
+        self.command = command
+        self.duration_micros = duration_micros
+
+
+class TestQueryProfiler(object):
+
+    def test_query_shape(self):
+        shape = query_shape("find", {"find": "user", "filter": {"name": "a", "age": {"$gt": 1}}, "limit": 1})
+        assert shape == "find user {'filter': {'name': '?', 'age': {'$gt': '?'}}}"
+
+    def test_profile(self):
+        profiler = QueryProfiler()
+        profiler.slow_request_queries = 1
+
+        # commands outside a request are not profiled
+        profiler.started(FakeEvent(1, "find", {"find": "user"}))
+        profiler.succeeded(FakeEvent(1, "find", duration_micros=1000))
+        assert profiler.current() is None
+
+        profiler.begin("GET", "/api/team/list")
+        profiler.set_resource("HackathonTeamListResource.get")
+        profiler.started(FakeEvent(2, "find", {"find": "team", "filter": {"hackathon": 1}}))
+        profiler.started(FakeEvent(3, "find", {"find": "user", "filter": {"_id": {"$in": [1, 2]}}}))
+        profiler.succeeded(FakeEvent(2, "find", duration_micros=1000))
+        profiler.failed(FakeEvent(3, "find", duration_micros=3000))
+        profile = profiler.end()
+
+        assert profile.count == 2
+        assert profile.total_ms == 4.0
+        assert profile.slowest_shape == "find user {'filter': {'_id': {'$in': ['?']}}}"
+
+        report = profiler.report_health()
+        assert report["resources"]["HackathonTeamListResource.get"]["queries"] == 2
+        # more queries than slow_request_queries
+        assert report["slow_requests"][0]["resource"] == "HackathonTeamListResource.get"
+
+    def test_same_request_id_of_connections(self):
+        profiler = QueryProfiler()
+        profiler.begin("GET", "/api/team/list")
+        profiler.started(FakeEvent(1, "find", {"find": "team"}, connection_id=("host1", 27017)))
+        profiler.started(FakeEvent(1, "find", {"find": "user"}, connection_id=("host2", 27017)))
+        profiler.succeeded(FakeEvent(1, "find", duration_micros=1000, connection_id=("host1", 27017)))
+        profiler.succeeded(FakeEvent(1, "find", duration_micros=2000, connection_id=("host2", 27017)))
+
+        profile = profiler.end()
+        assert profile.count == 2
+        assert profile.slowest_shape == "find user {}"
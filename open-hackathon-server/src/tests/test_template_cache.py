@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+from hackathon.template.template_cache import TemplateContentCache, CONTENT_OVERHEAD_BYTES
+
+
+class FakeTemplate(object):
+    def __init__(self, id, content="", update_time=datetime(2020, 1, 1)):
+        self.id = id
+        self.content = content
+        self.docker_image = None
+        self.update_time = update_time
+
+
+class Loader(object):
+    def __init__(self):
+        self.loaded = []
+
+    def __call__(self, template):
+        self.loaded.append(template.id)
+        return object()
+
+
+class TestTemplateContentCache(object):
+
+    def test_warm_requests_load_nothing(self):
+        cache = TemplateContentCache(max_bytes=1024 * 1024)
+        load = Loader()
+        templates = [FakeTemplate(i) for i in range(10)]
+
+        contents = [cache.get(t, load) for t in templates]
+        assert [cache.get(t, load) for t in templates] == contents
+        assert load.loaded == list(range(10))
+        assert cache.stats()["hits"] == 10
+        assert cache.stats()["hit_rate"] == 0.5
+
+    def test_updated_template_reloaded(self):
+        cache = TemplateContentCache(max_bytes=1024 * 1024)
+        load = Loader()
+        template = FakeTemplate(1)
+        old = cache.get(template, load)
+
+        template.update_time += timedelta(seconds=1)
+        assert cache.get(template, load) is not old
+        assert cache.get(template, load) is cache.get(template, load)
+
+        cache.invalidate(1)
+        assert cache.stats()["size"] == 0
+
+    def test_bounded_by_bytes(self):
+        cache = TemplateContentCache(max_bytes=3 * CONTENT_OVERHEAD_BYTES + 300)
+        load = Loader()
+        for i in range(5):
+            cache.get(FakeTemplate(i, content="x" * 100), load)
+
+        assert cache.stats()["size"] == 3
+        assert cache.stats()["bytes"] <= 3 * CONTENT_OVERHEAD_BYTES + 300
+        # the least recently used are evicted
+        cache.get(FakeTemplate(4, content="x" * 100), load)
+        cache.get(FakeTemplate(0, content="x" * 100), load)
+        assert load.loaded == [0, 1, 2, 3, 4, 0]
+
+        # too large to cache at all
+        huge = FakeTemplate(9, content="x" * 10000)
+        cache.get(huge, load)
+        cache.get(huge, load)
+        assert load.loaded[-2:] == [9, 9]
@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from hackathon.util import get_now
+from hackathon.cache.token_cache import TokenCache
+
+
+class FakeUser(object):
+    def __init__(self, id):
+        self.id = id
+
+    def to_mongo(self):
+        return {"_id": self.id}
+
+
+class TestTokenCache(object):
+
+    def test_invalidate_user(self):
+        cache = TokenCache(max_size=10, ttl_seconds=60)
+        expire_date = get_now() + timedelta(hours=1)
+        cache.set("a1", FakeUser("a"), expire_date)
+        cache.set("a2", FakeUser("a"), expire_date)
+        cache.set("b1", FakeUser("b"), expire_date)
+
+        cache.invalidate_user("a")
+        assert cache.stats()["size"] == 1
+
+        cache.invalidate("b1")
+        cache.invalidate_user("b")
+        assert cache.stats()["size"] == 0
+
+    def test_index_rebuilt(self):
+        cache = TokenCache(max_size=2, ttl_seconds=60)
+        expire_date = get_now() + timedelta(hours=1)
+        # older users are evicted by the TTLCache while their tokens are still indexed
+        for i in range(10):
+            cache.set("t%d" % i, FakeUser(i), expire_date)
+        assert cache.stats()["size"] == 2
+
+        cache.invalidate_user(0)
+        cache.invalidate_user(9)
+        assert cache.stats()["size"] == 1
+        cache.invalidate_user(8)
+        assert cache.stats()["size"] == 0
@@ -0,0 +1,92 @@
+from hackathon.constants import HACKATHON_CONFIG, EStatus
+from hackathon.hmongo.models import Hackathon, Template, Experiment, User
+from hackathon.expr.warm_pool import WarmPoolController
+
+from tests.apitest import ApiTestCase
+
+
+class FakeExprManager(object):
+    """Stand-in of ExprManager, pre-allocated experiments are saved as starting at once"""
+
+    def __init__(self):
+        self.started = {}
+
+    def start_pre_alloc_exprs(self, user, template_name, hackathon_name, pre_alloc_num):
+        hackathon = Hackathon.objects(name=hackathon_name).first()
+        template = Template.objects(name=template_name).first()
+        for i in range(pre_alloc_num):
+            Experiment(status=EStatus.STARTING, hackathon=hackathon, template=template).save()
+        self.started[template_name] = self.started.get(template_name, 0) + pre_alloc_num
+
+
+class TestWarmPoolController(object):
+
+    def test_target(self):
+        warm_pool = WarmPoolController()
+        hackathon = Hackathon(name="test_warm_pool", config={HACKATHON_CONFIG.PRE_ALLOCATE_NUMBER: 2})
+
+        # no claims recently, keep the configured number
+        assert warm_pool.get_target(hackathon, 0) == 2
+        # 60 claims in the 600 seconds window, 30 expected in the 300 seconds before refilled
+        assert warm_pool.get_target(hackathon, 60) == 30
+        # capped by max_target
+        assert warm_pool.get_target(hackathon, 10000) == 50
+
+    def test_metrics(self):
+        warm_pool = WarmPoolController()
+        hackathon = Hackathon(name="test_warm_pool")
+        template = Template(name="test_template")
+
+        warm_pool.record_claim(hackathon, template, 0.002)
+        warm_pool.record_claim(hackathon, template, 0.004)
+        warm_pool.record_miss(hackathon, template)
+
+        metrics = warm_pool.stats()["test_warm_pool/test_template"]
+        assert metrics["hits"] == 2
+        assert metrics["misses"] == 1
+        assert abs(metrics["miss_rate"] - 1.0 / 3) < 1e-6
+        assert abs(metrics["avg_claim_latency_ms"] - 3.0) < 1e-6
+
+
+class TestWarmPoolRefill(ApiTestCase):
+
+    def setup_method(self, method):
+        Experiment.objects().delete()
+        Hackathon.objects().delete()
+        Template.objects().delete()
+
+    def test_refill_under_budget(self):
+        templates = [Template(name="test_refill_%d" % i, virtual_environment_count=1).save() for i in range(3)]
+        hackathon = Hackathon(name="test_refill",
+                              display_name="test refill",
+                              templates=templates,
+                              config={HACKATHON_CONFIG.PRE_ALLOCATE_NUMBER: 3,
+                                      HACKATHON_CONFIG.PRE_ALLOCATE_CONCURRENT: 4}).save()
+        Experiment(status=EStatus.RUNNING, hackathon=hackathon, template=templates[0]).save()
+        Experiment(status=EStatus.STARTING, hackathon=hackathon, template=templates[1]).save()
+        # claimed by a user, not in the pool
+        user = User(name="test_refill", nickname="test_refill").save()
+        Experiment(status=EStatus.RUNNING, hackathon=hackathon, template=templates[2], user=user).save()
+
+        warm_pool = WarmPoolController()
+        expr_manager = FakeExprManager()
+        warm_pool.expr_manager = expr_manager
+
+        # 1 of 4 concurrent starts is taken, the other 3 are shared round-robin
+        warm_pool.refill(hackathon.id)
+        assert expr_manager.started == {"test_refill_0": 1, "test_refill_1": 1, "test_refill_2": 1}
+
+        # the budget is used up till those started
+        warm_pool.refill(hackathon.id)
+        assert sum(expr_manager.started.values()) == 3
+
+        Experiment.objects(status=EStatus.STARTING).update(set__status=EStatus.RUNNING)
+        expr_manager.started = {}
+        # 2, 2 and 1 ready of 3
+        warm_pool.refill(hackathon.id)
+        assert expr_manager.started == {"test_refill_0": 1, "test_refill_1": 1, "test_refill_2": 2}
+        assert Experiment.objects(hackathon=hackathon, user=None).count() == 2 + 3 + 4
+
+        metrics = warm_pool.stats()["test_refill/test_refill_2"]
+        assert metrics["target"] == 3
+        assert metrics["ready"] == 1